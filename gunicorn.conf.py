@@ -0,0 +1,31 @@
+import os
+
+from prometheus_client import multiprocess
+
+wsgi_app = "social_media_api.wsgi:application"
+
+
+def child_exit(server, worker):
+    """Drop live gauges of dead workers from the shared metrics dir"""
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_starting(server):
+    """Write the OpenAPI schema of this code version once, before the
+    workers start"""
+    os.environ.setdefault(
+        "DJANGO_SETTINGS_MODULE", "social_media_api.settings.prod"
+    )
+    import django
+
+    django.setup()
+    from social_media import schema
+
+    schema.warm()
+
+
+def post_worker_init(worker):
+    """Load the schema into memory before serving requests"""
+    from social_media import schema
+
+    schema.preload()
@@ -1,9 +1,162 @@
+import json
+
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from django.utils.translation import gettext as _
 
 from .models import User, ScheduledPost, Post, Hashtag, Comment, Like
 
+# Keyset cursor of the changelists, the primary key the page starts below
+BEFORE_VAR = "before"
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that takes the planner's row estimate as the count on
+    Postgres when it is above ADMIN_EXACT_COUNT_LIMIT, counting millions
+    of rows for the "N posts" line is what times the changelist out"""
+
+    estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == "postgresql":
+            plan = json.loads(queryset.order_by().explain(format="json"))
+            rows = plan[0]["Plan"]["Plan Rows"]
+            if rows > settings.ADMIN_EXACT_COUNT_LIMIT:
+                self.estimated = True
+                return rows
+        return super().count
+
+
+class KeysetChangeList(ChangeList):
+    """ChangeList that pages newest first with ?before=<pk> instead of an
+    OFFSET when it is sorted by the default -id ordering. Other orderings
+    and "Show all" fall back to numbered pages."""
+
+    keyset = False
+    older_query_string = None
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(BEFORE_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Filter and sort links start again from the newest rows
+        return super().get_query_string(
+            new_params, [*(remove or []), BEFORE_VAR]
+        )
+
+    def get_results(self, request):
+        if (
+            self.show_all
+            or self.list_editable
+            or self.get_ordering(request, self.root_queryset.order_by())
+            != [f"-{self.lookup_opts.pk.attname}"]
+        ):
+            return super().get_results(request)
+
+        queryset = self.queryset
+        if BEFORE_VAR in self.params:
+            try:
+                before = int(self.params[BEFORE_VAR])
+            except ValueError as error:
+                raise IncorrectLookupParameters(error) from error
+            queryset = queryset.filter(pk__lt=before)
+        rows = list(queryset[:self.list_per_page + 1])
+
+        self.keyset = True
+        self.paginator = self.model_admin.get_paginator(
+            request, self.queryset, self.list_per_page
+        )
+        self.result_count = self.paginator.count
+        self.result_list = rows[:self.list_per_page]
+        if len(rows) > self.list_per_page:
+            self.older_query_string = self.get_query_string(
+                {BEFORE_VAR: self.result_list[-1].pk}
+            )
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = False
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """Foreign key filter with the admin autocomplete widget. The related
+    admin needs search_fields, only the selected object is fetched where
+    RelatedFieldListFilter lists every row of the related table."""
+
+    template = "admin/social_media/autocomplete_filter.html"
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        self.lookup_kwarg = f"{field_path}__{field.target_field.name}__exact"
+        super().__init__(
+            field, request, params, model, model_admin, field_path
+        )
+        self.form_field = forms.ModelChoiceField(
+            queryset=model_admin.admin_site._registry[
+                field.remote_field.model
+            ].get_queryset(request),
+            required=False,
+            widget=AutocompleteSelect(
+                field,
+                model_admin.admin_site,
+                attrs={
+                    "data-filter-parameter": self.lookup_kwarg,
+                    "style": "width: 100%",
+                },
+            ),
+        )
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        value = self.used_parameters.get(self.lookup_kwarg)
+        yield {
+            "selected": value is not None,
+            "query_string": changelist.get_query_string(
+                remove=[self.lookup_kwarg]
+            ),
+            "display": self.form_field.widget.render(
+                self.lookup_kwarg, value
+            ),
+        }
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist for tables with millions of rows: keyset pages, no
+    unfiltered count, estimated filtered count and autocomplete filters"""
+
+    ordering = ("-id",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    @property
+    def media(self):
+        return (
+            super().media
+            + AutocompleteSelect(None, self.admin_site).media
+            + forms.Media(js=["social_media/admin/autocomplete_filter.js"])
+        )
+
 
 @admin.register(User)
 class UserAdmin(DjangoUserAdmin):
@@ -29,28 +182,49 @@ class UserAdmin(DjangoUserAdmin):
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(LargeTableAdmin):
     list_display = ("title", "author", "created_at")
     search_fields = ("title",)
-    list_filter = ("author",)
+    list_filter = (("author", AutocompleteFilter),)
+    list_select_related = ("author",)
+    autocomplete_fields = ("author", "hashtags")
+
+    def get_queryset(self, request):
+        # __str__ of the autocomplete results reads the author
+        return super().get_queryset(request).select_related("author")
 
 
 @admin.register(ScheduledPost)
-class ScheduledPostAdmin(admin.ModelAdmin):
+class ScheduledPostAdmin(LargeTableAdmin):
     list_display = ("title", "author", "created_at")
     search_fields = ("title",)
-    list_filter = ("author",)
+    list_filter = (("author", AutocompleteFilter),)
+    list_select_related = ("author",)
+    autocomplete_fields = ("author", "hashtags")
 
 
 @admin.register(Like)
-class LikeAdmin(admin.ModelAdmin):
+class LikeAdmin(LargeTableAdmin):
     list_display = ("liker", "post")
+    list_filter = (
+        ("liker", AutocompleteFilter),
+        ("post", AutocompleteFilter),
+    )
+    list_select_related = ("liker", "post__author")
+    autocomplete_fields = ("liker", "post")
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = ("author", "post", "created_at")
-    list_filter = ("post",)
+    list_filter = (
+        ("author", AutocompleteFilter),
+        ("post", AutocompleteFilter),
+    )
+    list_select_related = ("author", "post__author")
+    autocomplete_fields = ("author", "post")
 
 
-admin.site.register(Hashtag)
+@admin.register(Hashtag)
+class HashtagAdmin(admin.ModelAdmin):
+    search_fields = ("name",)
@@ -0,0 +1,326 @@
+"""Async versions of the hot endpoints for ASGI deployments.
+
+They return the same payloads as the DRF views in views.py but never
+block a thread while waiting for the database, so one worker can
+multiplex many concurrent requests.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef, Prefetch, Q
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import exceptions, status
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import events, outbox
+from .models import Post, Like, Comment
+from .queries import (
+    hashtag_names,
+    relationship_filters,
+    with_post_counts
+)
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M"
+
+jwt_authentication = JWTAuthentication()
+
+
+async def authenticate(request, raw_token=None):
+    """Async counterpart of JWTAuthentication.authenticate.
+    Token validation is CPU only, the user is loaded with the async ORM."""
+    if raw_token is None:
+        header = jwt_authentication.get_header(request)
+        if header is None:
+            return None
+        raw_token = jwt_authentication.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+    validated_token = jwt_authentication.get_validated_token(raw_token)
+    try:
+        user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise exceptions.AuthenticationFailed(
+            "Token contained no recognizable user identification"
+        )
+
+    try:
+        user = await get_user_model().objects.aget(
+            **{jwt_settings.USER_ID_FIELD: user_id}
+        )
+    except get_user_model().DoesNotExist:
+        raise exceptions.AuthenticationFailed("User not found")
+
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed("User is inactive")
+    return user
+
+
+def check_throttles(request):
+    """The throttles of the DRF views, with the same rates, THROTTLE_COSTS
+    and state. Raises Throttled like APIView.check_throttles."""
+    durations = [
+        throttle.wait()
+        for throttle in APIView().get_throttles()
+        if not throttle.allow_request(request, None)
+    ]
+    if durations:
+        raise exceptions.Throttled(max(
+            (duration for duration in durations if duration is not None),
+            default=None
+        ))
+
+
+def error_response(error):
+    response = JsonResponse(
+        {"detail": str(error.detail)}, status=error.status_code
+    )
+    if getattr(error, "wait", None):
+        response["Retry-After"] = str(error.wait)
+    return response
+
+
+def async_api_view(methods, query_token=False):
+    """Method check, JWT authentication and throttling for async function
+    views. Like DRF views they are exempt from CSRF, authentication is
+    done with a bearer token, or the access_token query parameter with
+    query_token for clients that cannot set headers (EventSource)."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return JsonResponse(
+                    {"detail": f'Method "{request.method}" not allowed.'},
+                    status=status.HTTP_405_METHOD_NOT_ALLOWED
+                )
+            try:
+                user = await authenticate(
+                    request, request.GET.get("access_token")
+                    if query_token else None
+                )
+            except exceptions.APIException as error:
+                return error_response(error)
+            if user is None:
+                return JsonResponse(
+                    {"detail": "Authentication credentials "
+                               "were not provided."},
+                    status=status.HTTP_401_UNAUTHORIZED
+                )
+
+            request.user = user
+            try:
+                # Redis round trip of the GCRA throttle
+                await sync_to_async(check_throttles)(request)
+            except exceptions.Throttled as error:
+                return error_response(error)
+            return await view(request, *args, **kwargs)
+
+        # csrf_exempt() wraps views synchronously, so mark it directly
+        wrapper.csrf_exempt = True
+        return wrapper
+
+    return decorator
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return JsonResponse(
+        data,
+        status=status_code,
+        safe=False,
+        json_dumps_params={"ensure_ascii": False}
+    )
+
+
+def format_datetime(value):
+    return timezone.localtime(value).strftime(DATETIME_FORMAT)
+
+
+def image_url(request, image):
+    if not image:
+        return None
+    return request.build_absolute_uri(image.url)
+
+
+def feed_queryset(user, query_params):
+    """Same filtering as PostViewSet.get_queryset, with counts annotated
+    so that the feed is served with a constant number of queries"""
+    queryset = Post.objects.filter(
+        Q(author=user) | Q(author__in=user.followings.all())
+    )
+
+    hashtag = query_params.get("hashtag")
+    title = query_params.get("title")
+
+    if hashtag:
+        queryset = queryset.filter(hashtags__name__icontains=hashtag)
+
+    if title:
+        queryset = queryset.filter(title__icontains=title)
+
+    return with_post_counts(
+        queryset.select_related("author").prefetch_related(hashtag_names())
+    ).annotate(
+        is_liked=Exists(
+            Like.objects.filter(liker=user, post_id=OuterRef("pk"))
+        )
+    )
+
+
+@async_api_view(["GET"])
+async def post_list(request):
+    """Async version of PostViewSet.list"""
+    posts = feed_queryset(request.user, request.GET)
+    data = [
+        {
+            "id": post.id,
+            "title": post.title,
+            "author": post.author.username,
+            "image": image_url(request, post.image),
+            "hashtags": [hashtag.name for hashtag in post.hashtags.all()],
+            "likes": post.likes_count,
+            "comments": post.comments_count,
+            "is_liked": post.is_liked,
+        }
+        async for post in posts
+    ]
+    return json_response(data)
+
+
+@async_api_view(["GET"])
+async def post_detail(request, pk):
+    """Async version of PostViewSet.retrieve"""
+    posts = feed_queryset(request.user, request.GET).prefetch_related(
+        Prefetch(
+            "comments",
+            queryset=Comment.objects.select_related("author")
+        )
+    )
+    post = await posts.filter(pk=pk).afirst()
+    if post is None:
+        return json_response(
+            {"detail": "Not found."}, status.HTTP_404_NOT_FOUND
+        )
+
+    author = post.author
+    relationship = relationship_filters(request.user, author)
+    data = {
+        "id": post.id,
+        "title": post.title,
+        "content": post.content,
+        "author": {
+            "id": author.id,
+            "username": author.username,
+            "email": author.email,
+            "first_name": author.first_name,
+            "last_name": author.last_name,
+            "image": image_url(request, author.image),
+            "posts": await author.posts.acount(),
+            "followers": await author.followers.acount(),
+            "followings": await author.followings.acount(),
+            "is_following": await relationship["is_following"].aexists(),
+            "follows_you": await relationship["follows_you"].aexists(),
+        },
+        "image": image_url(request, post.image),
+        "hashtags": [hashtag.name for hashtag in post.hashtags.all()],
+        "created_at": format_datetime(post.created_at),
+        "likes": post.likes_count,
+        "comments": [
+            {
+                "id": comment.id,
+                "author": comment.author.username,
+                "content": comment.content,
+                "created_at": format_datetime(comment.created_at),
+            }
+            for comment in post.comments.all()
+        ],
+    }
+    return json_response(data)
+
+
+@async_api_view(["POST"])
+async def like_unlike(request, pk):
+    """Async version of views.like_unlike"""
+    post = await Post.objects.filter(pk=pk).afirst()
+    if post is None:
+        return json_response(
+            {"detail": "Not found."}, status.HTTP_404_NOT_FOUND
+        )
+
+    if await sync_to_async(outbox.unlike)(request.user, post):
+        return json_response(
+            {"message": "You remove like from this post"},
+            status.HTTP_204_NO_CONTENT
+        )
+
+    await sync_to_async(outbox.like)(request.user, post)
+    return json_response(
+        {"message": "You liked this post"}, status.HTTP_201_CREATED
+    )
+
+
+@async_api_view(["POST"])
+async def follow_unfollow(request, pk):
+    """Async version of views.follow_unfollow"""
+    try:
+        user_to_follow = await get_user_model().objects.aget(pk=pk)
+    except get_user_model().DoesNotExist:
+        return json_response(
+            {"detail": "Not found."}, status.HTTP_404_NOT_FOUND
+        )
+    current_user = request.user
+
+    if await user_to_follow.followers.filter(pk=current_user.pk).aexists():
+        await sync_to_async(outbox.unfollow)(current_user, user_to_follow)
+        return json_response(
+            {"message": f"You are not following "
+                        f"{user_to_follow.username} anymore"}
+        )
+
+    await sync_to_async(outbox.follow)(current_user, user_to_follow)
+    return json_response(
+        {"message": f"You are following {user_to_follow.username}"}
+    )
+
+
+def parse_ids(value) -> list:
+    return [int(item) for item in value.split(",") if item.isdigit()]
+
+
+@async_api_view(["GET"], query_token=True)
+async def event_stream(request):
+    """Server-sent events: new posts of the feed, likes and comments on
+    posts of the user and new comments of the posts given in ?posts="""
+    user = request.user
+    channels = [f"posts:{user.id}", f"user:{user.id}"]
+    channels += [
+        f"posts:{pk}"
+        async for pk in user.followings.values_list("id", flat=True)
+    ]
+    channels += [
+        f"post:{pk}"
+        for pk in parse_ids(request.GET.get("posts", ""))[
+            :settings.EVENTS_MAX_POSTS
+        ]
+    ]
+
+    last_event_id = (
+        request.headers.get("Last-Event-ID")
+        or request.GET.get("last_event_id", "")
+    )
+    response = StreamingHttpResponse(
+        events.event_stream(
+            channels,
+            int(last_event_id) if last_event_id.isdigit() else None
+        ),
+        content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
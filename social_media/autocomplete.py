@@ -0,0 +1,150 @@
+"""Hashtag prefix autocomplete served from process memory.
+
+Names are kept sorted, so the hashtags starting with a prefix are one
+bisected slice. The top completions of short prefixes, whose slices are
+long, are cached until a hashtag with that prefix is added. Hashtags
+created in other processes are picked up by id every
+AUTOCOMPLETE_REFRESH_SECONDS, the last REFRESH_OVERLAP ids are read
+again for transactions that committed out of id order. Post counts,
+which order the completions, are reloaded every
+AUTOCOMPLETE_REBUILD_SECONDS by a background thread while requests keep
+using the previous index.
+"""
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Hashtag
+from .queries import with_hashtag_counts
+
+logger = logging.getLogger(__name__)
+
+# "#" and up to 3 letters
+CACHED_PREFIX_LENGTH = 4
+# Ids below the highest loaded one that are read again on refresh
+REFRESH_OVERLAP = 1000
+
+
+class HashtagIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Held while a rebuild runs, so that only one runs at a time
+        self.rebuild_lock = threading.Lock()
+        self.names = []
+        self.hashtags = {}
+        self.top = {}
+        self.last_id = 0
+        self.built_at = None
+        self.refreshed_at = None
+
+    def rebuild(self):
+        rows = with_hashtag_counts(Hashtag.objects.all()).values_list(
+            "id", "name", "posts_count"
+        )
+        hashtags = {name: (pk, posts) for pk, name, posts in rows}
+        with self.lock:
+            self.hashtags = hashtags
+            self.names = sorted(hashtags)
+            self.top = {}
+            self.last_id = max(
+                (pk for pk, _ in hashtags.values()), default=0
+            )
+            self.built_at = self.refreshed_at = time.monotonic()
+
+    def refresh(self):
+        """Add hashtags created since the last load, in any process"""
+        rows = Hashtag.objects.filter(
+            id__gt=self.last_id - REFRESH_OVERLAP
+        ).values_list("id", "name")
+        for pk, name in rows:
+            self.add(pk, name)
+            # Only ids read from the database, a hashtag added by this
+            # process may be newer than one still being committed
+            self.last_id = max(self.last_id, pk)
+        self.refreshed_at = time.monotonic()
+
+    def add(self, pk, name, posts=0):
+        with self.lock:
+            if name in self.hashtags:
+                return
+            insort(self.names, name)
+            for length in range(1, CACHED_PREFIX_LENGTH + 1):
+                self.top.pop(name[:length], None)
+            self.hashtags[name] = (pk, posts)
+
+    def rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception("Hashtag index rebuild failed")
+            # Retried after another AUTOCOMPLETE_REBUILD_SECONDS
+            self.built_at = time.monotonic()
+        finally:
+            # The database connection of this thread
+            connection.close()
+            self.rebuild_lock.release()
+
+    def ensure_fresh(self):
+        if self.built_at is None:
+            # Nothing to serve yet, concurrent first requests wait for
+            # a single build
+            with self.rebuild_lock:
+                if self.built_at is None:
+                    self.rebuild()
+            return
+
+        now = time.monotonic()
+        if (
+            now - self.built_at > settings.AUTOCOMPLETE_REBUILD_SECONDS
+            and self.rebuild_lock.acquire(blocking=False)
+        ):
+            threading.Thread(
+                target=self.rebuild_in_background,
+                name="hashtag-index-rebuild",
+                daemon=True,
+            ).start()
+        if now - self.refreshed_at > settings.AUTOCOMPLETE_REFRESH_SECONDS:
+            self.refresh()
+
+    def complete(self, prefix, limit) -> list:
+        """(id, name, posts) of the most used hashtags starting with
+        the prefix, at most AUTOCOMPLETE_MAX_RESULTS of them"""
+        with self.lock:
+            top = self.top.get(prefix)
+            if top is None:
+                start = bisect_left(self.names, prefix)
+                end = bisect_left(self.names, prefix + "\uffff", start)
+                top = heapq.nlargest(
+                    settings.AUTOCOMPLETE_MAX_RESULTS,
+                    self.names[start:end],
+                    key=lambda name: (self.hashtags[name][1], -len(name)),
+                )
+                if len(prefix) <= CACHED_PREFIX_LENGTH:
+                    self.top[prefix] = top
+            return [
+                (self.hashtags[name][0], name, self.hashtags[name][1])
+                for name in top[:limit]
+            ]
+
+
+index = HashtagIndex()
+
+
+@receiver(post_save, sender=Hashtag)
+def add_to_index(sender, instance, created, **kwargs):
+    if created and index.built_at is not None:
+        transaction.on_commit(
+            lambda: index.add(instance.pk, instance.name)
+        )
+
+
+def complete(prefix, limit) -> list:
+    index.ensure_fresh()
+    return index.complete(prefix, limit)
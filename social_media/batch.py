@@ -0,0 +1,177 @@
+"""Sub-requests of POST /api/batch/.
+
+Every sub-request is resolved against the API URLconf and handed to its
+view directly, without another pass through the middleware. The user
+authenticated for the batch is forced on each sub-request, and the
+batch is throttled once for the summed cost of its sub-requests.
+
+The batch itself is a POST, but its safe sub-requests still read from
+replicas unless the user is pinned to the primary, and only successful
+writes among the sub-requests pin the user. Sequential sub-requests
+after a write read from the primary.
+"""
+import contextvars
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+from .db_router import recheck, replica_reads
+from .middleware import SAFE_METHODS, pin_key
+
+logger = logging.getLogger(__name__)
+
+API_NAMESPACE = "social_media"
+
+# Per-request META that must not leak from the batch into sub-requests
+REQUEST_ONLY_META = (
+    "wsgi.input", "CONTENT_LENGTH", "CONTENT_TYPE", "QUERY_STRING",
+    "PATH_INFO", "REQUEST_METHOD",
+)
+
+
+class SubRequestError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def resolve_api_path(path):
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        raise SubRequestError(404, "Not found.")
+    if match.namespace != API_NAMESPACE or match.url_name == "batch":
+        raise SubRequestError(400, "Only API endpoints can be batched")
+    return match
+
+
+def batch_cost(items) -> int:
+    """Throttle cost of a batch, sub-requests weighted like on their own"""
+    cost = 0
+    for item in items:
+        try:
+            view_name = resolve_api_path(item["path"]).view_name
+        except SubRequestError:
+            view_name = None
+        cost += settings.THROTTLE_COSTS.get(view_name, 1)
+    return cost
+
+
+def build_request(parent, item):
+    url = urlsplit(item["path"])
+    body = b""
+    environ = {
+        key: value for key, value in parent.META.items()
+        if key not in REQUEST_ONLY_META
+    }
+    if "body" in item:
+        body = json.dumps(item["body"]).encode()
+        environ["CONTENT_TYPE"] = "application/json"
+    environ.update({
+        "REQUEST_METHOD": item["method"],
+        "PATH_INFO": url.path,
+        "QUERY_STRING": url.query,
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": io.BytesIO(body),
+    })
+    request = WSGIRequest(environ)
+    request.batched = True
+    # Read by DRF's Request instead of authenticating again
+    request._force_auth_user = parent.user
+    request._force_auth_token = parent.auth
+    return request
+
+
+def call(parent, item, match):
+    request = build_request(parent, item)
+    request.resolver_match = match
+    view = match.func
+    if iscoroutinefunction(view):
+        view = async_to_sync(view)
+    try:
+        response = view(request, *match.args, **match.kwargs)
+    except Exception:
+        logger.exception(f"Batched {item['method']} {item['path']} failed")
+        return 500, {"detail": "Server error."}
+
+    if response.streaming:
+        return 400, {"detail": "Streaming endpoints cannot be batched"}
+    if hasattr(response, "render"):
+        response.render()
+    if not response.content:
+        return response.status_code, None
+    if response.get("Content-Type", "").startswith("application/json"):
+        return response.status_code, json.loads(response.content)
+    return response.status_code, response.content.decode(errors="replace")
+
+
+def run(parent, item, replicas=False):
+    """(status, body) of one sub-request, a safe one reads from replicas
+    if `replicas` is set"""
+    try:
+        match = resolve_api_path(item["path"])
+    except SubRequestError as error:
+        return error.status, {"detail": error.detail}
+
+    with replica_reads(replicas and item["method"] in SAFE_METHODS) as used:
+        status, body = call(parent, item, match)
+    if status >= 500 and recheck(used):
+        status, body = call(parent, item, match)
+    return status, body
+
+
+def wrote(item, status) -> bool:
+    return item["method"] not in SAFE_METHODS and status < 400
+
+
+def batch_wrote(items, results) -> bool:
+    """Whether the batch pins the user to the primary"""
+    return any(
+        wrote(item, status) for item, (status, _) in zip(items, results)
+    )
+
+
+def run_in_thread(context, parent, item, replicas):
+    try:
+        return context.run(run, parent, item, replicas)
+    finally:
+        # Every worker thread opens its own database connections
+        connections.close_all()
+
+
+def run_batch(parent, items, parallel=False):
+    """(status, body) for every item, in order. Parallel sub-requests
+    run in threads with a copy of the batch context, so request-scoped
+    context variables (replica routing, metrics) still apply"""
+    replicas = not cache.get(pin_key(parent.user.pk))
+    if not parallel or len(items) < 2:
+        results = []
+        for item in items:
+            results.append(run(parent, item, replicas))
+            if wrote(item, results[-1][0]):
+                replicas = False
+        return results
+
+    workers = min(len(items), settings.BATCH_MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                run_in_thread,
+                contextvars.copy_context(),
+                parent,
+                item,
+                replicas,
+            )
+            for item in items
+        ]
+        return [future.result() for future in futures]
@@ -0,0 +1,82 @@
+"""Bulk creation of posts and scheduled posts.
+
+Hashtags of all posts are collected and normalized in memory first, then
+upserted with one INSERT ... ON CONFLICT per batch against the unique
+hashtag name. Posts and their hashtag rows are bulk inserted after that,
+so the number of statements does not depend on the number of posts.
+New posts are published to the real-time events in one batch as well.
+"""
+import re
+
+from django.db import connection, transaction
+
+from . import sync
+from .events import post_event, publish_on_commit
+from .models import Hashtag, Post, normalize_hashtag
+
+BATCH_SIZE = 1_000
+HASHTAG_PATTERN = re.compile(r"#(\w+)")
+
+
+def extract_hashtags(item) -> set:
+    """Normalized names given in `hashtags` and written in the content"""
+    names = set(item.get("hashtags", ()))
+    names.update(HASHTAG_PATTERN.findall(item["content"]))
+    max_length = Hashtag._meta.get_field("name").max_length
+    normalized = {normalize_hashtag(name) for name in names}
+    # "#" alone is an empty name
+    return {name for name in normalized if 1 < len(name) <= max_length}
+
+
+def upsert_hashtags(names) -> dict:
+    """Name -> id for all names, creating the missing hashtags"""
+    names = sorted(names)
+    table = connection.ops.quote_name(Hashtag._meta.db_table)
+    ids = {}
+    with connection.cursor() as cursor:
+        for start in range(0, len(names), BATCH_SIZE):
+            batch = names[start:start + BATCH_SIZE]
+            # The no-op update makes RETURNING include existing rows
+            cursor.execute(
+                f"INSERT INTO {table} (name) "
+                f"VALUES {', '.join(['(%s)'] * len(batch))} "
+                f"ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name "
+                f"RETURNING id, name",
+                batch,
+            )
+            ids.update((name, pk) for pk, name in cursor.fetchall())
+    return ids
+
+
+def create_posts(model, author, items) -> list:
+    """Create `model` (Post or ScheduledPost) instances from validated
+    items, returns them with their primary keys"""
+    hashtags = [extract_hashtags(item) for item in items]
+    with transaction.atomic():
+        hashtag_ids = upsert_hashtags(set().union(*hashtags))
+        posts = model.objects.bulk_create(
+            (
+                model(
+                    author=author,
+                    **{key: value for key, value in item.items()
+                       if key != "hashtags"}
+                )
+                for item in items
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        through = model.hashtags.through
+        owner = f"{model._meta.model_name}_id"
+        through.objects.bulk_create(
+            (
+                through(**{owner: post.pk, "hashtag_id": hashtag_ids[name]})
+                for post, names in zip(posts, hashtags)
+                for name in names
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        # bulk_create() sends no post_save
+        if model is Post:
+            sync.track_posts(posts)
+            publish_on_commit([post_event(post) for post in posts])
+    return posts
@@ -0,0 +1,404 @@
+"""Streaming export and import of the social graph as NDJSON or CSV.
+
+Each table is written to its own file in primary key order, so the
+importer can map exported ids to new ids with two compact sorted arrays
+instead of a dict per row.
+
+Every row is matched on a natural key before it is inserted: users on
+their email, hashtags on their name, posts on author, time and title,
+likes on liker and post, comments on post, author, time and content.
+Batches commit one by one, importing a dump again, or after an import
+was interrupted, only adds the rows that are missing.
+
+Existing accounts keep their password, profile and permissions unless
+the import overwrites them. A new account whose username belongs to
+another one is imported with a numbered username.
+"""
+import csv
+import json
+import time
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .bulk_posts import upsert_hashtags
+from .models import User, Post, Hashtag, Like, Comment, normalize_hashtag
+
+# Export order is also import order, referenced tables come first
+TABLES = {
+    "users": (
+        User,
+        ("id", "email", "username", "password", "first_name", "last_name",
+         "bio", "image", "is_staff", "is_active", "is_superuser",
+         "date_joined"),
+    ),
+    "hashtags": (Hashtag, ("id", "name")),
+    "posts": (
+        Post, ("id", "title", "content", "author_id", "image", "created_at")
+    ),
+    "post_hashtags": (Post.hashtags.through, ("id", "post_id", "hashtag_id")),
+    "likes": (Like, ("id", "liker_id", "post_id", "created_at")),
+    "comments": (
+        Comment, ("id", "post_id", "author_id", "content", "created_at")
+    ),
+    "followings": (
+        User.followings.through, ("id", "from_user_id", "to_user_id")
+    ),
+    "followers": (
+        User.followers.through, ("id", "from_user_id", "to_user_id")
+    ),
+}
+
+# The managers hide soft-deleted users and posts until their deletion
+# job has run, rows that reference them are left out of the export too
+LIVE_POST = {
+    "post__deleted_at__isnull": True,
+    "post__author__deleted_at__isnull": True,
+}
+LIVE_FOLLOW = {
+    "from_user__deleted_at__isnull": True,
+    "to_user__deleted_at__isnull": True,
+}
+LIVE_FILTERS = {
+    "post_hashtags": LIVE_POST,
+    "likes": {**LIVE_POST, "liker__deleted_at__isnull": True},
+    "comments": LIVE_POST,
+    "followings": LIVE_FOLLOW,
+    "followers": LIVE_FOLLOW,
+}
+
+BOOLEAN_FIELDS = {"is_staff", "is_active", "is_superuser"}
+
+
+class IdMap:
+    """Exported id -> imported id for ids that arrive in ascending order,
+    16 bytes per row"""
+
+    def __init__(self):
+        self.old = array("q")
+        self.new = array("q")
+
+    def add(self, old_id: int, new_id: int):
+        if self.old and old_id <= self.old[-1]:
+            raise ValueError("Ids must be imported in ascending order")
+        self.old.append(old_id)
+        self.new.append(new_id)
+
+    def __getitem__(self, old_id: int) -> int:
+        index = bisect_left(self.old, old_id)
+        if index == len(self.old) or self.old[index] != old_id:
+            raise KeyError(old_id)
+        return self.new[index]
+
+
+class Progress:
+    def __init__(self, stdout, table):
+        self.stdout = stdout
+        self.table = table
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    def add(self, rows: int):
+        self.rows += rows
+
+    def done(self):
+        elapsed = time.perf_counter() - self.started
+        rate = self.rows / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{self.table}: {self.rows:,} rows in {elapsed:.1f}s "
+            f"({rate:,.0f} rows/s)"
+        )
+        return self.rows, elapsed
+
+
+def export_table(name, directory: Path, file_format, chunk_size, stdout):
+    model, fields = TABLES[name]
+    rows = model.objects.filter(**LIVE_FILTERS.get(name, {})).order_by(
+        "id"
+    ).values_list(*fields).iterator(chunk_size=chunk_size)
+    progress = Progress(stdout, name)
+    path = directory / f"{name}.{file_format}"
+
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            writer = csv.writer(file)
+            writer.writerow(fields)
+            for row in rows:
+                writer.writerow(row)
+                progress.add(1)
+        else:
+            # DjangoJSONEncoder would cut datetimes to milliseconds
+            encoder = json.JSONEncoder(
+                ensure_ascii=False, default=lambda value: value.isoformat()
+            )
+            for row in rows:
+                file.write(encoder.encode(dict(zip(fields, row))))
+                file.write("\n")
+                progress.add(1)
+
+    return progress.done()
+
+
+def read_rows(path: Path, file_format):
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            for row in csv.DictReader(file):
+                yield {
+                    field: parse_csv_value(field, value)
+                    for field, value in row.items()
+                }
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def parse_csv_value(field, value):
+    if field in BOOLEAN_FIELDS:
+        return value == "True"
+    if field == "id" or field.endswith("_id"):
+        return int(value)
+    return value
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def upsert_rows(existing, objects, key):
+    """Bulk create the objects whose natural key is not among the
+    existing rows. Returns the existing or created row for each object,
+    in order, and the created ones."""
+    found = {key(row): row for row in existing}
+    created = {}
+    for obj in objects:
+        obj_key = key(obj)
+        if obj_key not in found and obj_key not in created:
+            created[obj_key] = obj
+    existing.model._base_manager.bulk_create(created.values())
+    found.update(created)
+    return [found[key(obj)] for obj in objects], list(created.values())
+
+
+class Importer:
+    """Loads exported tables in batches, remapping foreign keys to the
+    ids of the imported rows"""
+
+    def __init__(self, directory: Path, file_format, batch_size, stdout,
+                 overwrite=False):
+        self.directory = directory
+        self.file_format = file_format
+        self.batch_size = batch_size
+        self.stdout = stdout
+        self.overwrite = overwrite
+        self.ids = {"users": IdMap(), "hashtags": IdMap(), "posts": IdMap()}
+
+    def run(self):
+        results = {}
+        for name in TABLES:
+            path = self.directory / f"{name}.{self.file_format}"
+            if not path.exists():
+                self.stdout.write(f"{name}: skipped, {path} not found")
+                continue
+            progress = Progress(self.stdout, name)
+            load = getattr(self, f"load_{name}")
+            for batch in batches(
+                read_rows(path, self.file_format), self.batch_size
+            ):
+                with transaction.atomic():
+                    load(batch)
+                progress.add(len(batch))
+            results[name] = progress.done()
+        return results
+
+    def rename_taken_usernames(self, batch, existing_emails):
+        """Number the usernames of imported accounts that belong to
+        another account"""
+        owners = dict(User.all_objects.filter(
+            username__in={row["username"] for row in batch}
+        ).values_list("username", "email"))
+        for row in batch:
+            owner = owners.get(row["username"])
+            if owner is None or owner == row["email"] or (
+                row["email"] in existing_emails and not self.overwrite
+            ):
+                continue
+            suffix = 2
+            while True:
+                username = f"{row['username']}-{suffix}"
+                if username not in owners and not User.all_objects.filter(
+                    username=username
+                ).exists():
+                    break
+                suffix += 1
+            self.stdout.write(
+                f"users: {row['email']} imported as {username}, "
+                f"{row['username']} belongs to {owner}"
+            )
+            owners[username] = row["email"]
+            row["username"] = username
+
+    def load_users(self, batch):
+        """Users are matched on their unique email, existing ones are
+        left alone unless the import overwrites them"""
+        for row in batch:
+            row["date_joined"] = parse_datetime(row["date_joined"])
+        existing = User.all_objects.filter(
+            email__in={row["email"] for row in batch}
+        ).only("id", "email")
+        self.rename_taken_usernames(
+            batch, {user.email for user in existing}
+        )
+        users = [
+            User(**{key: value for key, value in row.items() if key != "id"})
+            for row in batch
+        ]
+        if not self.overwrite:
+            users, _ = upsert_rows(existing, users, lambda user: user.email)
+        else:
+            users = User.objects.bulk_create(
+                users,
+                update_conflicts=True,
+                unique_fields=["email"],
+                update_fields=[
+                    "username", "password", "first_name", "last_name",
+                    "bio", "image", "is_staff", "is_active", "is_superuser",
+                ],
+            )
+        if any(user.pk is None for user in users):
+            # Backends that do not return ids from upserts
+            by_email = dict(User.objects.filter(
+                email__in=[user.email for user in users]
+            ).values_list("email", "id"))
+            for user in users:
+                user.pk = by_email[user.email]
+        for row, user in zip(batch, users):
+            self.ids["users"].add(row["id"], user.pk)
+
+    def load_hashtags(self, batch):
+        """Existing hashtags with the same normalized name are reused"""
+        for row in batch:
+            row["name"] = normalize_hashtag(row["name"])
+        ids = upsert_hashtags({row["name"] for row in batch})
+        for row in batch:
+            self.ids["hashtags"].add(row["id"], ids[row["name"]])
+
+    def load_posts(self, batch):
+        users = self.ids["users"]
+        posts = [
+            Post(
+                title=row["title"],
+                content=row["content"],
+                author_id=users[row["author_id"]],
+                image=row["image"] or None,
+                created_at=parse_datetime(row["created_at"]),
+            )
+            for row in batch
+        ]
+        posts, _ = upsert_rows(
+            Post.all_objects.filter(
+                author_id__in={post.author_id for post in posts},
+                created_at__in={post.created_at for post in posts},
+            ).only("id", "author_id", "created_at", "title"),
+            posts,
+            lambda post: (post.author_id, post.created_at, post.title),
+        )
+        for row, post in zip(batch, posts):
+            self.ids["posts"].add(row["id"], post.pk)
+
+    def load_post_hashtags(self, batch):
+        posts, hashtags = self.ids["posts"], self.ids["hashtags"]
+        Post.hashtags.through.objects.bulk_create(
+            (
+                Post.hashtags.through(
+                    post_id=posts[row["post_id"]],
+                    hashtag_id=hashtags[row["hashtag_id"]],
+                )
+                for row in batch
+            ),
+            ignore_conflicts=True,
+        )
+
+    def load_likes(self, batch):
+        users, posts = self.ids["users"], self.ids["posts"]
+        likes = [
+            Like(
+                liker_id=users[row["liker_id"]],
+                post_id=posts[row["post_id"]],
+                # Exports made before likes had a time lack the column
+                created_at=(
+                    parse_datetime(row.get("created_at") or "")
+                    or timezone.now()
+                ),
+            )
+            for row in batch
+        ]
+        upsert_rows(
+            Like.objects.filter(
+                post_id__in={like.post_id for like in likes},
+                liker_id__in={like.liker_id for like in likes},
+            ).only("id", "liker_id", "post_id"),
+            likes,
+            lambda like: (like.liker_id, like.post_id),
+        )
+
+    def load_comments(self, batch):
+        users, posts = self.ids["users"], self.ids["posts"]
+        comments = [
+            Comment(
+                post_id=posts[row["post_id"]],
+                author_id=users[row["author_id"]],
+                content=row["content"],
+                created_at=parse_datetime(row["created_at"]),
+            )
+            for row in batch
+        ]
+        created_at = {id(comment): comment.created_at for comment in comments}
+        _, created = upsert_rows(
+            Comment.all_objects.filter(
+                post_id__in={comment.post_id for comment in comments},
+                author_id__in={comment.author_id for comment in comments},
+                created_at__in=set(created_at.values()),
+            ),
+            comments,
+            lambda comment: (
+                comment.post_id,
+                comment.author_id,
+                created_at.get(id(comment), comment.created_at),
+                comment.content,
+            ),
+        )
+        # created_at is auto_now_add, restore the exported value
+        for comment in created:
+            comment.created_at = created_at[id(comment)]
+        Comment.objects.bulk_update(created, ["created_at"])
+
+    def load_follows(self, through, batch):
+        users = self.ids["users"]
+        through.objects.bulk_create(
+            (
+                through(
+                    from_user_id=users[row["from_user_id"]],
+                    to_user_id=users[row["to_user_id"]],
+                )
+                for row in batch
+            ),
+            ignore_conflicts=True,
+        )
+
+    def load_followings(self, batch):
+        self.load_follows(User.followings.through, batch)
+
+    def load_followers(self, batch):
+        self.load_follows(User.followers.through, batch)
@@ -0,0 +1,113 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections, DatabaseError
+from django.db.utils import ConnectionDoesNotExist
+
+logger = logging.getLogger(__name__)
+
+# Set by ReplicaRoutingMiddleware for safe requests of users that did not
+# write recently. Everything else (writes, Celery tasks, shell) keeps
+# reading from the primary.
+replica_reads_allowed = ContextVar("replica_reads_allowed", default=False)
+# Replicas the current request read from
+replicas_used = ContextVar("replicas_used", default=None)
+
+_replica_health = {}
+
+
+def replica_lag(alias: str):
+    """Seconds since the last transaction replayed on a Postgres standby"""
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXTRACT(EPOCH FROM "
+            "now() - pg_last_xact_replay_timestamp())"
+        )
+        lag = cursor.fetchone()[0]
+    return float(lag) if lag is not None else 0
+
+
+def is_healthy(alias: str) -> bool:
+    """Replica status is checked at most every REPLICA_CHECK_INTERVAL
+    seconds per process, a failed check takes the replica out of
+    rotation until the next one"""
+    now = time.monotonic()
+    checked_at, healthy = _replica_health.get(alias, (None, False))
+    interval = settings.REPLICA_CHECK_INTERVAL
+    if checked_at is not None and now - checked_at < interval:
+        return healthy
+
+    try:
+        healthy = replica_lag(alias) <= settings.REPLICA_MAX_LAG
+        if not healthy:
+            logger.warning(f"Replica {alias} is lagging, using primary")
+    except (ConnectionDoesNotExist, DatabaseError):
+        logger.warning(f"Replica {alias} is unavailable, using primary")
+        healthy = False
+
+    _replica_health[alias] = (now, healthy)
+    return healthy
+
+
+@contextmanager
+def replica_reads(allowed: bool):
+    """Reads in the block may go to replicas if `allowed`, yields the
+    set of replicas that were read from"""
+    used = set()
+    allowed_token = replica_reads_allowed.set(allowed)
+    used_token = replicas_used.set(used)
+    try:
+        yield used
+    finally:
+        replicas_used.reset(used_token)
+        replica_reads_allowed.reset(allowed_token)
+
+
+def recheck(used) -> bool:
+    """After a server error, the replicas that were read from are checked
+    again before their next use. True if the failed reads should be
+    retried on the primary."""
+    for alias in used:
+        logger.warning(f"Request failed after reading from {alias}")
+        _replica_health.pop(alias, None)
+    return bool(used)
+
+
+class ReplicaRouter:
+    """Send reads of safe requests to a healthy replica,
+    everything else to the primary"""
+
+    primary = "default"
+
+    def db_for_read(self, model, **hints):
+        if not replica_reads_allowed.get():
+            return self.primary
+
+        replicas = [
+            alias for alias in settings.DATABASE_REPLICAS
+            if is_healthy(alias)
+        ]
+        if not replicas:
+            return self.primary
+        alias = random.choice(replicas)
+        used = replicas_used.get()
+        if used is not None:
+            used.add(alias)
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,226 @@
+"""Deletion of accounts and posts in the background.
+
+Deleting a large account in the request cascades through every like,
+comment, post and follow in one transaction, which holds locks for
+minutes. Instead the account or post is soft-deleted, which the default
+managers of the models hide at once, and a DeletionJob removes the
+dependent rows DELETION_CHUNK_SIZE at a time, one short transaction per
+chunk with a pause in between.
+
+Every step deletes whatever rows are left, so a job interrupted by a
+crash continues where it stopped when it is run again.
+"""
+import os
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import (
+    OutstandingToken
+)
+
+from . import sync
+from .models import (
+    Post,
+    ScheduledPost,
+    Like,
+    Comment,
+    OutboxEvent,
+    Notification,
+    DeletionJob,
+    UploadSession,
+    upload_session_file_path,
+)
+
+
+def soft_delete_user(user) -> DeletionJob:
+    """Hide the account and free its email and username"""
+    with transaction.atomic():
+        user.deleted_at = timezone.now()
+        user.is_active = False
+        user.email = f"deleted-{uuid.uuid4().hex}@deleted.invalid"
+        user.username = f"deleted-{uuid.uuid4().hex}"
+        user.save(
+            update_fields=("deleted_at", "is_active", "email", "username")
+        )
+        sync.track_account_deleted(user.id)
+        return DeletionJob.objects.create(
+            target=DeletionJob.TARGET_USER, target_id=user.id
+        )
+
+
+def soft_delete_post(post) -> DeletionJob:
+    with transaction.atomic():
+        post.deleted_at = timezone.now()
+        post.save(update_fields=("deleted_at",))
+        sync.track_post(post, deleted=True)
+        return DeletionJob.objects.create(
+            target=DeletionJob.TARGET_POST, target_id=post.id
+        )
+
+
+def remove_upload_files(pks):
+    for pk in pks:
+        try:
+            os.remove(upload_session_file_path(pk))
+        except FileNotFoundError:
+            pass
+
+
+def user_steps(user_id) -> list:
+    """(name, rows, cleanup) in the order they are deleted: rows other
+    users see first, the account last"""
+    user_model = get_user_model()
+    posts = Q(post__author_id=user_id)
+    return [
+        ("likes", Like.objects.filter(liker_id=user_id), None),
+        ("comments", Comment.all_objects.filter(author_id=user_id), None),
+        ("post likes", Like.objects.filter(posts), None),
+        ("post comments", Comment.all_objects.filter(posts), None),
+        (
+            "notifications",
+            Notification.objects.filter(
+                Q(recipient_id=user_id) | Q(actor_id=user_id) | posts
+            ),
+            None,
+        ),
+        (
+            "outbox events",
+            OutboxEvent.objects.filter(
+                Q(recipient_id=user_id) | Q(actor_id=user_id) | posts
+            ),
+            None,
+        ),
+        (
+            "uploads",
+            UploadSession.objects.filter(Q(owner_id=user_id) | posts),
+            remove_upload_files,
+        ),
+        (
+            "post hashtags",
+            Post.hashtags.through.objects.filter(posts),
+            None,
+        ),
+        ("posts", Post.all_objects.filter(author_id=user_id), None),
+        (
+            "scheduled post hashtags",
+            ScheduledPost.hashtags.through.objects.filter(
+                scheduledpost__author_id=user_id
+            ),
+            None,
+        ),
+        (
+            "scheduled posts",
+            ScheduledPost.all_objects.filter(author_id=user_id),
+            None,
+        ),
+        *(
+            (
+                "follows",
+                through.objects.filter(
+                    Q(from_user_id=user_id) | Q(to_user_id=user_id)
+                ),
+                None,
+            )
+            for through in (
+                user_model.followings.through,
+                user_model.followers.through,
+            )
+        ),
+        ("tokens", OutstandingToken.objects.filter(user_id=user_id), None),
+        ("account", user_model.all_objects.filter(pk=user_id), None),
+    ]
+
+
+def post_steps(post_id) -> list:
+    return [
+        ("likes", Like.objects.filter(post_id=post_id), None),
+        ("comments", Comment.all_objects.filter(post_id=post_id), None),
+        (
+            "notifications",
+            Notification.objects.filter(post_id=post_id),
+            None,
+        ),
+        ("outbox events", OutboxEvent.objects.filter(post_id=post_id), None),
+        (
+            "uploads",
+            UploadSession.objects.filter(post_id=post_id),
+            remove_upload_files,
+        ),
+        (
+            "hashtags",
+            Post.hashtags.through.objects.filter(post_id=post_id),
+            None,
+        ),
+        ("post", Post.all_objects.filter(pk=post_id), None),
+    ]
+
+
+def delete_chunk(rows, cleanup=None) -> int:
+    """Delete up to DELETION_CHUNK_SIZE of the rows, returns how many"""
+    with transaction.atomic():
+        pks = list(
+            rows.values_list("pk", flat=True)[:settings.DELETION_CHUNK_SIZE]
+        )
+        if not pks:
+            return 0
+        rows.model._base_manager.filter(pk__in=pks).delete()
+    if cleanup is not None:
+        cleanup(pks)
+    return len(pks)
+
+
+def run(job_id):
+    """Run or resume a job, returns it or None when another worker is
+    running it"""
+    lock = f"deletion:{job_id}"
+    if not cache.add(lock, 1, settings.DELETION_STALE_SECONDS):
+        return None
+    try:
+        job = DeletionJob.objects.get(pk=job_id)
+        if job.status == DeletionJob.STATUS_DONE:
+            return job
+        job.status = DeletionJob.STATUS_RUNNING
+        job.save(update_fields=("status", "updated_at"))
+
+        if job.target == DeletionJob.TARGET_USER:
+            steps = user_steps(job.target_id)
+        else:
+            steps = post_steps(job.target_id)
+        for name, rows, cleanup in steps:
+            while True:
+                deleted = delete_chunk(rows, cleanup)
+                if not deleted:
+                    break
+                job.step = name
+                job.deleted += deleted
+                job.save(update_fields=("step", "deleted", "updated_at"))
+                cache.touch(lock, settings.DELETION_STALE_SECONDS)
+                time.sleep(settings.DELETION_PAUSE_SECONDS)
+
+        job.status = DeletionJob.STATUS_DONE
+        job.step = ""
+        job.finished_at = timezone.now()
+        job.save(
+            update_fields=("status", "step", "finished_at", "updated_at")
+        )
+        return job
+    finally:
+        cache.delete(lock)
+
+
+def stale_jobs():
+    """Unfinished jobs without progress for DELETION_STALE_SECONDS,
+    their worker is assumed dead"""
+    return DeletionJob.objects.exclude(
+        status=DeletionJob.STATUS_DONE
+    ).filter(
+        updated_at__lt=timezone.now()
+        - timedelta(seconds=settings.DELETION_STALE_SECONDS)
+    )
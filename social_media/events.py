@@ -0,0 +1,404 @@
+"""Real-time events pushed to clients over server-sent events.
+
+Writes publish small events on channels after their transaction
+commits: "posts:<author id>" for new posts, "user:<id>" for likes and
+comments on the posts of a user and "post:<id>" for new comments of a
+post. Every event gets an increasing id and is kept in a short history
+per channel, so a client reconnecting with Last-Event-ID gets what it
+missed before the live events.
+
+The broker is Redis pub/sub when EVENTS_REDIS_URL is set, otherwise an
+in-process broker, which only reaches clients of the same process and
+is meant for tests and development. With Redis each process (event
+loop) holds one pub/sub connection and fans the events out to the
+queues of its clients. Ids are taken before events are published, so
+concurrent writers can publish them out of order; clients get every
+event, in the order they arrive, and a reconnect may repeat a few.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import threading
+from collections import defaultdict, deque
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Post, Like, Comment
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Events of some channels for one connection. The queue is bounded,
+    a client that does not keep up is marked as overflowed and should be
+    disconnected, it resumes from the history when it reconnects."""
+
+    def __init__(self, channels):
+        self.channels = channels
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.loop = asyncio.get_running_loop()
+        self.overflowed = False
+        self.closed = False
+
+    def put(self, event):
+        if self.queue.full():
+            self.overflowed = True
+        else:
+            self.queue.put_nowait(event)
+
+    def close(self):
+        """The broker lost its connection, the stream ends and the client
+        reconnects, resuming from the history"""
+        self.closed = True
+        if not self.queue.full():
+            self.queue.put_nowait(None)
+
+    def deliver(self, event):
+        """Thread-safe put for publishers outside of the event loop"""
+        self.loop.call_soon_threadsafe(self.put, event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class MemoryBroker:
+    name = "memory"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.history = defaultdict(
+            lambda: deque(maxlen=settings.EVENTS_HISTORY_SIZE)
+        )
+        self.subscriptions = defaultdict(set)
+
+    def publish_many(self, events):
+        """Publish (channel, type, data) triples"""
+        for channel, event_type, data in events:
+            with self.lock:
+                event = {
+                    "id": next(self.ids),
+                    "channel": channel,
+                    "type": event_type,
+                    "data": data,
+                }
+                self.history[channel].append(event)
+                subscriptions = list(self.subscriptions[channel])
+            for subscription in subscriptions:
+                try:
+                    subscription.deliver(event)
+                except RuntimeError:
+                    # The event loop of the connection has closed
+                    self.discard(subscription)
+
+    def discard(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscriptions[channel].discard(subscription)
+
+    async def history_since(self, channels, last_id):
+        with self.lock:
+            return sorted(
+                (
+                    event
+                    for channel in channels
+                    for event in self.history.get(channel, ())
+                    if event["id"] > last_id
+                ),
+                key=lambda event: event["id"],
+            )
+
+    async def subscribe(self, channels):
+        subscription = Subscription(channels)
+        with self.lock:
+            for channel in channels:
+                self.subscriptions[channel].add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        self.discard(subscription)
+
+
+def pubsub_channel(channel):
+    return f"events:{channel}"
+
+
+class RedisListener:
+    """The pub/sub connection of one event loop, subscribed to the union
+    of the channels of its subscriptions"""
+
+    def __init__(self, url):
+        self.client = redis.asyncio.Redis.from_url(url)
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self.subscriptions = defaultdict(set)
+        self.lock = asyncio.Lock()
+        self.reader = None
+        # No longer taking subscriptions: emptied, or the connection failed
+        self.closed = False
+        self.failed = False
+
+    async def add(self, subscription) -> bool:
+        """False if the listener is closed and a new one is needed"""
+        async with self.lock:
+            if self.closed:
+                return False
+            new = [
+                channel for channel in subscription.channels
+                if not self.subscriptions[channel]
+            ]
+            for channel in subscription.channels:
+                self.subscriptions[channel].add(subscription)
+            try:
+                if new:
+                    await self.pubsub.subscribe(*map(pubsub_channel, new))
+            except redis.RedisError:
+                self.fail()
+                raise
+            if self.reader is None:
+                self.reader = asyncio.create_task(self.read())
+            return True
+
+    async def remove(self, subscription) -> bool:
+        """True when it was the last subscription, the listener is then
+        closed and should be disconnected"""
+        async with self.lock:
+            gone = []
+            for channel in subscription.channels:
+                subscribers = self.subscriptions.get(channel, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self.subscriptions.pop(channel, None)
+                    gone.append(channel)
+            if not self.subscriptions:
+                self.closed = True
+                return True
+            if gone and not self.failed:
+                try:
+                    await self.pubsub.unsubscribe(*map(pubsub_channel, gone))
+                except redis.RedisError:
+                    self.fail()
+            return False
+
+    async def read(self):
+        try:
+            async for message in self.pubsub.listen():
+                event = json.loads(message["data"])
+                for subscription in list(
+                    self.subscriptions.get(event["channel"], ())
+                ):
+                    subscription.put(event)
+        except redis.RedisError as error:
+            logger.warning(f"Event listener disconnected: {error}")
+        self.fail()
+
+    def fail(self):
+        self.closed = self.failed = True
+        for subscribers in list(self.subscriptions.values()):
+            for subscription in list(subscribers):
+                subscription.close()
+
+    async def disconnect(self):
+        if self.reader is not None:
+            self.reader.cancel()
+        await self.pubsub.close()
+        await self.client.close()
+
+
+class RedisBroker:
+    name = "redis"
+    ID_KEY = "events:last-id"
+
+    def __init__(self, url):
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+        self.listeners = {}
+
+    @staticmethod
+    def history_key(channel):
+        return f"events:history:{channel}"
+
+    def publish_many(self, events):
+        events = list(events)
+        if not events:
+            return
+        last_id = self.client.incrby(self.ID_KEY, len(events))
+        pipeline = self.client.pipeline(transaction=False)
+        for event_id, (channel, event_type, data) in enumerate(
+            events, start=last_id - len(events) + 1
+        ):
+            payload = json.dumps({
+                "id": event_id,
+                "channel": channel,
+                "type": event_type,
+                "data": data,
+            })
+            key = self.history_key(channel)
+            pipeline.lpush(key, payload)
+            pipeline.ltrim(key, 0, settings.EVENTS_HISTORY_SIZE - 1)
+            pipeline.expire(key, settings.EVENTS_HISTORY_SECONDS)
+            pipeline.publish(pubsub_channel(channel), payload)
+        pipeline.execute()
+
+    async def history_since(self, channels, last_id):
+        client = redis.asyncio.Redis.from_url(self.url)
+        try:
+            pipeline = client.pipeline(transaction=False)
+            for channel in channels:
+                pipeline.lrange(self.history_key(channel), 0, -1)
+            histories = await pipeline.execute()
+        finally:
+            await client.close()
+        events = (
+            json.loads(payload)
+            for history in histories
+            for payload in history
+        )
+        return sorted(
+            (event for event in events if event["id"] > last_id),
+            key=lambda event: event["id"],
+        )
+
+    async def subscribe(self, channels):
+        subscription = Subscription(channels)
+        loop = subscription.loop
+        while True:
+            listener = self.listeners.get(loop)
+            if listener is None or listener.closed:
+                listener = self.listeners[loop] = RedisListener(self.url)
+            subscription.listener = listener
+            try:
+                if await listener.add(subscription):
+                    return subscription
+            except redis.RedisError:
+                await self.unsubscribe(subscription)
+                raise
+
+    async def unsubscribe(self, subscription):
+        listener = subscription.listener
+        if await listener.remove(subscription):
+            if self.listeners.get(subscription.loop) is listener:
+                del self.listeners[subscription.loop]
+            await listener.disconnect()
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        if settings.EVENTS_REDIS_URL:
+            _broker = RedisBroker(settings.EVENTS_REDIS_URL)
+        else:
+            _broker = MemoryBroker()
+    return _broker
+
+
+def publish_on_commit(events):
+    """Publish once the surrounding transaction commits. Events are best
+    effort, a broker error never fails the write."""
+    def publish():
+        try:
+            get_broker().publish_many(events)
+        except redis.RedisError as error:
+            logger.warning(f"Events not published: {error}")
+        except Exception:
+            logger.exception("Events not published")
+
+    transaction.on_commit(publish)
+
+
+def post_event(post):
+    return (
+        f"posts:{post.author_id}",
+        "post",
+        {"id": post.id, "title": post.title, "author": post.author_id},
+    )
+
+
+@receiver(post_save, sender=Post)
+def publish_post(sender, instance, created, **kwargs):
+    if created:
+        publish_on_commit([post_event(instance)])
+
+
+@receiver(post_save, sender=Like)
+def publish_like(sender, instance, created, **kwargs):
+    author_id = instance.post.author_id
+    if created and author_id != instance.liker_id:
+        publish_on_commit([(
+            f"user:{author_id}",
+            "like",
+            {"post": instance.post_id, "liker": instance.liker_id},
+        )])
+
+
+@receiver(post_save, sender=Comment)
+def publish_comment(sender, instance, created, **kwargs):
+    if not created:
+        return
+    data = {
+        "id": instance.id,
+        "post": instance.post_id,
+        "author": instance.author_id,
+        "content": instance.content,
+    }
+    events = [(f"post:{instance.post_id}", "comment", data)]
+    author_id = instance.post.author_id
+    if author_id != instance.author_id:
+        events.append((f"user:{author_id}", "comment", data))
+    publish_on_commit(events)
+
+
+def format_event(event) -> str:
+    return (
+        f"id: {event['id']}\n"
+        f"event: {event['type']}\n"
+        f"data: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+    )
+
+
+async def event_stream(channels, last_event_id=None):
+    """SSE frames: missed events after last_event_id, then live events
+    and heartbeats until EVENTS_MAX_CONNECTION_SECONDS or until the
+    broker connection is lost, after which the client reconnects with
+    the id of the last event it got"""
+    broker = get_broker()
+    subscription = await broker.subscribe(channels)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.EVENTS_MAX_CONNECTION_SECONDS
+    try:
+        yield f"retry: {settings.EVENTS_RETRY_MILLISECONDS}\n\n"
+        replayed = set()
+        if last_event_id is not None:
+            # Subscribed first, so nothing falls between history and live
+            for event in await broker.history_since(channels, last_event_id):
+                replayed.add(event["id"])
+                yield format_event(event)
+
+        while not (subscription.overflowed or subscription.closed):
+            timeout = min(
+                settings.EVENTS_HEARTBEAT_SECONDS, deadline - loop.time()
+            )
+            if timeout <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(subscription.get(), timeout)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if event is None:
+                break
+            # Live events can arrive with lower ids than earlier ones,
+            # only those already sent from the history are skipped
+            if event["id"] in replayed:
+                continue
+            yield format_event(event)
+    finally:
+        await broker.unsubscribe(subscription)
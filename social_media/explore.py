@@ -0,0 +1,67 @@
+"""Engagement-ranked explore feed.
+
+A periodic task scores recent posts and stores the ids of the best ones,
+in rank order, as one packed array in the cache. Requests only slice
+that array and load the posts of the page, so no counting happens
+while serving.
+"""
+import heapq
+from array import array
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Post
+from .queries import with_post_counts
+
+CACHE_KEY = "explore:ranking"
+
+
+def score(likes, comments, age_hours) -> float:
+    """Engagement that halves every EXPLORE_HALF_LIFE_HOURS"""
+    engagement = likes + settings.EXPLORE_COMMENT_WEIGHT * comments
+    return engagement * 0.5 ** (age_hours / settings.EXPLORE_HALF_LIFE_HOURS)
+
+
+def compute_ranking(now=None) -> list:
+    """Ids of the top EXPLORE_SIZE posts of the last EXPLORE_WINDOW_HOURS"""
+    now = now or timezone.now()
+    since = now - timedelta(hours=settings.EXPLORE_WINDOW_HOURS)
+    rows = with_post_counts(
+        # Authors can date posts ahead, those would never decay
+        Post.objects.filter(created_at__gte=since, created_at__lte=now)
+    ).values_list(
+        "id", "likes_count", "comments_count", "created_at"
+    ).iterator(chunk_size=2_000)
+
+    scored = (
+        (
+            score(
+                likes,
+                comments,
+                max(0, (now - created_at).total_seconds() / 3600),
+            ),
+            post_id,
+        )
+        for post_id, likes, comments, created_at in rows
+        if likes or comments
+    )
+    return [
+        post_id for _, post_id in heapq.nlargest(settings.EXPLORE_SIZE, scored)
+    ]
+
+
+def store_ranking(post_ids):
+    cache.set(CACHE_KEY, array("q", post_ids).tobytes(), timeout=None)
+
+
+def ranked_ids(offset, limit) -> list:
+    """A page of the stored ranking, empty until the first run"""
+    packed = cache.get(CACHE_KEY)
+    if not packed:
+        return []
+    ranking = array("q")
+    ranking.frombytes(packed)
+    return ranking[offset:offset + limit].tolist()
@@ -0,0 +1,72 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from social_media.bulk_posts import create_posts
+from social_media.models import User, Post
+from social_media.serializers import BulkPostItemSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time validation and creation of one bulk post request with "
+        "hashtags and report posts/s and the number of SQL statements. "
+        "Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=5_000)
+        parser.add_argument("--hashtags", type=int, default=500)
+        parser.add_argument("--hashtags-per-post", type=int, default=3)
+        parser.add_argument("--runs", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        tags = [f"Tag{index}" for index in range(options["hashtags"])]
+        payload = [
+            {
+                "title": f"Bulk {index}",
+                "content": f"Generated #{rng.choice(tags)} content",
+                "hashtags": rng.sample(
+                    tags, min(options["hashtags_per_post"], len(tags))
+                ),
+            }
+            for index in range(options["posts"])
+        ]
+
+        for run in range(1, options["runs"] + 1):
+            try:
+                with transaction.atomic():
+                    author = User.objects.create_user(
+                        f"bulk-benchmark-{run}@test.com", "password",
+                        username=f"bulk-benchmark-{run}"
+                    )
+                    self.measure(run, author, payload)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def measure(self, run, author, payload):
+        started = time.perf_counter()
+        serializer = BulkPostItemSerializer(data=payload, many=True)
+        serializer.is_valid(raise_exception=True)
+        validated = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            posts = create_posts(Post, author, serializer.validated_data)
+        created = time.perf_counter()
+
+        total = created - started
+        self.stdout.write(
+            f"run {run}: {len(posts):,} posts in {total:.2f}s "
+            f"({len(posts) / total:,.0f} posts/s), validation "
+            f"{validated - started:.2f}s, insert {created - validated:.2f}s "
+            f"in {len(queries)} statements"
+        )
@@ -0,0 +1,81 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from social_media.models import User, Post, OutboxEvent, Notification
+from social_media.outbox import relay
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Write a burst of like events to the outbox, relay it and report "
+        "events/s, SQL statements, notifications made and the delivery "
+        "lag from write to notification. Everything is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=20_000)
+        parser.add_argument("--posts", type=int, default=40)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.measure(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def measure(self, options):
+        rng = random.Random(options["seed"])
+        author = User.objects.create_user(
+            "outbox-benchmark@test.com", "password",
+            username="outbox-benchmark"
+        )
+        actor = User.objects.create_user(
+            "outbox-actor@test.com", "password", username="outbox-actor"
+        )
+        posts = Post.objects.bulk_create(
+            Post(title=f"Post {index}", content="Content", author=author)
+            for index in range(options["posts"])
+        )
+        # Older events first, as they would be after a burst of writes
+        written = timezone.now()
+        OutboxEvent.objects.bulk_create(
+            (
+                OutboxEvent(
+                    kind=OutboxEvent.LIKE,
+                    actor=actor,
+                    recipient=author,
+                    post=rng.choice(posts),
+                    created_at=written,
+                )
+                for _ in range(options["events"])
+            ),
+            batch_size=1_000,
+        )
+        # Outbox rows written before the benchmark are relayed as well
+        pending = OutboxEvent.objects.count()
+
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            relayed = relay()
+        elapsed = time.perf_counter() - started
+        lag = timezone.now() - written
+
+        self.stdout.write(
+            f"relayed {relayed:,} of {pending:,} events in {elapsed:.2f}s "
+            f"({relayed / elapsed:,.0f} events/s) with {len(queries)} "
+            f"statements into "
+            f"{Notification.objects.filter(recipient=author).count()} "
+            f"notifications, lag of the last event "
+            f"{lag.total_seconds():.2f}s"
+        )
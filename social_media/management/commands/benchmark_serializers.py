@@ -0,0 +1,161 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ListSerializer
+
+from social_media.models import User, Post, Hashtag, Like
+from social_media.queries import (
+    post_list_queryset,
+    with_hashtag_counts,
+    with_is_liked,
+    with_relationships,
+    with_user_counts
+)
+from social_media.renderers import ORJSONRenderer
+from social_media.serializers import (
+    PostListSerializer,
+    UserListSerializer,
+    HashtagListSerializer
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Serialize and render the post, user and hashtag lists with model "
+        "instances and JSONRenderer, then with .values() rows and "
+        "ORJSONRenderer, check that the bytes are the same and report the "
+        "time per row. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=5_000)
+        parser.add_argument("--users", type=int, default=1_000)
+        parser.add_argument("--hashtags", type=int, default=200)
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.measure(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, options):
+        rng = random.Random(options["seed"])
+        users = User.objects.bulk_create(
+            User(
+                email=f"serializer-benchmark-{index}@test.com",
+                username=f"serializer-benchmark-{index}",
+            )
+            for index in range(options["users"])
+        )
+        hashtags = Hashtag.objects.bulk_create(
+            Hashtag(name=f"#benchmark{index}")
+            for index in range(options["hashtags"])
+        )
+        posts = Post.objects.bulk_create(
+            Post(
+                title=f"Post {index}",
+                content="Content",
+                author=rng.choice(users),
+                image=f"uploads/posts/post-{index}.jpg" if index % 2 else "",
+            )
+            for index in range(options["posts"])
+        )
+        Post.hashtags.through.objects.bulk_create(
+            Post.hashtags.through(post=post, hashtag=hashtag)
+            for post in posts
+            for hashtag in rng.sample(hashtags, min(3, len(hashtags)))
+        )
+        Like.objects.bulk_create(
+            Like(liker=liker, post=post)
+            for post in posts
+            for liker in rng.sample(users, min(5, len(users)))
+        )
+        me = users[0]
+        User.followings.through.objects.bulk_create(
+            User.followings.through(from_user=me, to_user=user)
+            for user in users[1:]
+        )
+        if connection.vendor == "postgresql":
+            # Without statistics the counts are planned as scans
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        return me, posts, users, hashtags
+
+    def measure(self, options):
+        me, posts, users, hashtags = self.seed(options)
+        cases = (
+            (
+                "posts",
+                PostListSerializer,
+                with_is_liked(post_list_queryset(), me).filter(
+                    pk__in=[post.pk for post in posts]
+                ),
+            ),
+            (
+                "users",
+                UserListSerializer,
+                with_relationships(
+                    with_user_counts(
+                        User.objects.filter(pk__in=[u.pk for u in users])
+                    ),
+                    me
+                ),
+            ),
+            (
+                "hashtags",
+                HashtagListSerializer,
+                with_hashtag_counts(
+                    Hashtag.objects.filter(pk__in=[h.pk for h in hashtags])
+                ),
+            ),
+        )
+        for name, serializer_class, queryset in cases:
+            expected, instance_time, instance_queries = self.time(
+                options["runs"],
+                lambda: JSONRenderer().render(ListSerializer(
+                    list(queryset.all()), child=serializer_class()
+                ).data),
+            )
+            output, values_time, values_queries = self.time(
+                options["runs"],
+                lambda: ORJSONRenderer().render(
+                    serializer_class(queryset.all(), many=True).data
+                ),
+            )
+            if output != expected:
+                raise CommandError(f"The {name} outputs differ")
+            rows = queryset.count()
+            self.stdout.write(
+                f"{name}: {rows:,} rows, instances + JSONRenderer "
+                f"{instance_time / rows * 1e6:,.1f}us/row in "
+                f"{instance_queries} queries, values + ORJSONRenderer "
+                f"{values_time / rows * 1e6:,.1f}us/row in "
+                f"{values_queries} queries "
+                f"({instance_time / values_time:.1f}x), "
+                f"{len(output):,} bytes"
+            )
+
+    @staticmethod
+    def time(runs, render):
+        """Output, best time and queries of one run"""
+        best = None
+        for _ in range(runs):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                output = render()
+                elapsed = time.perf_counter() - started
+            if best is None or elapsed < best:
+                best = elapsed
+        return output, best, len(queries)
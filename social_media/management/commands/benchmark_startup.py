@@ -0,0 +1,116 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import path
+
+PROFILES = ("social_media_api.settings.dev", "social_media_api.settings.prod")
+
+# Run in a fresh interpreter per profile: import Django, load the WSGI
+# application and the URLconf as a worker does, then time requests
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+cold_start = time.perf_counter() - started
+from social_media.management.commands.benchmark_startup import (
+    time_requests
+)
+result = time_requests(int(sys.argv[1]))
+print(json.dumps({"cold_start": cold_start, **result}))
+"""
+
+
+def ping(request):
+    return HttpResponse("pong")
+
+
+urlpatterns = [path("ping/", ping)]
+
+
+def time_requests(requests) -> dict:
+    """Seconds per request to a view that does nothing, through the
+    middleware of the profile and through none"""
+    factory = RequestFactory()
+
+    def per_request(handler):
+        total = 0
+        for _ in range(requests):
+            request = factory.get("/ping/", HTTP_HOST="localhost")
+            request.urlconf = __name__
+            started = time.perf_counter()
+            handler.get_response(request)
+            total += time.perf_counter() - started
+        return total / requests
+
+    handler = BaseHandler()
+    handler.load_middleware()
+    bare = BaseHandler()
+    with override_settings(MIDDLEWARE=[]):
+        bare.load_middleware()
+    per_request(handler)
+    return {
+        "debug": settings.DEBUG,
+        "middleware": len(settings.MIDDLEWARE),
+        "request": per_request(handler),
+        "bare_request": per_request(bare),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "For each settings profile, start fresh interpreters and report "
+        "the worker cold start (Django setup, WSGI application and URLconf "
+        "imports) and the time per request spent in middleware."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", nargs="+", default=PROFILES)
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument("--requests", type=int, default=2_000)
+
+    def handle(self, *args, **options):
+        for profile in options["profiles"]:
+            environment = {
+                **os.environ,
+                "DJANGO_SETTINGS_MODULE": profile,
+                "ALLOWED_HOSTS": "localhost",
+                "SECRET_KEY": os.environ.get("SECRET_KEY") or "benchmark",
+            }
+            results = [
+                json.loads(subprocess.run(
+                    [sys.executable, "-c", CHILD, str(options["requests"])],
+                    env=environment,
+                    cwd=settings.BASE_DIR,
+                    capture_output=True,
+                    check=True,
+                    text=True,
+                ).stdout)
+                for _ in range(options["runs"])
+            ]
+            cold_start = statistics.median(
+                result["cold_start"] for result in results
+            )
+            request = statistics.median(
+                result["request"] for result in results
+            )
+            bare = statistics.median(
+                result["bare_request"] for result in results
+            )
+            self.stdout.write(
+                f"{profile} (DEBUG={results[0]['debug']}, "
+                f"{results[0]['middleware']} middleware): cold start "
+                f"{cold_start * 1e3:,.0f}ms, request {request * 1e6:,.0f}us "
+                f"of which middleware {(request - bare) * 1e6:,.0f}us"
+            )
@@ -0,0 +1,60 @@
+import resource
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from social_media.suggestions import (
+    FollowGraph,
+    compute_suggestions,
+    store_suggestions,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the friends-of-friends suggestion job on the current "
+        "database and report the size of the in-memory graph and the "
+        "peak memory of the process. Seed a large graph first with "
+        "seed_social_graph, e.g. --users 200000 --follows-per-user 20."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size", type=int, default=settings.SUGGESTIONS_SIZE,
+            help="Suggestions kept per user"
+        )
+        parser.add_argument(
+            "--store", action="store_true",
+            help="Also write the suggestions to the cache"
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        graph = FollowGraph.load()
+        loaded = time.perf_counter()
+        graph_bytes = sum(
+            len(data) * data.itemsize
+            for data in (graph.user_ids, graph.offsets, graph.targets)
+        ) + len(graph.active)
+        self.stdout.write(
+            f"load: {len(graph):,} users, {graph.edges:,} edges in "
+            f"{loaded - started:.1f}s, graph {graph_bytes / 2 ** 20:.1f} MiB"
+        )
+
+        suggestions = compute_suggestions(graph, options["size"])
+        if options["store"]:
+            users = store_suggestions(suggestions)
+        else:
+            users = sum(1 for _ in suggestions)
+        computed = time.perf_counter()
+        self.stdout.write(
+            f"suggest: {users:,} users in {computed - loaded:.1f}s "
+            f"({users / max(computed - loaded, 1e-9):,.0f} users/s)"
+        )
+
+        # ru_maxrss is in KiB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f"total {computed - started:.1f}s, peak RSS {peak:,.0f} MiB"
+        ))
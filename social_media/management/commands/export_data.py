@@ -0,0 +1,46 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from social_media.data_transfer import TABLES, export_table
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream users, hashtags, posts, likes, comments and the follow "
+        "graph to one NDJSON or CSV file per table, reading with "
+        "server-side cursors so memory does not grow with table size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Directory for the exported files")
+        parser.add_argument(
+            "--format", choices=("ndjson", "csv"), default="ndjson"
+        )
+        parser.add_argument("--chunk-size", type=int, default=5_000)
+        parser.add_argument(
+            "--tables", nargs="+", choices=list(TABLES), default=list(TABLES)
+        )
+
+    def handle(self, *args, **options):
+        directory = Path(options["output"])
+        directory.mkdir(parents=True, exist_ok=True)
+
+        total_rows = total_time = 0
+        for name in TABLES:
+            if name not in options["tables"]:
+                continue
+            rows, elapsed = export_table(
+                name,
+                directory,
+                options["format"],
+                options["chunk_size"],
+                self.stdout,
+            )
+            total_rows += rows
+            total_time += elapsed
+
+        rate = total_rows / total_time if total_time else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {total_rows:,} rows to {directory} ({rate:,.0f} rows/s)"
+        ))
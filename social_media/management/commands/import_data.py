@@ -0,0 +1,53 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from social_media.data_transfer import Importer
+
+
+class Command(BaseCommand):
+    help = (
+        "Load files written by export_data in batches. Users are matched "
+        "by email, hashtags reused by name, other rows that are already "
+        "there are skipped, and all foreign keys are remapped to the ids "
+        "of the imported rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="Directory with the exported files")
+        parser.add_argument(
+            "--format", choices=("ndjson", "csv"), default="ndjson"
+        )
+        parser.add_argument("--batch-size", type=int, default=2_000)
+        parser.add_argument(
+            "--overwrite",
+            action="store_true",
+            help="Replace the passwords, profiles and permissions of "
+                 "existing users with the exported ones",
+        )
+
+    def handle(self, *args, **options):
+        directory = Path(options["input"])
+        if not directory.is_dir():
+            raise CommandError(f"{directory} is not a directory")
+
+        importer = Importer(
+            directory,
+            options["format"],
+            options["batch_size"],
+            self.stdout,
+            overwrite=options["overwrite"],
+        )
+        try:
+            results = importer.run()
+        except KeyError as error:
+            raise CommandError(
+                f"Row references id {error} that was not imported"
+            )
+
+        total_rows = sum(rows for rows, _ in results.values())
+        total_time = sum(elapsed for _, elapsed in results.values())
+        rate = total_rows / total_time if total_time else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {total_rows:,} rows ({rate:,.0f} rows/s)"
+        ))
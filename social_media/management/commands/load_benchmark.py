@@ -0,0 +1,96 @@
+import asyncio
+import statistics
+import time
+
+import aiohttp
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many concurrent keep-alive connections against a running "
+        "server and report throughput, latency percentiles and errors. "
+        "Run it once against gunicorn (WSGI) and once against uvicorn "
+        "(ASGI) to compare concurrent-connection capacity."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            default="http://localhost:8000/api/async/posts/",
+            help="Endpoint to load, e.g. /api/posts/ or /api/async/posts/"
+        )
+        parser.add_argument("--token", help="JWT access token")
+        parser.add_argument("--method", default="GET")
+        parser.add_argument("--concurrency", type=int, default=200)
+        parser.add_argument(
+            "--duration", type=float, default=30, help="Seconds to run"
+        )
+        parser.add_argument(
+            "--timeout", type=float, default=30, help="Per-request timeout"
+        )
+
+    def handle(self, *args, **options):
+        latencies, errors = [], {}
+        started = time.perf_counter()
+        asyncio.run(self.run_load(options, latencies, errors))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{options['method']} {options['url']} with "
+            f"{options['concurrency']} connections for {elapsed:.1f}s"
+        )
+        if not latencies:
+            self.stdout.write(self.style.ERROR("No successful requests"))
+        else:
+            latencies.sort()
+            self.stdout.write(
+                f"requests: {len(latencies)}  "
+                f"rps: {len(latencies) / elapsed:.1f}\n"
+                f"latency ms  p50: {self.percentile(latencies, 50):.1f}  "
+                f"p90: {self.percentile(latencies, 90):.1f}  "
+                f"p99: {self.percentile(latencies, 99):.1f}  "
+                f"mean: {statistics.mean(latencies):.1f}"
+            )
+        for error, count in sorted(errors.items()):
+            self.stdout.write(self.style.WARNING(f"{error}: {count}"))
+
+    @staticmethod
+    def percentile(values, percent):
+        index = min(len(values) - 1, int(len(values) * percent / 100))
+        return values[index]
+
+    async def run_load(self, options, latencies, errors):
+        headers = {}
+        if options["token"]:
+            headers["Authorization"] = f"Bearer {options['token']}"
+        connector = aiohttp.TCPConnector(limit=options["concurrency"])
+        timeout = aiohttp.ClientTimeout(total=options["timeout"])
+        deadline = time.perf_counter() + options["duration"]
+
+        async with aiohttp.ClientSession(
+            connector=connector, headers=headers, timeout=timeout
+        ) as session:
+            await asyncio.gather(*(
+                self.worker(session, options, deadline, latencies, errors)
+                for _ in range(options["concurrency"])
+            ))
+
+    @staticmethod
+    async def worker(session, options, deadline, latencies, errors):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                async with session.request(
+                    options["method"], options["url"]
+                ) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        key = f"HTTP {response.status}"
+                        errors[key] = errors.get(key, 0) + 1
+                        continue
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                key = type(error).__name__
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
@@ -0,0 +1,109 @@
+import asyncio
+import statistics
+import time
+
+import aiohttp
+from django.core.management.base import BaseCommand
+
+from social_media.events import get_broker
+
+
+class Command(BaseCommand):
+    help = (
+        "Hold many idle server-sent event connections against a running "
+        "ASGI server and report how many stay connected, heartbeats and, "
+        "with --publish, the latency of one event to every connection. "
+        "--publish needs the same EVENTS_REDIS_URL as the server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url", default="http://localhost:8000/api/events/"
+        )
+        parser.add_argument("--token", help="JWT access token")
+        parser.add_argument("--connections", type=int, default=1_000)
+        parser.add_argument(
+            "--duration", type=float, default=60, help="Seconds to hold"
+        )
+        parser.add_argument(
+            "--publish",
+            type=int,
+            metavar="USER_ID",
+            help="Publish a like for this user (the token owner) "
+                 "halfway through and time its delivery",
+        )
+
+    def handle(self, *args, **options):
+        stats = {"connected": 0, "heartbeats": 0, "errors": {}}
+        received = []
+        asyncio.run(self.run_load(options, stats, received))
+
+        self.stdout.write(
+            f"{options['connections']} connections to {options['url']} "
+            f"for {options['duration']:.0f}s\n"
+            f"connected: {stats['connected']}  "
+            f"heartbeats: {stats['heartbeats']}"
+        )
+        if received:
+            received.sort()
+            self.stdout.write(
+                f"event delivered to {len(received)} connections, "
+                f"latency ms  p50: {received[len(received) // 2]:.1f}  "
+                f"max: {received[-1]:.1f}  "
+                f"mean: {statistics.mean(received):.1f}"
+            )
+        for error, count in sorted(stats["errors"].items()):
+            self.stdout.write(self.style.WARNING(f"{error}: {count}"))
+
+    async def run_load(self, options, stats, received):
+        connector = aiohttp.TCPConnector(limit=0)
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=None)
+        params = {"access_token": options["token"]} if options["token"] else {}
+        published = {}
+
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout
+        ) as session:
+            listeners = [
+                asyncio.create_task(
+                    self.listen(session, options, params, stats, received,
+                                published)
+                )
+                for _ in range(options["connections"])
+            ]
+            await asyncio.sleep(options["duration"] / 2)
+            if options["publish"] is not None:
+                published["at"] = time.perf_counter()
+                await asyncio.to_thread(get_broker().publish_many, [(
+                    f"user:{options['publish']}",
+                    "like",
+                    {"post": None, "liker": None},
+                )])
+            await asyncio.sleep(options["duration"] / 2)
+            for listener in listeners:
+                listener.cancel()
+            await asyncio.gather(*listeners, return_exceptions=True)
+
+    @staticmethod
+    async def listen(session, options, params, stats, received, published):
+        try:
+            async with session.get(options["url"], params=params) as response:
+                if response.status != 200:
+                    error = f"HTTP {response.status}"
+                    stats["errors"][error] = stats["errors"].get(error, 0) + 1
+                    return
+                stats["connected"] += 1
+                try:
+                    async for line in response.content:
+                        if line.startswith(b": ping"):
+                            stats["heartbeats"] += 1
+                        elif line.startswith(b"event: like"):
+                            received.append(
+                                (time.perf_counter() - published["at"])
+                                * 1000
+                            )
+                finally:
+                    stats["connected"] -= 1
+        except aiohttp.ClientError as error:
+            name = type(error).__name__
+            stats["errors"][name] = stats["errors"].get(name, 0) + 1
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from social_media import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the estimated rows, table and index size of every like "
+        "and comment partition. With --maintain create the upcoming "
+        "partitions and archive expired ones first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--maintain", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["maintain"]:
+            for table, done in partitions.maintain().items():
+                self.stdout.write(
+                    f"{table}: created {done['created'] or 'none'}, "
+                    f"archived {done['archived'] or 'none'}"
+                )
+        for model in partitions.MODELS:
+            if not partitions.is_partitioned(model):
+                self.stdout.write(
+                    f"{model._meta.db_table} is not partitioned"
+                )
+                continue
+            self.stdout.write(model._meta.db_table)
+            for name, rows, table_bytes, index_bytes in partitions.sizes(
+                model
+            ):
+                self.stdout.write(
+                    f"  {name}: ~{max(rows, 0):,} rows, "
+                    f"table {table_bytes / 2 ** 20:,.1f} MiB, "
+                    f"indexes {index_bytes / 2 ** 20:,.1f} MiB"
+                )
@@ -0,0 +1,282 @@
+import csv
+import io
+import random
+import secrets
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from social_media.models import User, Post, Hashtag, Like, Comment
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic social graph for load testing: users, "
+        "power-law follow edges, posts with hashtags, likes and comments. "
+        "Rows are streamed in batches with COPY on Postgres and "
+        "multi-row inserts elsewhere, so memory does not grow with the size. "
+        "Generated usernames, emails and hashtags start with a prefix, "
+        "random for every run unless --prefix is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument("--follows-per-user", type=int, default=20)
+        parser.add_argument("--posts-per-user", type=int, default=5)
+        parser.add_argument("--likes-per-post", type=int, default=20)
+        parser.add_argument("--comments-per-post", type=int, default=3)
+        parser.add_argument("--hashtags", type=int, default=1_000)
+        parser.add_argument("--batch-size", type=int, default=50_000)
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--prefix", help="Prefix of the generated names")
+
+    def handle(self, *args, **options):
+        # Not drawn from the seeded generator, the graph stays the same
+        self.prefix = options["prefix"] or secrets.token_hex(3)
+        if len(self.prefix) > 32:
+            raise CommandError("The prefix is longer than 32 characters")
+        self.check_prefix_is_free()
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.use_copy = connection.vendor == "postgresql"
+        self.now = timezone.now()
+        self.days = options["days"]
+        self.totals = {}
+        started = time.perf_counter()
+
+        users = options["users"]
+        user_base = self.next_id(User)
+        post_base = self.next_id(Post)
+        posts = users * options["posts_per_user"]
+
+        self.write(
+            User,
+            ["id", "password", "is_superuser", "username", "first_name",
+             "last_name", "email", "is_staff", "is_active", "date_joined",
+             "bio"],
+            self.user_rows(user_base, users),
+        )
+        hashtag_base = self.next_id(Hashtag)
+        self.write(
+            Hashtag, ["id", "name"],
+            self.hashtag_rows(hashtag_base, options["hashtags"]),
+        )
+        self.write_follows(user_base, users, options["follows_per_user"])
+        self.write(
+            Post,
+            ["id", "title", "content", "author_id", "created_at"],
+            self.post_rows(post_base, user_base, users, posts),
+        )
+        self.write(
+            Post.hashtags.through, ["post_id", "hashtag_id"],
+            self.post_hashtag_rows(
+                post_base, posts, hashtag_base, options["hashtags"]
+            ),
+        )
+        self.write(
+            Like, ["liker_id", "post_id", "created_at"],
+            self.like_rows(
+                post_base, posts, user_base, users,
+                options["likes_per_post"]
+            ),
+        )
+        self.write(
+            Comment, ["post_id", "content", "created_at", "author_id"],
+            self.comment_rows(
+                post_base, posts, user_base, users,
+                options["comments_per_post"]
+            ),
+        )
+        self.reset_sequences()
+
+        elapsed = time.perf_counter() - started
+        total = sum(self.totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {total:,} rows in {elapsed:.1f}s "
+            f"({total / elapsed:,.0f} rows/s)"
+        ))
+        for table, rows in self.totals.items():
+            self.stdout.write(f"  {table}: {rows:,}")
+
+    def check_prefix_is_free(self):
+        """Rows are committed batch by batch, a name taken by an existing
+        row would stop the run halfway"""
+        if (
+            User.all_objects.filter(
+                username__startswith=f"{self.prefix}-"
+            ).exists()
+            or User.all_objects.filter(
+                email__startswith=f"{self.prefix}-"
+            ).exists()
+            or Hashtag.objects.filter(
+                name__startswith=f"#{self.prefix}-"
+            ).exists()
+        ):
+            raise CommandError(
+                f"Names starting with {self.prefix}- are taken, "
+                f"choose another --prefix"
+            )
+
+    @staticmethod
+    def next_id(model) -> int:
+        # Soft-deleted rows still hold their ids
+        return (
+            model._base_manager.aggregate(last=Max("id"))["last"] or 0
+        ) + 1
+
+    def power_law(self, size: int, skew: float = 3.0) -> int:
+        """Index in [0, size) where low indexes are much more likely,
+        which makes early users and hashtags the popular ones"""
+        return int(size * self.rng.random() ** skew)
+
+    def random_count(self, mean: int) -> int:
+        """Heavy-tailed number of items with the given mean"""
+        if mean <= 0:
+            return 0
+        return int(self.rng.expovariate(1 / mean))
+
+    def random_time(self) -> str:
+        delta = timedelta(seconds=self.rng.randrange(self.days * 86400))
+        return (self.now - delta).isoformat()
+
+    def user_rows(self, base, count):
+        # One hash for everybody, hashing millions of passwords
+        # would take longer than the rest of the seeding
+        password = make_password("password")
+        for user_id in range(base, base + count):
+            yield (
+                user_id, password, False, f"{self.prefix}-user{user_id}",
+                "", "", f"{self.prefix}-user{user_id}@seed.test", False, True,
+                self.random_time(), "",
+            )
+
+    def hashtag_rows(self, base, count):
+        for hashtag_id in range(base, base + count):
+            yield hashtag_id, f"#{self.prefix}-tag{hashtag_id}"
+
+    def write_follows(self, user_base, users, mean_follows):
+        """Both follow M2Ms store the edge, from the follower in
+        `followings` and from the followed user in `followers`"""
+        def edges():
+            for offset in range(users):
+                followed = {
+                    self.power_law(users)
+                    for _ in range(self.random_count(mean_follows))
+                }
+                followed.discard(offset)
+                for target in followed:
+                    yield user_base + offset, user_base + target
+
+        state = self.rng.getstate()
+        self.write(
+            User.followings.through, ["from_user_id", "to_user_id"], edges()
+        )
+        # Replay the same edges for the reverse table
+        self.rng.setstate(state)
+        self.write(
+            User.followers.through, ["to_user_id", "from_user_id"], edges()
+        )
+
+    def post_rows(self, base, user_base, users, count):
+        for post_id in range(base, base + count):
+            yield (
+                post_id, f"Post {post_id}", "Generated content",
+                user_base + self.power_law(users, skew=1.5),
+                self.random_time(),
+            )
+
+    def post_hashtag_rows(self, post_base, posts, hashtag_base, hashtags):
+        if not hashtags:
+            return
+        for post_id in range(post_base, post_base + posts):
+            for index in {
+                self.power_law(hashtags)
+                for _ in range(self.rng.randint(0, 3))
+            }:
+                yield post_id, hashtag_base + index
+
+    def like_rows(self, post_base, posts, user_base, users, mean_likes):
+        for post_id in range(post_base, post_base + posts):
+            likers = {
+                self.power_law(users, skew=2.0)
+                for _ in range(self.random_count(mean_likes))
+            }
+            for liker in likers:
+                yield user_base + liker, post_id, self.random_time()
+
+    def comment_rows(self, post_base, posts, user_base, users, mean):
+        for post_id in range(post_base, post_base + posts):
+            for _ in range(self.random_count(mean)):
+                yield (
+                    post_id, "Generated comment", self.random_time(),
+                    user_base + self.rng.randrange(users),
+                )
+
+    def write(self, model, columns, rows):
+        """Stream rows into the table batch by batch"""
+        table = model._meta.db_table
+        started = time.perf_counter()
+        written = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                written += self.flush(table, columns, batch)
+                batch = []
+                self.report(table, written, started, end="\r")
+        if batch:
+            written += self.flush(table, columns, batch)
+        self.report(table, written, started)
+        self.totals[table] = self.totals.get(table, 0) + written
+
+    def flush(self, table, columns, batch) -> int:
+        with transaction.atomic():
+            if self.use_copy:
+                buffer = io.StringIO()
+                # Quoted strings keep "" apart from NULL in COPY csv
+                csv.writer(
+                    buffer, quoting=csv.QUOTE_NONNUMERIC
+                ).writerows(batch)
+                buffer.seek(0)
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(
+                        f"COPY {table} ({', '.join(columns)}) "
+                        f"FROM STDIN WITH (FORMAT csv)",
+                        buffer,
+                    )
+            else:
+                # Same statement as bulk_create without building
+                # a model instance per row
+                quote = connection.ops.quote_name
+                with connection.cursor() as cursor:
+                    cursor.executemany(
+                        f"INSERT INTO {quote(table)} "
+                        f"({', '.join(map(quote, columns))}) "
+                        f"VALUES ({', '.join(['%s'] * len(columns))})",
+                        batch,
+                    )
+        return len(batch)
+
+    def report(self, table, written, started, end="\n"):
+        elapsed = time.perf_counter() - started
+        rate = written / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{table}: {written:,} rows, {rate:,.0f} rows/s", ending=end
+        )
+        self.stdout.flush()
+
+    def reset_sequences(self):
+        """Rows were inserted with explicit ids"""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Hashtag, Post]
+        )
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
@@ -0,0 +1,191 @@
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+
+
+def private_storage():
+    """Storage under PRIVATE_ROOT, which is outside MEDIA_ROOT and not
+    served by serve_media"""
+    return FileSystemStorage(location=settings.PRIVATE_ROOT)
+
+
+def file_etag(stat) -> str:
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def is_public(path: str) -> bool:
+    """Other files under MEDIA_ROOT are not served"""
+    return any(
+        path.startswith(prefix)
+        for prefix in getattr(
+            settings,
+            "MEDIA_PUBLIC_PREFIXES",
+            ("uploads/posts/", "uploads/users/")
+        )
+    )
+
+
+def is_immutable(path: str) -> bool:
+    """Uploaded images get a uuid in their name and are never rewritten"""
+    return any(
+        path.startswith(prefix)
+        for prefix in getattr(
+            settings,
+            "MEDIA_IMMUTABLE_PREFIXES",
+            ("uploads/posts/", "uploads/users/")
+        )
+    )
+
+
+def not_modified(request, etag: str, mtime: float) -> bool:
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates
+
+    if_modified_since = parse_http_date_safe(
+        request.META.get("HTTP_IF_MODIFIED_SINCE", "")
+    )
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def parse_range(request, etag: str, size: int):
+    """Return (start, end) for a single satisfiable byte range,
+    None when the whole file should be sent, or False if unsatisfiable"""
+    header = request.META.get("HTTP_RANGE")
+    if not header or size == 0:
+        return None
+
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range and if_range.strip() != etag:
+        return None
+
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Multipart and malformed ranges are served as a full response
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def iter_file_range(file, start: int, length: int):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def offload_response(path: str, fullpath: str):
+    """Hand the bytes over to the front web server, which also
+    takes care of Range requests"""
+    backend = getattr(settings, "MEDIA_SENDFILE_BACKEND", None)
+    if backend == "nginx":
+        response = HttpResponse()
+        prefix = getattr(
+            settings, "MEDIA_ACCEL_REDIRECT_PREFIX", "/protected/"
+        )
+        response["X-Accel-Redirect"] = posixpath.join(prefix, path)
+        return response
+    if backend == "apache":
+        response = HttpResponse()
+        response["X-Sendfile"] = fullpath
+        return response
+    return None
+
+
+def file_response(request, fullpath: str, etag: str, size: int):
+    byte_range = parse_range(request, etag, size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        # FileResponse lets the WSGI server use sendfile for the full body
+        return FileResponse(open(fullpath, "rb"))
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        iter_file_range(open(fullpath, "rb"), start, length), status=206
+    )
+    response["Content-Length"] = str(length)
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve uploaded images with ETag, Range and long-lived caching.
+    The bytes are sent by the front server when MEDIA_SENDFILE_BACKEND
+    is configured, otherwise streamed with FileResponse (sendfile)."""
+    path = posixpath.normpath(path).lstrip("/")
+    if not is_public(path):
+        raise Http404("File does not exist")
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(fullpath)
+    except (OSError, ValueError):
+        raise Http404("File does not exist")
+    if not os.path.isfile(fullpath):
+        raise Http404("File does not exist")
+
+    etag = file_etag(stat)
+    cache_control = (
+        IMMUTABLE_CACHE_CONTROL if is_immutable(path)
+        else DEFAULT_CACHE_CONTROL
+    )
+
+    if not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        content_type, encoding = mimetypes.guess_type(fullpath)
+        content_type = content_type or "application/octet-stream"
+        response = offload_response(path, fullpath)
+
+        if response is None:
+            response = file_response(request, fullpath, etag, stat.st_size)
+        if encoding:
+            response["Content-Encoding"] = encoding
+        response["Content-Type"] = content_type
+        response["Accept-Ranges"] = "bytes"
+        response["Last-Modified"] = http_date(stat.st_mtime)
+
+    response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+    return response
@@ -0,0 +1,219 @@
+"""Prometheus metrics for requests, database queries and Celery tasks.
+
+With several gunicorn workers or Celery processes set
+PROMETHEUS_MULTIPROC_DIR to a directory shared by all of them, the
+/metrics view then aggregates the samples of every process. Celery runs
+tasks in child processes of the worker, so its metrics server requires
+it. /metrics only answers METRICS_ALLOWED_NETWORKS and requests with
+"Authorization: Bearer <METRICS_TOKEN>".
+"""
+import hmac
+import ipaddress
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from celery import signals as celery_signals
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.decorators import sync_and_async_middleware
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by resolved route",
+    ["route", "method", "status"],
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Number of SQL queries executed per request",
+    ["route", "method"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, float("inf")),
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in SQL queries per request",
+    ["route", "method"],
+)
+TASK_LATENCY = Histogram(
+    "celery_task_duration_seconds",
+    "Celery task run time",
+    ["task", "state"],
+)
+TASK_RESULTS = Counter(
+    "celery_task_results_total",
+    "Finished Celery tasks by final state",
+    ["task", "state"],
+)
+OUTBOX_LAG = Histogram(
+    "outbox_delivery_lag_seconds",
+    "Time from an outbox event's write to its notification",
+    buckets=(0.5, 1, 2, 3, 5, 10, 20, 30, 60, 120, 300, float("inf")),
+)
+OUTBOX_RELAYED = Counter(
+    "outbox_relayed_events_total",
+    "Outbox events relayed to notifications",
+)
+
+
+class QueryStats:
+    __slots__ = ("count", "duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# The stats object is shared with threads started by sync_to_async,
+# because they run with a copy of the request context.
+current_query_stats = ContextVar("current_query_stats", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current_query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.duration += time.perf_counter() - started
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+def route_name(request) -> str:
+    match = request.resolver_match
+    return match.view_name if match is not None else "unmatched"
+
+
+def observe(request, response, started, stats):
+    route = route_name(request)
+    REQUEST_LATENCY.labels(
+        route=route, method=request.method, status=response.status_code
+    ).observe(time.perf_counter() - started)
+    REQUEST_QUERIES.labels(route=route, method=request.method).observe(
+        stats.count
+    )
+    REQUEST_DB_TIME.labels(route=route, method=request.method).observe(
+        stats.duration
+    )
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Record latency, query count and query time per resolved route"""
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats = QueryStats()
+            token = current_query_stats.set(stats)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                current_query_stats.reset(token)
+            observe(request, response, started, stats)
+            return response
+
+    else:
+        def middleware(request):
+            stats = QueryStats()
+            token = current_query_stats.set(stats)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                current_query_stats.reset(token)
+            observe(request, response, started, stats)
+            return response
+
+    return middleware
+
+
+def get_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_allowed(request) -> bool:
+    token = settings.METRICS_TOKEN
+    if token and hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(),
+        f"Bearer {token}".encode(),
+    ):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network)
+        for network in settings.METRICS_ALLOWED_NETWORKS
+    )
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
+
+
+_task_started = {}
+
+
+@celery_signals.task_prerun.connect
+def task_started(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@celery_signals.task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    state = state or "UNKNOWN"
+    if started is not None:
+        TASK_LATENCY.labels(task=task.name, state=state).observe(
+            time.perf_counter() - started
+        )
+    TASK_RESULTS.labels(task=task.name, state=state).inc()
+
+
+@celery_signals.worker_ready.connect
+def start_worker_metrics_server(**kwargs):
+    """Celery workers do not serve HTTP, expose their metrics on
+    CELERY_METRICS_PORT when set. The tasks run in the pool's child
+    processes, their samples only reach this server through
+    PROMETHEUS_MULTIPROC_DIR."""
+    port = os.getenv("CELERY_METRICS_PORT")
+    if not port:
+        return
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        raise ImproperlyConfigured(
+            "CELERY_METRICS_PORT requires PROMETHEUS_MULTIPROC_DIR"
+        )
+    start_http_server(int(port), registry=get_registry())
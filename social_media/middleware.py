@@ -0,0 +1,103 @@
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed,
+    InvalidToken,
+    TokenError,
+)
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .db_router import recheck, replica_reads
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+jwt_authentication = JWTAuthentication()
+
+
+def request_user_id(request):
+    """User id of an already loaded user or from the JWT,
+    without a database query"""
+    user = getattr(request, "user", None)
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        user = None
+    if user is not None and user.is_authenticated:
+        return user.pk
+
+    header = jwt_authentication.get_header(request)
+    try:
+        raw_token = header and jwt_authentication.get_raw_token(header)
+        if not raw_token:
+            return None
+        token = jwt_authentication.get_validated_token(raw_token)
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        # Left to DRF's authentication to reject
+        return None
+    return token.get(jwt_settings.USER_ID_CLAIM)
+
+
+def pin_key(user_id) -> str:
+    return f"db-primary-pin:{user_id}"
+
+
+def wrote_successfully(request, response) -> bool:
+    # POST /api/batch/ only wrote if one of its sub-requests did
+    wrote = getattr(request, "batch_wrote", None)
+    if wrote is not None:
+        return wrote
+    return (
+        request.method not in SAFE_METHODS
+        and response.status_code < 400
+    )
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    """Let safe requests read from replicas, except for users who wrote
+    in the last REPLICA_PIN_SECONDS, so they always see their own writes.
+    A safe request that fails after reading from a replica, e.g. because
+    the replica went away mid-query, is run again on the primary."""
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            user_id = request_user_id(request)
+            allowed = request.method in SAFE_METHODS and not (
+                user_id and await cache.aget(pin_key(user_id))
+            )
+            with replica_reads(allowed) as used:
+                response = await get_response(request)
+            if response.status_code >= 500 and recheck(used):
+                response = await get_response(request)
+
+            if wrote_successfully(request, response):
+                user_id = request_user_id(request)
+                if user_id:
+                    await cache.aset(
+                        pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS
+                    )
+            return response
+
+    else:
+        def middleware(request):
+            user_id = request_user_id(request)
+            allowed = request.method in SAFE_METHODS and not (
+                user_id and cache.get(pin_key(user_id))
+            )
+            with replica_reads(allowed) as used:
+                response = get_response(request)
+            if response.status_code >= 500 and recheck(used):
+                response = get_response(request)
+
+            if wrote_successfully(request, response):
+                # DRF stores the authenticated user on the Django request
+                user_id = request_user_id(request)
+                if user_id:
+                    cache.set(
+                        pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS
+                    )
+            return response
+
+    return middleware
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.1 on 2026-10-19 08:03
+
+from django.db import migrations
+
+
+def merge_duplicate_hashtags(apps, schema_editor):
+    """Normalize names and move posts of duplicates to the oldest tag"""
+    Hashtag = apps.get_model("social_media", "Hashtag")
+    Post = apps.get_model("social_media", "Post")
+    ScheduledPost = apps.get_model("social_media", "ScheduledPost")
+
+    kept = {}
+    for hashtag in Hashtag.objects.order_by("id"):
+        # Same as models.normalize_hashtag at the time of this migration
+        # and cut to the column length, "#" may have made it longer
+        name = ("#" + hashtag.name.strip().lstrip("#").lower())[:63]
+        if name not in kept:
+            kept[name] = hashtag.id
+            if hashtag.name != name:
+                Hashtag.objects.filter(id=hashtag.id).update(name=name)
+            continue
+
+        for model in (Post, ScheduledPost):
+            through = model.hashtags.through
+            owner = f"{model._meta.model_name}_id"
+            tagged = through.objects.filter(hashtag_id=kept[name])
+            through.objects.filter(hashtag_id=hashtag.id).exclude(**{
+                f"{owner}__in": tagged.values(owner)
+            }).update(hashtag_id=kept[name])
+        Hashtag.objects.filter(id=hashtag.id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0002_upload_session'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_hashtags, migrations.RunPython.noop
+        ),
+    ]
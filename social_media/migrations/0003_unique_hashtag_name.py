@@ -0,0 +1,20 @@
+# Generated by Django 4.2.1 on 2026-10-19 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Kept apart from the data migration, Postgres cannot alter a table
+    # with pending trigger events from updates in the same transaction
+
+    dependencies = [
+        ('social_media', '0003_merge_duplicate_hashtags'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='hashtag',
+            name='name',
+            field=models.CharField(max_length=63, unique=True),
+        ),
+    ]
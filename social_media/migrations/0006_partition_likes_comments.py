@@ -0,0 +1,183 @@
+# Generated by Django 4.2.1 on 2026-10-19 09:02
+
+from datetime import datetime, timezone as dt_timezone
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+BACKFILL_BATCH = 50_000
+# Partitions created with the tables, social_media.partitions creates
+# the next ones
+PRECREATE_MONTHS = 3
+# Tables partitioned by created_at
+PARTITIONED = ("social_media_like", "social_media_comment")
+
+
+def backfill_like_created_at(apps, schema_editor):
+    """Likes had no time, the time of their post is the closest known"""
+    Like = apps.get_model("social_media", "Like")
+    Post = apps.get_model("social_media", "Post")
+    post_time = Subquery(
+        Post.objects.filter(pk=OuterRef("post_id")).values("created_at")[:1]
+    )
+    last_id = Like.objects.aggregate(models.Max("id"))["id__max"] or 0
+    for start in range(0, last_id + 1, BACKFILL_BATCH):
+        Like.objects.filter(
+            id__gte=start,
+            id__lt=start + BACKFILL_BATCH,
+            created_at__isnull=True
+        ).update(created_at=post_time)
+
+
+def month_start(value, months=0):
+    month = value.year * 12 + value.month - 1 + months
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def copy_indexes_and_constraints(cursor, source, target, suffix):
+    """Move the names of the indexes and foreign keys of `source` to
+    the same ones on `target`, `source` ones get the suffix. When
+    `target` is partitioned the ones of a `source` partition are
+    attached instead of rebuilt."""
+    cursor.execute(
+        "SELECT i.relname, pg_get_indexdef(i.oid) FROM pg_index x "
+        "JOIN pg_class i ON i.oid = x.indexrelid "
+        "WHERE x.indrelid = %s::regclass AND NOT x.indisprimary",
+        [source],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'",
+        [source],
+    )
+    foreign_keys = cursor.fetchall()
+
+    # Names are at most 63 characters
+    length = 63 - len(suffix)
+    for name, definition in indexes:
+        cursor.execute(
+            f'ALTER INDEX "{name}" RENAME TO "{name[:length]}{suffix}"'
+        )
+        columns = definition[definition.index(" USING "):]
+        cursor.execute(f'CREATE INDEX "{name}" ON "{target}"{columns}')
+    for name, definition in foreign_keys:
+        cursor.execute(
+            f'ALTER TABLE "{source}" RENAME CONSTRAINT "{name}" '
+            f'TO "{name[:length]}{suffix}"'
+        )
+        cursor.execute(
+            f'ALTER TABLE "{target}" ADD CONSTRAINT "{name}" {definition}'
+        )
+
+
+def partition_tables(apps, schema_editor):
+    """Rows that exist stay in place as the "<table>_legacy" partition,
+    up to the end of the current month, so nothing is copied"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    now = django.utils.timezone.now()
+    bound = month_start(now, 1)
+    with schema_editor.connection.cursor() as cursor:
+        for table in PARTITIONED:
+            legacy = f"{table}_legacy"
+            cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+            cursor.execute(f'SELECT coalesce(max(id), 0) + 1 FROM "{legacy}"')
+            next_id = cursor.fetchone()[0]
+            cursor.execute(
+                f'ALTER TABLE "{legacy}" ALTER COLUMN id DROP IDENTITY'
+            )
+            cursor.execute(
+                f'ALTER TABLE "{legacy}" DROP CONSTRAINT "{table}_pkey"'
+            )
+            cursor.execute(
+                f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) '
+                f"PARTITION BY RANGE (created_at)"
+            )
+            cursor.execute(
+                f'ALTER TABLE "{table}" ALTER COLUMN id ADD GENERATED BY '
+                f"DEFAULT AS IDENTITY (START WITH {next_id})"
+            )
+            cursor.execute(
+                f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" '
+                f"PRIMARY KEY (id, created_at)"
+            )
+            cursor.execute(
+                f'ALTER TABLE "{table}" ATTACH PARTITION "{legacy}" '
+                f"FOR VALUES FROM (MINVALUE) TO (%s)",
+                [bound],
+            )
+            copy_indexes_and_constraints(cursor, legacy, table, "_legacy")
+            for month in range(1, PRECREATE_MONTHS + 1):
+                lower = month_start(now, month)
+                cursor.execute(
+                    f'CREATE TABLE "{table}_p{lower:%Y%m}" PARTITION OF '
+                    f'"{table}" FOR VALUES FROM (%s) TO (%s)',
+                    [lower, month_start(now, month + 1)],
+                )
+            cursor.execute(
+                f'CREATE TABLE "{table}_default" PARTITION OF "{table}" '
+                f"DEFAULT"
+            )
+
+
+def unpartition_tables(apps, schema_editor):
+    """Copy the partitions back into one plain table"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in PARTITIONED:
+            partitioned = f"{table}_partitioned"
+            cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{partitioned}"')
+            cursor.execute(
+                f'ALTER TABLE "{partitioned}" '
+                f'RENAME CONSTRAINT "{table}_pkey" TO "{partitioned}_pkey"'
+            )
+            cursor.execute(
+                f'CREATE TABLE "{table}" '
+                f'(LIKE "{partitioned}" INCLUDING DEFAULTS)'
+            )
+            cursor.execute(
+                f'INSERT INTO "{table}" SELECT * FROM "{partitioned}"'
+            )
+            cursor.execute(
+                f'SELECT coalesce(max(id), 0) + 1 FROM "{table}"'
+            )
+            next_id = cursor.fetchone()[0]
+            cursor.execute(
+                f'ALTER TABLE "{table}" ALTER COLUMN id ADD GENERATED BY '
+                f"DEFAULT AS IDENTITY (START WITH {next_id})"
+            )
+            cursor.execute(
+                f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" '
+                f"PRIMARY KEY (id)"
+            )
+            copy_indexes_and_constraints(
+                cursor, partitioned, table, "_partitioned"
+            )
+            cursor.execute(f'DROP TABLE "{partitioned}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0005_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='like',
+            name='created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(
+            backfill_like_created_at, migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name='like',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
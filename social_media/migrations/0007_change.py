@@ -0,0 +1,29 @@
+# Generated by Django 4.2.1 on 2026-10-19 09:21
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0006_partition_likes_comments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('post', 'Post'), ('comment', 'Comment'), ('like', 'Like'), ('follow', 'Follow'), ('user', 'Account')], max_length=7)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('user_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('owner_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner_id', 'id'], name='social_medi_owner_i_7e5cb5_idx')],
+            },
+        ),
+    ]
@@ -43,6 +43,10 @@ class UserManager(BaseUserManager):
 
         return self._create_user(email, password, **extra_fields)
 
+    def get_queryset(self):
+        # Soft-deleted accounts are removed by social_media.deletion
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 
 def user_image_file_path(instance, filename: str):
     _, extension = os.path.splitext(filename)
@@ -61,15 +65,22 @@ class User(AbstractUser):
     followings = models.ManyToManyField(
         settings.AUTH_USER_MODEL, related_name="following_users", blank=True
     )
+    deleted_at = models.DateTimeField(null=True, blank=True)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
     objects = UserManager()
+    all_objects = models.Manager()
+
+
+def normalize_hashtag(name: str) -> str:
+    """Python, #python and ##PYTHON are all stored as #python"""
+    return "#" + name.strip().lstrip("#").lower()
 
 
 class Hashtag(models.Model):
-    name = models.CharField(max_length=63)
+    name = models.CharField(max_length=63, unique=True)
 
     def save(
         self,
@@ -78,8 +89,7 @@ class Hashtag(models.Model):
         using=None,
         update_fields=None
     ):
-        if not self.name.startswith("#"):
-            self.name = f"#{self.name}"
+        self.name = normalize_hashtag(self.name)
 
         super().save(
             force_insert=False,
@@ -92,6 +102,24 @@ class Hashtag(models.Model):
         return self.name
 
 
+class PostManager(models.Manager):
+    """Hides soft-deleted posts and the posts of soft-deleted users"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(
+            deleted_at__isnull=True, author__deleted_at__isnull=True
+        )
+
+
+class AuthorManager(models.Manager):
+    """Hides rows of soft-deleted users"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(
+            author__deleted_at__isnull=True
+        )
+
+
 def post_image_file_path(instance, filename: str):
     _, extension = os.path.splitext(filename)
     filename = f"{slugify(instance.title)}-{uuid.uuid4()}{extension}"
@@ -112,6 +140,10 @@ class Post(models.Model):
     )
     image = models.ImageField(null=True, upload_to=post_image_file_path)
     created_at = models.DateTimeField(blank=True, default=timezone.now)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = PostManager()
+    all_objects = models.Manager()
 
     def __str__(self) -> str:
         return f"{self.title} (author: {self.author.username})"
@@ -133,6 +165,9 @@ class ScheduledPost(models.Model):
     image = models.ImageField(null=True, upload_to=post_image_file_path)
     created_at = models.DateTimeField(blank=True, default=timezone.now)
 
+    objects = AuthorManager()
+    all_objects = models.Manager()
+
     def __str__(self) -> str:
         return f"{self.title} (author: {self.author.username})"
 
@@ -144,6 +179,9 @@ class Like(models.Model):
     post = models.ForeignKey(
         Post, related_name="likes", on_delete=models.CASCADE
     )
+    # Partition key of the like table on Postgres, see
+    # social_media.partitions
+    created_at = models.DateTimeField(default=timezone.now)
 
 
 class Comment(models.Model):
@@ -155,3 +193,193 @@ class Comment(models.Model):
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.CASCADE
     )
+
+    objects = AuthorManager()
+    all_objects = models.Manager()
+
+
+class OutboxEvent(models.Model):
+    """A side effect of a like, follow or comment, written in the same
+    transaction and relayed to notifications by social_media.outbox"""
+
+    LIKE = "like"
+    FOLLOW = "follow"
+    COMMENT = "comment"
+    KIND_CHOICES = (
+        (LIKE, "Like"),
+        (FOLLOW, "Follow"),
+        (COMMENT, "Comment"),
+    )
+
+    kind = models.CharField(max_length=7, choices=KIND_CHOICES)
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE
+    )
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name="+",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+
+class Notification(models.Model):
+    """Unread events of one kind on one post (or follows) are coalesced
+    into one notification, `actor` is the latest of `count` actors"""
+
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="notifications",
+        on_delete=models.CASCADE
+    )
+    kind = models.CharField(
+        max_length=7, choices=OutboxEvent.KIND_CHOICES
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name="+",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True
+    )
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE
+    )
+    count = models.PositiveIntegerField(default=1)
+    is_read = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ("-updated_at",)
+        indexes = (
+            models.Index(fields=("recipient", "-updated_at")),
+        )
+
+    def __str__(self) -> str:
+        return f"{self.kind} x{self.count} for {self.recipient_id}"
+
+
+class DeletionJob(models.Model):
+    """Removal of a soft-deleted account or post in small chunks by
+    social_media.deletion, resumed from the remaining rows after a crash"""
+
+    TARGET_USER = "user"
+    TARGET_POST = "post"
+    TARGET_CHOICES = (
+        (TARGET_USER, "Account"),
+        (TARGET_POST, "Post"),
+    )
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    target = models.CharField(max_length=4, choices=TARGET_CHOICES)
+    target_id = models.PositiveBigIntegerField()
+    status = models.CharField(
+        max_length=7, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    step = models.CharField(max_length=63, blank=True)
+    deleted = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.target} {self.target_id} ({self.status})"
+
+
+class Change(models.Model):
+    """A created, updated or deleted post, comment, like, follow edge or
+    account, written in the same transaction. The id is the token that
+    clients sync from, see social_media.sync."""
+
+    POST = "post"
+    COMMENT = "comment"
+    LIKE = "like"
+    FOLLOW = "follow"
+    USER = "user"
+    KIND_CHOICES = (
+        (POST, "Post"),
+        (COMMENT, "Comment"),
+        (LIKE, "Like"),
+        (FOLLOW, "Follow"),
+        (USER, "Account"),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=7, choices=KIND_CHOICES)
+    # The post, comment or account; the liked post or followed user
+    object_id = models.PositiveBigIntegerField()
+    # The liker or follower
+    user_id = models.PositiveBigIntegerField(null=True, blank=True)
+    # Clients following the owner get the change, everyone when empty.
+    # Plain ids, tombstones outlive the rows they refer to.
+    owner_id = models.PositiveBigIntegerField(null=True, blank=True)
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=("owner_id", "id")),
+        )
+
+
+def upload_session_file_path(session_id) -> str:
+    # Unverified partial files are kept out of the served media
+    return os.path.join(
+        settings.PRIVATE_ROOT, "uploads", "partial", f"{session_id}.part"
+    )
+
+
+class UploadSession(models.Model):
+    """A resumable image upload that is received in fixed-size chunks
+    and attached to a post or a user profile on commit"""
+
+    TARGET_POST = "post"
+    TARGET_USER = "user"
+    TARGET_CHOICES = (
+        (TARGET_POST, "Post image"),
+        (TARGET_USER, "Profile image"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="upload_sessions",
+        on_delete=models.CASCADE
+    )
+    target = models.CharField(max_length=4, choices=TARGET_CHOICES)
+    post = models.ForeignKey(
+        Post,
+        related_name="upload_sessions",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def file_path(self) -> str:
+        return upload_session_file_path(self.id)
+
+    @property
+    def is_complete(self) -> bool:
+        return self.offset >= self.size
+
+    def __str__(self) -> str:
+        return f"{self.filename} ({self.offset}/{self.size})"
@@ -0,0 +1,171 @@
+"""Transactional outbox for the side effects of likes, follows and
+comments.
+
+The write and its OutboxEvent are committed together, so a side effect
+is never lost nor produced for a rolled back write, and the request
+only pays for one more INSERT. The relay task drains the outbox in id
+order, in batches of OUTBOX_BATCH_SIZE, and coalesces each batch: all
+likes of one post become one unread notification whose count grows,
+however many there are.
+
+Relays claim their batch with SELECT ... FOR UPDATE SKIP LOCKED, so
+concurrent relays on any number of workers take different events, and
+lock the recipients of the batch, so the notifications of one recipient
+are updated by one relay at a time.
+"""
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import sync
+from .metrics import OUTBOX_LAG, OUTBOX_RELAYED
+from .models import Like, Notification, OutboxEvent, User
+
+logger = logging.getLogger(__name__)
+
+
+def record(kind, actor, recipient_id, post=None):
+    """Add an event to the outbox, in the caller's transaction"""
+    if actor.id != recipient_id:
+        OutboxEvent.objects.create(
+            kind=kind, actor=actor, recipient_id=recipient_id, post=post
+        )
+
+
+def like(user, post) -> Like:
+    with transaction.atomic():
+        created = Like.objects.create(liker=user, post=post)
+        record(OutboxEvent.LIKE, user, post.author_id, post)
+        sync.track_like(user.id, post)
+    return created
+
+
+def unlike(user, post) -> int:
+    """Remove the like, returns how many were removed"""
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(liker=user, post=post).delete()
+        if deleted:
+            sync.track_like(user.id, post, deleted=True)
+    return deleted
+
+
+def follow(user, other):
+    with transaction.atomic():
+        other.followers.add(user.id)
+        user.followings.add(other.id)
+        record(OutboxEvent.FOLLOW, user, other.id)
+        sync.track_follow(user.id, other.id)
+
+
+def unfollow(user, other):
+    with transaction.atomic():
+        other.followers.remove(user.id)
+        user.followings.remove(other.id)
+        sync.track_follow(user.id, other.id, deleted=True)
+
+
+def comment(serializer, user, post):
+    with transaction.atomic():
+        created = serializer.save(author=user, post=post)
+        record(OutboxEvent.COMMENT, user, post.author_id, post)
+        sync.track_comment(created, post)
+
+
+def coalesce(events) -> dict:
+    """(recipient, kind, post) -> (count, latest actor, latest time)"""
+    groups = {}
+    for event in events:
+        key = (event.recipient_id, event.kind, event.post_id)
+        count = groups[key][0] if key in groups else 0
+        groups[key] = (count + 1, event.actor_id, event.created_at)
+    return groups
+
+
+def notify(groups) -> int:
+    """Add the groups to the unread notifications, returns how many
+    notifications were created or updated, in the caller's transaction"""
+    recipient_ids = {recipient_id for recipient_id, _, _ in groups}
+    # Another relay with events for these recipients waits until this
+    # batch is committed, in id order so relays cannot deadlock
+    list(
+        User.all_objects.select_for_update(no_key=True).filter(
+            id__in=recipient_ids
+        ).order_by("id").values_list("id", flat=True)
+    )
+    # A superset of the groups, one OR per group is too deep for SQLite
+    post_ids = {post_id for _, _, post_id in groups} - {None}
+    unread = Notification.objects.filter(
+        Q(post_id__in=post_ids) | Q(post__isnull=True),
+        recipient_id__in=recipient_ids,
+        is_read=False,
+    )
+    existing = {
+        (notification.recipient_id, notification.kind,
+         notification.post_id): notification
+        for notification in unread
+    }
+
+    updated, created = [], []
+    for key, (count, actor_id, updated_at) in groups.items():
+        notification = existing.get(key)
+        if notification is None:
+            recipient_id, kind, post_id = key
+            created.append(Notification(
+                recipient_id=recipient_id,
+                kind=kind,
+                post_id=post_id,
+                actor_id=actor_id,
+                count=count,
+                updated_at=updated_at,
+            ))
+        else:
+            notification.count += count
+            notification.actor_id = actor_id
+            notification.updated_at = updated_at
+            updated.append(notification)
+
+    Notification.objects.bulk_update(
+        updated, ("count", "actor", "updated_at")
+    )
+    Notification.objects.bulk_create(created)
+    return len(updated) + len(created)
+
+
+def relay_batch() -> int:
+    """Relay the oldest batch of events that no other relay has claimed,
+    returns its size"""
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(
+                skip_locked=True
+            ).order_by("id")[:settings.OUTBOX_BATCH_SIZE]
+        )
+        if not events:
+            return 0
+        notified = notify(coalesce(events))
+        OutboxEvent.objects.filter(
+            id__in=[event.id for event in events]
+        ).delete()
+
+    now = timezone.now()
+    for event in events:
+        OUTBOX_LAG.observe((now - event.created_at).total_seconds())
+    OUTBOX_RELAYED.inc(len(events))
+    logger.info(
+        f"Relayed {len(events)} outbox events as {notified} "
+        f"notifications, oldest {now - events[0].created_at} old"
+    )
+    return len(events)
+
+
+def relay() -> int:
+    """Relay batches until no unclaimed events are left, returns the
+    number of relayed events"""
+    relayed = 0
+    while True:
+        batch = relay_batch()
+        if not batch:
+            return relayed
+        relayed += batch
@@ -0,0 +1,250 @@
+"""Monthly partitions of the like and comment tables on Postgres.
+
+Migration 0006 partitions both tables by created_at: the rows that
+existed stay in a "<table>_legacy" partition, later ones go to
+"<table>_pYYYYMM" partitions and "<table>_default" catches the rest.
+Queries on recent rows only touch recent partitions, whose indexes stay
+small enough to be cached.
+
+maintain() runs daily from Celery beat. It creates the partitions of
+the next PARTITIONS_PRECREATE_MONTHS months, so that rows never land in
+the default partition. Partitions that ended more than
+PARTITIONS_RETENTION_MONTHS ago are detached, saved to the private
+storage as gzipped CSV and dropped. A partition detached by a run that
+crashed before dropping it is archived by the next run.
+"""
+import gzip
+import logging
+import re
+import tempfile
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .media import private_storage
+from .models import Like, Comment
+
+logger = logging.getLogger(__name__)
+
+MODELS = (Like, Comment)
+
+Partition = namedtuple("Partition", ("name", "lower", "upper"))
+
+BOUND_PATTERN = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def month_start(value, months=0) -> datetime:
+    """Start of the month of `value` in UTC, `months` later"""
+    value = value.astimezone(dt_timezone.utc)
+    month = value.year * 12 + value.month - 1 + months
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def quote(name) -> str:
+    return connection.ops.quote_name(name)
+
+
+def parse_bound(value):
+    """Datetime of a partition bound, None for MINVALUE/MAXVALUE"""
+    if value.endswith("VALUE"):
+        return None
+    return parse_datetime(value.strip("'"))
+
+
+def is_partitioned(model) -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass(%s))",
+            [model._meta.db_table],
+        )
+        return cursor.fetchone()[0]
+
+
+def partitions(model) -> list:
+    """Attached partitions, the default one has no bounds"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass ORDER BY c.relname",
+            [model._meta.db_table],
+        )
+        rows = cursor.fetchall()
+    result = []
+    for name, bound in rows:
+        match = BOUND_PATTERN.search(bound)
+        if match is None:
+            result.append(Partition(name, None, None))
+        else:
+            result.append(Partition(
+                name, parse_bound(match[1]), parse_bound(match[2])
+            ))
+    return result
+
+
+def detached_partitions(model) -> list:
+    """Partition tables left behind by an interrupted archive"""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relname FROM pg_class WHERE relkind = 'r' "
+            "AND NOT relispartition AND relname ~ %s ORDER BY relname",
+            [f"^{table}_(p[0-9]{{6}}|legacy)$"],
+        )
+        return [name for name, in cursor.fetchall()]
+
+
+def create_partition(model, month) -> bool:
+    """Create the partition of the month starting at `month` unless a
+    partition covers it. Rows of that month in the default partition
+    are moved to it."""
+    upper = month_start(month, 1)
+    existing = partitions(model)
+    if any(
+        partition.upper is not None
+        and (partition.lower is None or partition.lower < upper)
+        and month < partition.upper
+        for partition in existing
+    ):
+        return False
+
+    table = model._meta.db_table
+    name = f"{table}_p{month:%Y%m}"
+    default = f"{table}_default"
+    bounds = [month, upper]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {quote(default)} "
+            f"WHERE created_at >= %s AND created_at < %s)",
+            bounds,
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f"CREATE TABLE {quote(name)} PARTITION OF {quote(table)} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                bounds,
+            )
+            return True
+
+        logger.warning(f"Moving rows of {name} out of {default}")
+        cursor.execute(
+            f"ALTER TABLE {quote(table)} DETACH PARTITION {quote(default)}"
+        )
+        cursor.execute(
+            f"CREATE TABLE {quote(name)} PARTITION OF {quote(table)} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            bounds,
+        )
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {quote(default)} "
+            f"WHERE created_at >= %s AND created_at < %s RETURNING *) "
+            f"INSERT INTO {quote(name)} SELECT * FROM moved",
+            bounds,
+        )
+        cursor.execute(
+            f"ALTER TABLE {quote(table)} ATTACH PARTITION {quote(default)} "
+            f"DEFAULT"
+        )
+    return True
+
+
+def save_archive(name, file) -> str:
+    """Save the gzipped CSV of a partition, returns its storage path.
+    Archives hold every like and comment of the month, they go to the
+    private storage and never to the media served under /media/."""
+    return private_storage().save(f"archive/{name}.csv.gz", File(file))
+
+
+def archive_partition(model, name) -> str:
+    """Detach the partition, save it as gzipped CSV and drop it.
+    Returns the storage path of the archive."""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if name not in detached_partitions(model):
+            cursor.execute(
+                f"ALTER TABLE {quote(table)} DETACH PARTITION {quote(name)}"
+            )
+        with tempfile.TemporaryFile() as file:
+            with gzip.GzipFile(fileobj=file, mode="wb") as archive:
+                cursor.copy_expert(
+                    f"COPY {quote(name)} TO STDOUT "
+                    f"WITH (FORMAT csv, HEADER)",
+                    archive,
+                )
+            file.seek(0)
+            path = save_archive(name, file)
+        cursor.execute(f"DROP TABLE {quote(name)}")
+    logger.info(f"Archived {name} to {path}")
+    return path
+
+
+def sizes(model) -> list:
+    """(partition, estimated rows, table bytes, index bytes)"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, c.reltuples::bigint, "
+            "pg_table_size(c.oid), pg_indexes_size(c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass ORDER BY c.relname",
+            [model._meta.db_table],
+        )
+        return cursor.fetchall()
+
+
+def maintain(now=None) -> dict:
+    """Create upcoming partitions and archive expired ones, returns
+    what was done per table"""
+    now = now or timezone.now()
+    report = {}
+    for model in MODELS:
+        if not is_partitioned(model):
+            continue
+        created = [
+            month
+            for month in (
+                month_start(now, offset)
+                for offset in range(settings.PARTITIONS_PRECREATE_MONTHS + 1)
+            )
+            if create_partition(model, month)
+        ]
+
+        cutoff = month_start(now, -settings.PARTITIONS_RETENTION_MONTHS)
+        expired = detached_partitions(model) + [
+            partition.name
+            for partition in partitions(model)
+            if partition.upper is not None and partition.upper <= cutoff
+        ]
+        archived = [archive_partition(model, name) for name in expired]
+
+        current = next(
+            (
+                partition.name
+                for partition in partitions(model)
+                if partition.upper is not None and partition.upper > now
+                and (partition.lower is None or partition.lower <= now)
+            ),
+            None,
+        )
+        for name, _, _, index_bytes in sizes(model):
+            if (
+                name == current
+                and index_bytes > settings.PARTITIONS_HOT_INDEX_BYTES
+            ):
+                logger.warning(
+                    f"Indexes of {name} take {index_bytes:,} bytes, more "
+                    f"than PARTITIONS_HOT_INDEX_BYTES"
+                )
+
+        report[model._meta.db_table] = {
+            "created": [f"{month:%Y-%m}" for month in created],
+            "archived": archived,
+        }
+    return report
@@ -0,0 +1,174 @@
+"""Streaming export of everything a user has on the platform.
+
+Records are read with chunked queries and written out as they come,
+so neither the NDJSON stream nor the zip archive is held in memory.
+Archives built in the background are kept in the private storage for
+PERSONAL_EXPORT_EXPIRY_SECONDS and only handed out to their owner.
+"""
+import json
+import uuid
+import zipfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.db.models import F
+from django.utils import timezone
+
+from .media import private_storage
+from .models import Post, Like, Comment
+
+CHUNK_SIZE = 2_000
+
+
+def profile(user):
+    return get_user_model().objects.filter(pk=user.pk).values(
+        "id", "email", "username", "first_name", "last_name", "bio",
+        "image", "date_joined",
+    )
+
+
+def sections(user):
+    """(name, queryset) for every part of the export"""
+    user_model = get_user_model()
+    return (
+        ("profile", profile(user)),
+        ("posts", Post.objects.filter(author=user).order_by("id").values(
+            "id", "title", "content", "image", "created_at"
+        )),
+        ("comments", Comment.objects.filter(author=user).order_by(
+            "id"
+        ).values("id", "post_id", "content", "created_at")),
+        ("likes", Like.objects.filter(liker=user).order_by("id").values(
+            "id", "post_id", "created_at"
+        )),
+        ("followers", user_model.followers.through.objects.filter(
+            from_user=user
+        ).order_by("id").values(
+            user_id=F("to_user_id"), username=F("to_user__username")
+        )),
+        ("followings", user_model.followings.through.objects.filter(
+            from_user=user
+        ).order_by("id").values(
+            user_id=F("to_user_id"), username=F("to_user__username")
+        )),
+    )
+
+
+def record_count(user) -> int:
+    return sum(
+        queryset.count() for name, queryset in sections(user)
+        if name != "profile"
+    )
+
+
+def encode(record) -> bytes:
+    return (
+        json.dumps(
+            record, ensure_ascii=False, default=lambda value: value.isoformat()
+        ) + "\n"
+    ).encode()
+
+
+def ndjson_stream(user):
+    """One JSON object per line, tagged with its section"""
+    for name, queryset in sections(user):
+        for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+            yield encode({"type": name, **row})
+
+
+class StreamBuffer:
+    """Write-only file for ZipFile whose content is taken out after
+    every write, so the archive never accumulates in memory"""
+
+    def __init__(self):
+        self.chunks = []
+        self.pending = 0
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.pending += len(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.pending = 0
+        return data
+
+
+def archive_writes(user, file):
+    """Write the zip, one .ndjson per section, to a file-like object.
+    Yields after every record so that the caller can drain the file."""
+    with zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, queryset in sections(user):
+            with archive.open(f"{name}.ndjson", "w") as entry:
+                for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+                    entry.write(encode(row))
+                    yield
+
+
+def write_archive(user, file):
+    for _ in archive_writes(user, file):
+        pass
+
+
+def zip_stream(user):
+    buffer = StreamBuffer()
+    for _ in archive_writes(user, buffer):
+        if buffer.pending >= settings.PERSONAL_EXPORT_STREAM_CHUNK:
+            yield buffer.drain()
+    # Closing the archive writes the central directory
+    yield buffer.drain()
+
+
+def save_export(user, file) -> str:
+    """Save a built archive, returns its storage path"""
+    return private_storage().save(
+        f"exports/{user.id}/{uuid.uuid4()}.zip", File(file)
+    )
+
+
+def expiry_cutoff(now=None):
+    return (now or timezone.now()) - timedelta(
+        seconds=settings.PERSONAL_EXPORT_EXPIRY_SECONDS
+    )
+
+
+def open_export(path):
+    """The saved archive, None once it has expired"""
+    storage = private_storage()
+    try:
+        modified = storage.get_modified_time(path)
+    except FileNotFoundError:
+        return None
+    if modified < expiry_cutoff():
+        return None
+    return storage.open(path)
+
+
+def expire_exports(now=None) -> int:
+    """Delete the archives older than PERSONAL_EXPORT_EXPIRY_SECONDS"""
+    storage = private_storage()
+    cutoff = expiry_cutoff(now)
+    try:
+        directories, _ = storage.listdir("exports")
+    except FileNotFoundError:
+        return 0
+    expired = 0
+    for directory in directories:
+        for name in storage.listdir(f"exports/{directory}")[1]:
+            path = f"exports/{directory}/{name}"
+            if storage.get_modified_time(path) < cutoff:
+                storage.delete(path)
+                expired += 1
+    return expired
@@ -1,5 +1,7 @@
 import logging
+from django.db import transaction
 from django.utils import timezone
+from . import sync
 from .models import Post, ScheduledPost, Hashtag
 
 logger = logging.getLogger(__name__)
@@ -11,17 +13,18 @@ def save_posts():
     if scheduled_posts:
         for post in scheduled_posts:
             logger.info(f"Creating Post: {post.title}")
-            new_post = Post.objects.create(
-                title=post.title,
-                content=post.content,
-                author=post.author,
-                image=post.image,
-                created_at=post.created_at
-            )
-            hashtags = Hashtag.objects.filter(scheduled_posts=post)
-            new_post.hashtags.set(hashtags)
+            with transaction.atomic():
+                new_post = Post.objects.create(
+                    title=post.title,
+                    content=post.content,
+                    author=post.author,
+                    image=post.image,
+                    created_at=post.created_at
+                )
+                hashtags = Hashtag.objects.filter(scheduled_posts=post)
+                new_post.hashtags.set(hashtags)
+                sync.track_post(new_post)
+                post.delete()
             logger.info(f"Post Created: {new_post.title}")
-
-            post.delete()
     else:
         logger.info("There is nothing to publish")
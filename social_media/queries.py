@@ -0,0 +1,91 @@
+from django.contrib.auth import get_user_model
+from django.db.models import (
+    Count,
+    Exists,
+    IntegerField,
+    OuterRef,
+    Prefetch,
+    Subquery
+)
+from django.db.models.functions import Coalesce
+
+from .models import Post, Hashtag, Like, Comment
+
+
+def count_of(model, field):
+    """Correlated COUNT(*) that avoids multiplying joined rows"""
+    counts = model.objects.filter(**{field: OuterRef("pk")}).values(
+        field
+    ).annotate(count=Count("pk")).values("count")
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def with_post_counts(queryset):
+    """Annotations read by CountField on post serializers"""
+    return queryset.annotate(
+        likes_count=count_of(Like, "post"),
+        comments_count=count_of(Comment, "post"),
+    )
+
+
+def with_is_liked(queryset, user):
+    return queryset.annotate(
+        is_liked=Exists(
+            Like.objects.filter(liker=user, post_id=OuterRef("pk"))
+        )
+    )
+
+
+def relationship_filters(user, other):
+    """Follow rows behind RelationshipField values, `other` is a user
+    or an OuterRef"""
+    follows = get_user_model().followings.through.objects
+    return {
+        "is_following": follows.filter(from_user=user, to_user=other),
+        "follows_you": follows.filter(from_user=other, to_user=user),
+    }
+
+
+def with_relationships(queryset, user):
+    """Annotations read by RelationshipField on UserListSerializer"""
+    return queryset.annotate(**{
+        name: Exists(follows)
+        for name, follows in relationship_filters(
+            user, OuterRef("pk")
+        ).items()
+    })
+
+
+def with_user_counts(queryset):
+    """Annotations read by CountField on UserListSerializer"""
+    user_model = get_user_model()
+    return queryset.annotate(
+        posts_count=count_of(Post, "author"),
+        followers_count=count_of(
+            user_model.followers.through, "from_user"
+        ),
+        followings_count=count_of(
+            user_model.followings.through, "from_user"
+        ),
+    )
+
+
+def with_hashtag_counts(queryset):
+    return queryset.annotate(
+        posts_count=count_of(Post.hashtags.through, "hashtag")
+    )
+
+
+def hashtag_names():
+    """Hashtags of posts by name, as ValuesListSerializer lists them"""
+    return Prefetch("hashtags", queryset=Hashtag.objects.order_by("name"))
+
+
+def post_list_queryset():
+    """Posts ready for PostListSerializer with a constant number of
+    queries whatever the number of rows"""
+    return with_post_counts(
+        Post.objects.select_related("author").prefetch_related(
+            hashtag_names()
+        )
+    )
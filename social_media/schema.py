@@ -0,0 +1,111 @@
+"""OpenAPI schema generated once per code version.
+
+SpectacularAPIView introspects every view and serializer on each
+request. The schema only changes with the code, so it is written to
+SCHEMA_DIR once per code version, by the build_schema command at build
+time or by gunicorn before the workers start. SchemaView serves it from
+memory with an ETag.
+"""
+import hashlib
+import json
+import os
+from functools import lru_cache
+from importlib.metadata import version as package_version
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+from rest_framework.utils.encoders import JSONEncoder
+
+# Sources and libraries the schema is generated from
+SOURCE_DIRS = ("social_media", "social_media_api")
+PACKAGES = ("django", "djangorestframework", "drf-spectacular")
+
+RENDERED = {}
+
+
+@lru_cache(maxsize=None)
+def code_version() -> str:
+    """APP_VERSION, or a hash of the sources and library versions"""
+    if settings.APP_VERSION:
+        return settings.APP_VERSION
+    digest = hashlib.sha256()
+    for package in PACKAGES:
+        digest.update(package_version(package).encode())
+    for directory in SOURCE_DIRS:
+        for path in sorted((settings.BASE_DIR / directory).rglob("*.py")):
+            digest.update(str(path.relative_to(settings.BASE_DIR)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def schema_path(version):
+    return settings.SCHEMA_DIR / f"openapi-{version}.json"
+
+
+def generate() -> dict:
+    """The schema as the spectacular command generates it"""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    return generator.get_schema(
+        request=None, public=spectacular_settings.SERVE_PUBLIC
+    )
+
+
+def write():
+    """Generate the schema of the running code into SCHEMA_DIR"""
+    path = schema_path(code_version())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Workers read the file, only a complete one is renamed into place
+    temporary = path.with_suffix(f".{os.getpid()}.tmp")
+    temporary.write_text(json.dumps(generate(), cls=JSONEncoder))
+    os.replace(temporary, path)
+    return path
+
+
+def warm():
+    """Write the schema unless the current code version has one"""
+    path = schema_path(code_version())
+    if not path.exists():
+        path = write()
+    return path
+
+
+def rendered(renderer) -> tuple:
+    """(body, etag) of the schema in the renderer's format"""
+    key = type(renderer)
+    if key not in RENDERED:
+        schema = json.loads(warm().read_bytes())
+        body = renderer.render(schema, renderer.media_type, {})
+        etag = f'"{code_version()}-{hashlib.sha256(body).hexdigest()[:16]}"'
+        RENDERED[key] = body, etag
+    return RENDERED[key]
+
+
+def preload():
+    """Render every format so that no request pays for it"""
+    for renderer_class in SchemaView.renderer_classes:
+        rendered(renderer_class())
+
+
+class SchemaView(SpectacularAPIView):
+    """SpectacularAPIView served from the precomputed schema. The lang
+    and version parameters are ignored, there is one schema."""
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        body, etag = rendered(renderer)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type += f"; charset={renderer.charset}"
+            response = HttpResponse(body, content_type=content_type)
+            response["Content-Disposition"] = (
+                f'inline; filename="{self._get_filename(request, None)}"'
+            )
+        response["ETag"] = etag
+        return response
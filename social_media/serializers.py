@@ -1,7 +1,66 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
-from .models import Post, Hashtag, Comment, ScheduledPost
+from .models import (
+    Post,
+    Hashtag,
+    Comment,
+    DeletionJob,
+    Notification,
+    ScheduledPost,
+    UploadSession,
+    normalize_hashtag
+)
+from .queries import relationship_filters
+from .values_serializers import ValuesListSerializer
+
+
+class CountField(serializers.IntegerField):
+    """Number of related objects. Uses the `<relation>_count` annotation
+    from queries.py when the queryset has it, otherwise runs a COUNT"""
+
+    def __init__(self, relation, **kwargs):
+        self.relation = relation
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    @property
+    def annotation(self) -> str:
+        return f"{self.relation}_count"
+
+    def to_representation(self, instance):
+        count = getattr(instance, self.annotation, None)
+        if count is None:
+            count = getattr(instance, self.relation).count()
+        return count
+
+
+class RelationshipField(serializers.BooleanField):
+    """Whether the request user follows the user (is_following) or is
+    followed by them (follows_you). Uses the annotation from queries.py
+    when the queryset has it, otherwise runs an EXISTS"""
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    @property
+    def annotation(self) -> str:
+        return self.field_name
+
+    def to_representation(self, instance):
+        value = getattr(instance, self.field_name, None)
+        if value is None:
+            request = self.context.get("request")
+            if request is None or not request.user.is_authenticated:
+                return None
+            value = relationship_filters(request.user, instance)[
+                self.field_name
+            ].exists()
+        return value
 
 
 class CreateUserSerializer(serializers.ModelSerializer):
@@ -46,13 +105,11 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class UserListSerializer(UserSerializer):
-    followers = serializers.IntegerField(
-        source="followers.count", read_only=True
-    )
-    followings = serializers.IntegerField(
-        source="followings.count", read_only=True
-    )
-    posts = serializers.IntegerField(source="posts.count", read_only=True)
+    followers = CountField("followers")
+    followings = CountField("followings")
+    posts = CountField("posts")
+    is_following = RelationshipField()
+    follows_you = RelationshipField()
 
     class Meta:
         model = get_user_model()
@@ -66,7 +123,56 @@ class UserListSerializer(UserSerializer):
             "posts",
             "followers",
             "followings",
+            "is_following",
+            "follows_you",
         )
+        list_serializer_class = ValuesListSerializer
+
+
+class SuggestedUserSerializer(UserListSerializer):
+    mutual_followings = serializers.IntegerField(read_only=True)
+
+    class Meta(UserListSerializer.Meta):
+        fields = UserListSerializer.Meta.fields + ("mutual_followings",)
+
+
+class RelationshipLookupSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RELATIONSHIPS_MAX_IDS,
+    )
+
+
+class RelationshipSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    is_following = serializers.BooleanField()
+    follows_you = serializers.BooleanField()
+
+
+class BatchItemSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(
+        choices=["GET", "POST", "PUT", "PATCH", "DELETE"], default="GET"
+    )
+    path = serializers.RegexField(r"^/api/", max_length=2000)
+    body = serializers.JSONField(required=False)
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = BatchItemSerializer(many=True, allow_empty=False)
+    parallel = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                f"A batch has at most {settings.BATCH_MAX_REQUESTS} requests"
+            )
+        return value
+
+
+class BatchResultSerializer(serializers.Serializer):
+    status = serializers.IntegerField()
+    body = serializers.JSONField(allow_null=True)
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -82,18 +188,72 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ("id", "author", "content", "created_at")
 
 
+class NotificationSerializer(serializers.ModelSerializer):
+    actor = serializers.SlugRelatedField(
+        slug_field="username", read_only=True
+    )
+    updated_at = serializers.DateTimeField(
+        format="%Y-%m-%d %H:%M", read_only=True
+    )
+
+    class Meta:
+        model = Notification
+        fields = (
+            "id", "kind", "post", "actor", "count", "is_read", "updated_at"
+        )
+
+
+class DeletionJobSerializer(serializers.ModelSerializer):
+    status_url = serializers.HyperlinkedIdentityField(
+        view_name="social_media:deletion-job-detail"
+    )
+
+    class Meta:
+        model = DeletionJob
+        fields = (
+            "id",
+            "target",
+            "target_id",
+            "status",
+            "step",
+            "deleted",
+            "created_at",
+            "finished_at",
+            "status_url",
+        )
+
+
 class HashtagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Hashtag
         fields = ("id", "name")
+        # Uniqueness is checked on the normalized name in validate_name
+        extra_kwargs = {"name": {"validators": []}}
+
+    def validate_name(self, value):
+        name = normalize_hashtag(value)
+        if name == "#":
+            raise serializers.ValidationError("Hashtag name is empty")
+        # The "#" added by normalizing can push the name over the column
+        max_length = Hashtag._meta.get_field("name").max_length
+        if len(name) > max_length:
+            raise serializers.ValidationError(
+                f"Hashtag name is longer than {max_length} characters"
+            )
+        if Hashtag.objects.filter(name=name).exists():
+            raise serializers.ValidationError(
+                f"Hashtag {name} already exists"
+            )
+        return name
 
 
 class HashtagListSerializer(HashtagSerializer):
-    posts = serializers.IntegerField(source="posts.count", read_only=True)
+    posts = CountField("posts")
 
     class Meta:
         model = Hashtag
         fields = ("id", "name", "posts")
+        list_serializer_class = ValuesListSerializer
 
 
 class ScheduledPostSerializer(serializers.ModelSerializer):
@@ -132,6 +292,30 @@ class PostSerializer(serializers.ModelSerializer):
         read_only_fields = ("id", "author")
 
 
+class BulkPostItemSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=255)
+    content = serializers.CharField()
+    hashtags = serializers.ListField(
+        child=serializers.CharField(max_length=62), required=False
+    )
+    created_at = serializers.DateTimeField(required=False)
+
+
+class BulkScheduledPostItemSerializer(BulkPostItemSerializer):
+    created_at = serializers.DateTimeField()
+
+
+class BulkCreateResultSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    ids = serializers.ListField(child=serializers.IntegerField())
+
+
+class SyncPageSerializer(serializers.Serializer):
+    token = serializers.IntegerField()
+    more = serializers.BooleanField()
+    changes = serializers.ListField(child=serializers.DictField())
+
+
 class PostListSerializer(PostSerializer):
     author = serializers.SlugRelatedField(
         slug_field="username", read_only=True
@@ -139,11 +323,9 @@ class PostListSerializer(PostSerializer):
     hashtags = serializers.SlugRelatedField(
         many=True, slug_field="name", read_only=True
     )
-    likes = serializers.IntegerField(source="likes.count", read_only=True)
+    likes = CountField("likes")
     is_liked = serializers.BooleanField(read_only=True)
-    comments = serializers.IntegerField(
-        source="comments.count", read_only=True
-    )
+    comments = CountField("comments")
 
     class Meta:
         model = Post
@@ -157,6 +339,7 @@ class PostListSerializer(PostSerializer):
             "comments",
             "is_liked",
         )
+        list_serializer_class = ValuesListSerializer
 
 
 class ScheduledPostListSerializer(ScheduledPostSerializer):
@@ -215,7 +398,7 @@ class PostDetailSerializer(PostSerializer):
         slug_field="name", many=True, read_only=True
     )
     comments = CommentSerializer(many=True, read_only=True)
-    likes = serializers.IntegerField(source="likes.count", read_only=True)
+    likes = CountField("likes")
 
     class Meta:
         model = Post
@@ -249,3 +432,43 @@ class ScheduledPostDetailSerializer(ScheduledPostSerializer):
             "hashtags",
             "created_at",
         )
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = (
+            "id",
+            "target",
+            "post",
+            "filename",
+            "size",
+            "chunk_size",
+            "offset",
+            "created_at",
+        )
+        read_only_fields = ("id", "chunk_size", "offset", "created_at")
+
+    def validate_size(self, value):
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"File is larger than {settings.UPLOAD_MAX_SIZE} bytes"
+            )
+        return value
+
+    def validate(self, attrs):
+        post = attrs.get("post")
+        if attrs["target"] == UploadSession.TARGET_POST:
+            if post is None:
+                raise serializers.ValidationError(
+                    {"post": "Post is required for a post image"}
+                )
+            if post.author_id != self.context["request"].user.id:
+                raise serializers.ValidationError(
+                    {"post": "You can upload images only to your posts"}
+                )
+        elif post is not None:
+            raise serializers.ValidationError(
+                {"post": "Post must be empty for a profile image"}
+            )
+        return attrs
@@ -0,0 +1,17 @@
+'use strict';
+{
+    const $ = django.jQuery;
+
+    // Reload the changelist filtered by the object picked in an
+    // AutocompleteFilter, from the newest rows
+    $(document).on('change', 'select[data-filter-parameter]', function() {
+        const params = new URLSearchParams(window.location.search);
+        params.delete(this.dataset.filterParameter);
+        params.delete('before');
+        params.delete('p');
+        if (this.value) {
+            params.set(this.dataset.filterParameter, this.value);
+        }
+        window.location.search = params.toString();
+    });
+}
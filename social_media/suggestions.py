@@ -0,0 +1,140 @@
+"""Offline "who to follow" suggestions from friends of friends.
+
+The follow graph is loaded once into CSR arrays: the users the user at
+index i follows are targets[offsets[i]:offsets[i + 1]], as indexes into
+the sorted user_ids. Every active user is suggested the users followed
+by the most of the people they follow, and the top SUGGESTIONS_SIZE are
+stored in the cache, one packed array per user.
+"""
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+CHUNK_SIZE = 10_000
+
+
+def cache_key(user_id) -> str:
+    return f"follow-suggestions:{user_id}"
+
+
+def index_of(user_ids, user_id):
+    """Index of the id in the sorted user_ids, None if it is missing"""
+    index = bisect_left(user_ids, user_id)
+    if index < len(user_ids) and user_ids[index] == user_id:
+        return index
+    return None
+
+
+class FollowGraph:
+    def __init__(self, user_ids, active, offsets, targets):
+        self.user_ids = user_ids
+        self.active = active
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def load(cls):
+        user_model = get_user_model()
+        user_ids, active = array("q"), bytearray()
+        for user_id, is_active in user_model.objects.order_by(
+            "id"
+        ).values_list("id", "is_active").iterator(chunk_size=CHUNK_SIZE):
+            user_ids.append(user_id)
+            active.append(is_active)
+
+        offsets = array("q", [0]) * (len(user_ids) + 1)
+        targets = array("q")
+        for from_id, to_id in user_model.followings.through.objects.order_by(
+            "from_user_id", "to_user_id"
+        ).values_list("from_user_id", "to_user_id").iterator(
+            chunk_size=CHUNK_SIZE
+        ):
+            source = index_of(user_ids, from_id)
+            target = index_of(user_ids, to_id)
+            # Edges of soft-deleted users stay until their deletion job
+            # has removed them
+            if source is None or target is None:
+                continue
+            offsets[source + 1] += 1
+            targets.append(target)
+
+        # Out-degrees to running totals
+        for index in range(1, len(offsets)):
+            offsets[index] += offsets[index - 1]
+        return cls(user_ids, active, offsets, targets)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @property
+    def edges(self) -> int:
+        return len(self.targets)
+
+    def following(self, index):
+        return self.targets[self.offsets[index]:self.offsets[index + 1]]
+
+    def suggest(self, index, size) -> list:
+        """(user id, number of followed users who follow them), best first"""
+        followed = self.following(index)
+        mutual = Counter()
+        for other in followed:
+            mutual.update(self.following(other))
+
+        for known in followed:
+            mutual.pop(known, None)
+        mutual.pop(index, None)
+        best = heapq.nlargest(
+            size,
+            (
+                (count, -candidate)
+                for candidate, count in mutual.items()
+                if self.active[candidate]
+            ),
+        )
+        return [
+            (self.user_ids[-candidate], count) for count, candidate in best
+        ]
+
+
+def compute_suggestions(graph, size):
+    """(user id, suggestions) for every active user who follows someone"""
+    offsets = graph.offsets
+    for index in range(len(graph)):
+        if graph.active[index] and offsets[index + 1] > offsets[index]:
+            yield graph.user_ids[index], graph.suggest(index, size)
+
+
+def store_suggestions(suggestions, batch_size=1_000) -> int:
+    stored, batch = 0, {}
+    for user_id, suggested in suggestions:
+        batch[cache_key(user_id)] = array(
+            "q", (value for pair in suggested for value in pair)
+        ).tobytes()
+        if len(batch) >= batch_size:
+            cache.set_many(batch, timeout=None)
+            stored += len(batch)
+            batch = {}
+    cache.set_many(batch, timeout=None)
+    return stored + len(batch)
+
+
+def rebuild_suggestions() -> int:
+    graph = FollowGraph.load()
+    return store_suggestions(
+        compute_suggestions(graph, settings.SUGGESTIONS_SIZE)
+    )
+
+
+def suggestions_for(user_id) -> list:
+    """(user id, mutual count) pairs stored for the user"""
+    packed = cache.get(cache_key(user_id))
+    if not packed:
+        return []
+    values = array("q")
+    values.frombytes(packed)
+    return list(zip(values[::2], values[1::2]))
@@ -0,0 +1,192 @@
+"""Change tracking for the delta sync of offline clients.
+
+Every write to a post, comment, like or follow edge adds a Change row
+in the same transaction, deletions included as tombstones. A client
+downloads its data once, then asks GET /api/sync/?since=<token> for the
+changes after the token that concern it: its own posts and follow edges,
+the posts of the users it follows, and the comments and likes on those
+posts. Pages are read in id order from the (owner_id, id) index, at most
+SYNC_PAGE_SIZE changes each, and every page carries the token to ask
+for the next one.
+
+Ids are allocated when a row is inserted but become visible when its
+transaction commits, so changes younger than SYNC_SETTLE_SECONDS are
+held back until transactions that started before them have committed.
+Changes are kept for SYNC_RETENTION_DAYS, a client whose token is older
+has to download everything again.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Change, Comment
+from .queries import post_list_queryset, with_is_liked
+from .serializers import CommentSerializer, PostListSerializer
+
+
+class TokenExpired(Exception):
+    """The changes after the token have been pruned"""
+
+
+def track(kind, object_id, owner_id, user_id=None, deleted=False):
+    """Add a change, in the caller's transaction"""
+    Change.objects.create(
+        kind=kind,
+        object_id=object_id,
+        owner_id=owner_id,
+        user_id=user_id,
+        deleted=deleted,
+    )
+
+
+def track_post(post, deleted=False):
+    track(Change.POST, post.id, post.author_id, deleted=deleted)
+
+
+def track_posts(posts):
+    """Created posts, in one INSERT"""
+    Change.objects.bulk_create(
+        Change(kind=Change.POST, object_id=post.id, owner_id=post.author_id)
+        for post in posts
+    )
+
+
+def track_comment(comment, post, deleted=False):
+    track(Change.COMMENT, comment.id, post.author_id, deleted=deleted)
+
+
+def track_like(liker_id, post, deleted=False):
+    track(
+        Change.LIKE, post.id, post.author_id, user_id=liker_id,
+        deleted=deleted
+    )
+
+
+def track_follow(follower_id, followed_id, deleted=False):
+    track(
+        Change.FOLLOW, followed_id, follower_id, user_id=follower_id,
+        deleted=deleted
+    )
+
+
+def track_account_deleted(user_id):
+    # Sent to every client, the follow edges are removed in the background
+    track(Change.USER, user_id, None, deleted=True)
+
+
+def current_token() -> int:
+    return Change.objects.order_by("-id").values_list(
+        "id", flat=True
+    ).first() or 0
+
+
+def changes_since(user, since) -> tuple:
+    """(changes, token, more) for the page of changes after `since`
+    visible to the user, raises TokenExpired"""
+    oldest = Change.objects.order_by("id").values_list(
+        "id", flat=True
+    ).first()
+    if oldest is not None and since < oldest - 1:
+        raise TokenExpired
+
+    owners = [user.id, *user.followings.values_list("id", flat=True)]
+    rows = list(
+        Change.objects.filter(
+            Q(owner_id__in=owners) | Q(owner_id__isnull=True),
+            id__gt=since,
+        ).order_by("id")[:settings.SYNC_PAGE_SIZE + 1]
+    )
+    more = len(rows) > settings.SYNC_PAGE_SIZE
+    rows = rows[:settings.SYNC_PAGE_SIZE]
+    settled = timezone.now() - timedelta(
+        seconds=settings.SYNC_SETTLE_SECONDS
+    )
+    for index, row in enumerate(rows):
+        if row.created_at > settled:
+            rows, more = rows[:index], False
+            break
+    token = rows[-1].id if rows else since
+
+    # Only the latest change of an object, in the order of the changes
+    latest = {}
+    for row in rows:
+        key = (row.kind, row.object_id, row.user_id)
+        latest.pop(key, None)
+        latest[key] = row
+    return list(latest.values()), token, more
+
+
+def serialize(changes, request) -> list:
+    """Changes with the current data of posts and comments, those that
+    are gone by now are sent as deleted"""
+    def ids(kind):
+        return [
+            change.object_id
+            for change in changes
+            if change.kind == kind and not change.deleted
+        ]
+
+    posts, comments = {}, {}
+    post_ids, comment_ids = ids(Change.POST), ids(Change.COMMENT)
+    if post_ids:
+        queryset = with_is_liked(
+            post_list_queryset().filter(pk__in=post_ids), request.user
+        )
+        posts = {
+            item["id"]: item
+            for item in PostListSerializer(
+                queryset, many=True, context={"request": request}
+            ).data
+        }
+    if comment_ids:
+        for comment in Comment.objects.select_related("author").filter(
+            pk__in=comment_ids
+        ):
+            comments[comment.id] = {
+                **CommentSerializer(comment).data, "post": comment.post_id
+            }
+
+    result = []
+    for change in changes:
+        item = {"token": change.id, "kind": change.kind}
+        if change.kind == Change.LIKE:
+            item.update(post=change.object_id, liker=change.user_id)
+        elif change.kind == Change.FOLLOW:
+            item.update(follower=change.user_id, following=change.object_id)
+        else:
+            item["id"] = change.object_id
+        data = None
+        if change.kind == Change.POST:
+            data = posts.get(change.object_id)
+        elif change.kind == Change.COMMENT:
+            data = comments.get(change.object_id)
+        item["deleted"] = change.deleted or (
+            change.kind in (Change.POST, Change.COMMENT) and data is None
+        )
+        if data is not None:
+            item["data"] = data
+        result.append(item)
+    return result
+
+
+def prune(now=None) -> int:
+    """Delete the changes older than SYNC_RETENTION_DAYS in chunks,
+    except the newest one, which marks how far back tokens are valid"""
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=settings.SYNC_RETENTION_DAYS)
+    # Ids grow with time, the first recent change bounds the old ones
+    boundary = Change.objects.filter(created_at__gte=cutoff).order_by(
+        "id"
+    ).values_list("id", flat=True).first() or current_token()
+    pruned = 0
+    while True:
+        pks = list(
+            Change.objects.filter(id__lt=boundary).order_by(
+                "id"
+            ).values_list("id", flat=True)[:settings.DELETION_CHUNK_SIZE]
+        )
+        if not pks:
+            return pruned
+        pruned += Change.objects.filter(pk__in=pks).delete()[0]
@@ -1,7 +1,74 @@
-from .publish_delayed_posts import save_posts
+import tempfile
+
 from celery import shared_task
+from django.contrib.auth import get_user_model
+
+from . import deletion, outbox, partitions, personal_data, sync
+from .explore import compute_ranking, store_ranking
+from .publish_delayed_posts import save_posts
+from .suggestions import rebuild_suggestions
 
 
 @shared_task
 def run_sync_with_api():
     save_posts()
+
+
+@shared_task
+def build_personal_export(user_id):
+    """Write the zip archive of a large account to the private storage"""
+    user = get_user_model().objects.get(pk=user_id)
+    with tempfile.TemporaryFile() as file:
+        personal_data.write_archive(user, file)
+        file.seek(0)
+        path = personal_data.save_export(user, file)
+    return {"user_id": user_id, "path": path}
+
+
+@shared_task
+def expire_personal_exports():
+    return personal_data.expire_exports()
+
+
+@shared_task
+def rank_explore_feed():
+    ranking = compute_ranking()
+    store_ranking(ranking)
+    return len(ranking)
+
+
+@shared_task
+def rebuild_follow_suggestions():
+    return rebuild_suggestions()
+
+
+@shared_task
+def relay_outbox():
+    return outbox.relay()
+
+
+@shared_task(acks_late=True)
+def delete_in_chunks(job_id):
+    """Redelivered if the worker dies, the job resumes where it stopped"""
+    job = deletion.run(job_id)
+    return job and {"deleted": job.deleted, "status": job.status}
+
+
+@shared_task
+def resume_deletions():
+    stale = [str(pk) for pk in deletion.stale_jobs().values_list(
+        "pk", flat=True
+    )]
+    for job_id in stale:
+        delete_in_chunks.delay(job_id)
+    return len(stale)
+
+
+@shared_task
+def maintain_partitions():
+    return partitions.maintain()
+
+
+@shared_task
+def prune_changes():
+    return sync.prune()
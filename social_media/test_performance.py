@@ -0,0 +1,600 @@
+"""Query-count and latency budgets for every route in social_media/urls.py.
+
+Each method of each route is measured on a seeded social graph and again
+after the graph has grown, the number of SQL queries has to be the same
+both times and stay within the endpoint budget, so an N+1 fails the run.
+A route added without a measurement fails test_every_route_is_measured.
+
+Latency p50/p95 of read endpoints is compared with the baselines in
+PERF_BASELINE_FILE, measured on the same database vendor. A p50 slowdown
+above PERF_THRESHOLD (0.5 = 50%) or a p95 slowdown above
+PERF_P95_THRESHOLD (1.0 = 100%) fails. The limits grow with the time of
+a fixed CPU workload when it is slower than when the baselines were
+stored, so a slower machine is not taken for a regression. Run with
+PERF_UPDATE_BASELINES=1 to store the current numbers and PERF_VERBOSE=1
+to print them.
+PERF_SCALE multiplies the seeded data.
+
+    python manage.py test social_media.test_performance
+"""
+import gc
+import hashlib
+import io
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from collections import namedtuple
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, resolve, reverse
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .autocomplete import HashtagIndex
+from .explore import store_ranking
+from .personal_data import save_export
+from .suggestions import rebuild_suggestions
+from .uploads import write_chunk
+from .models import (
+    User,
+    Post,
+    Hashtag,
+    Like,
+    Comment,
+    ScheduledPost,
+    DeletionJob,
+    UploadSession,
+)
+
+SCALE = int(os.getenv("PERF_SCALE", "1"))
+ITERATIONS = int(os.getenv("PERF_ITERATIONS", "50"))
+# Untimed requests first, to fill caches and connections
+WARMUP = 3
+# Allowed slowdown per percentile, the tail varies more between runs
+THRESHOLDS = {
+    "p50": float(os.getenv("PERF_THRESHOLD", "0.5")),
+    "p95": float(os.getenv("PERF_P95_THRESHOLD", "1.0")),
+}
+BASELINE_FILE = Path(
+    os.getenv(
+        "PERF_BASELINE_FILE",
+        Path(__file__).resolve().parent / "perf_baselines.json"
+    )
+)
+UPDATE_BASELINES = os.getenv("PERF_UPDATE_BASELINES") == "1"
+VERBOSE = os.getenv("PERF_VERBOSE") == "1"
+# Latency differences below this are noise, whatever the ratio
+MIN_SLOWDOWN_MS = 2
+
+# A request body sent as is, with extra headers
+RawBody = namedtuple("RawBody", ("content", "headers"))
+
+
+def seed_graph(rng, users=20, posts_per_user=5, follows_per_user=5,
+               likes_per_post=5, comments_per_post=3, hashtags=10):
+    """Create users with a skewed follow graph, posts with hashtags,
+    likes and comments in a few bulk inserts"""
+    start = User.objects.count()
+    password = make_password("password")
+    new_users = User.objects.bulk_create(
+        User(
+            email=f"perf{index}@test.com",
+            username=f"perf{index}",
+            password=password,
+        )
+        for index in range(start, start + users)
+    )
+    all_users = list(User.objects.all())
+
+    tags_start = Hashtag.objects.count()
+    Hashtag.objects.bulk_create(
+        Hashtag(name=f"#tag{index}")
+        for index in range(tags_start, tags_start + hashtags)
+    )
+    all_tags = list(Hashtag.objects.all())
+
+    # Popular users get most of the followers
+    weights = [1 / (rank + 1) for rank in range(len(all_users))]
+    follow_rows, follower_rows = [], []
+    for user in new_users:
+        for followed in set(rng.choices(
+            all_users, weights=weights, k=follows_per_user
+        )):
+            if followed.id == user.id:
+                continue
+            follow_rows.append(
+                User.followings.through(from_user=user, to_user=followed)
+            )
+            follower_rows.append(
+                User.followers.through(from_user=followed, to_user=user)
+            )
+    User.followings.through.objects.bulk_create(follow_rows)
+    User.followers.through.objects.bulk_create(follower_rows)
+
+    posts = Post.objects.bulk_create(
+        Post(title=f"Post {index}", content="Content", author=user)
+        for user in new_users
+        for index in range(posts_per_user)
+    )
+    Post.hashtags.through.objects.bulk_create(
+        Post.hashtags.through(post=post, hashtag=hashtag)
+        for post in posts
+        for hashtag in rng.sample(all_tags, 2)
+    )
+    Like.objects.bulk_create(
+        Like(liker=liker, post=post)
+        for post in posts
+        for liker in rng.sample(all_users, likes_per_post)
+    )
+    Comment.objects.bulk_create(
+        Comment(post=post, author=rng.choice(all_users), content="Comment")
+        for post in posts
+        for _ in range(comments_per_post)
+    )
+    ScheduledPost.objects.bulk_create(
+        ScheduledPost(title="Later", content="Content", author=user)
+        for user in new_users
+    )
+
+
+def png_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def calibrate() -> float:
+    """Median time in ms of sorting a fixed list, the speed of the
+    machine at the moment"""
+    rng = random.Random(0)
+    data = [rng.random() for _ in range(20000)]
+    timings = []
+    for _ in range(21):
+        started = time.perf_counter()
+        sorted(data)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def route_methods(view) -> set:
+    """Methods a DRF view answers, None for plain Django views"""
+    if hasattr(view, "actions"):
+        return {method.upper() for method in view.actions}
+    if hasattr(view, "cls"):
+        return set(view.cls().allowed_methods) - {"HEAD", "OPTIONS"}
+    return None
+
+
+# Changes made by the measured requests are synced at once, the hashtag
+# index is built up front and not refreshed while measuring
+@override_settings(
+    SYNC_SETTLE_SECONDS=0,
+    AUTOCOMPLETE_REFRESH_SECONDS=60 * 60,
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    PRIVATE_ROOT=tempfile.mkdtemp(),
+)
+class EndpointPerformanceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rng = random.Random(42)
+        seed_graph(cls.rng, users=20 * SCALE)
+        cls.user = User.objects.first()
+        followed = User.objects.exclude(pk=cls.user.pk)[:5]
+        cls.user.followings.add(*followed)
+        for other in followed:
+            other.followers.add(cls.user)
+        cls.other = followed[0]
+        cls.post = Post.objects.filter(author=cls.other).first()
+        cls.own_post = Post.objects.filter(author=cls.user).first()
+        cls.hashtag = Hashtag.objects.first()
+        cls.scheduled_post = ScheduledPost.objects.filter(
+            author=cls.user
+        ).first()
+        cls.deletion_job = DeletionJob.objects.create(
+            target=DeletionJob.TARGET_POST, target_id=cls.post.pk
+        )
+        cls.export_path = save_export(cls.user, io.BytesIO(b"zip"))
+        store_ranking(Post.objects.values_list("id", flat=True)[:50])
+        rebuild_suggestions()
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            APIView, "get_throttles", return_value=[]
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        index = HashtagIndex()
+        index.rebuild()
+        patcher = mock.patch("social_media.autocomplete.index", index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The export built by Celery, there is no result backend here
+        patcher = mock.patch("social_media.views.AsyncResult")
+        async_result = patcher.start()
+        self.addCleanup(patcher.stop)
+        async_result.return_value.ready.return_value = True
+        async_result.return_value.failed.return_value = False
+        async_result.return_value.result = {
+            "user_id": self.user.pk, "path": self.export_path
+        }
+
+        self.anonymous = APIClient()
+        self.client = self.client_for(self.user)
+
+    @staticmethod
+    def client_for(user):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}"
+        )
+        return client
+
+    def new_user_client(self):
+        user = User.objects.create_user(
+            f"gone{time.monotonic_ns()}@test.com", "password",
+            username=f"gone{time.monotonic_ns()}"
+        )
+        return self.client_for(user)
+
+    def new_post(self):
+        return Post.objects.create(
+            title="Disposable", content="Content", author=self.user
+        ).pk
+
+    def new_scheduled_post(self):
+        return ScheduledPost.objects.create(
+            title="Disposable", content="Content", author=self.user
+        ).pk
+
+    def new_upload(self, complete=False):
+        image = png_bytes()
+        session = UploadSession.objects.create(
+            owner=self.user,
+            target=UploadSession.TARGET_USER,
+            filename="me.png",
+            size=len(image),
+            chunk_size=settings.UPLOAD_CHUNK_SIZE,
+        )
+        if complete:
+            write_chunk(
+                session,
+                io.BytesIO(image),
+                len(image),
+                hashlib.sha256(image).hexdigest(),
+            )
+        return session.pk
+
+    def endpoints(self):
+        """(name, client, method, url, data, query budget) for every
+        method of every route. Clients, urls and payloads given as
+        callables are built outside of the measured request, toggles
+        are called twice to return to the initial state."""
+        api = "social_media:"
+        post, other = self.post.pk, self.other.pk
+        own_post = self.own_post.pk
+        hashtag, scheduled = self.hashtag.pk, self.scheduled_post.pk
+        image = png_bytes()
+
+        def refresh():
+            return {"refresh": str(RefreshToken.for_user(self.user))}
+
+        def url(name, *args):
+            """The url of a disposable object, built per call"""
+            return lambda: reverse(
+                f"{api}{name}", args=[arg() for arg in args]
+            )
+
+        return [
+            ("api-root", self.client, "get", reverse(f"{api}api-root"),
+             None, 1),
+            ("user-create", self.anonymous, "post",
+             reverse(f"{api}user-create"),
+             lambda: {"username": f"new{time.monotonic_ns()}",
+                      "email": f"new{time.monotonic_ns()}@test.com",
+                      "password": "password"}, 3),
+            ("token-obtain-pair", self.anonymous, "post",
+             reverse(f"{api}token-obtain-pair"),
+             {"email": self.user.email, "password": "password"}, 2),
+            ("token-refresh", self.anonymous, "post",
+             reverse(f"{api}token-refresh"), refresh, 6),
+            ("token-verify", self.anonymous, "post",
+             reverse(f"{api}token-verify"),
+             lambda: {"token": str(AccessToken.for_user(self.user))}, 1),
+            ("logout", self.client, "post", reverse(f"{api}logout"),
+             lambda: {"refresh_token": refresh()["refresh"]}, 7),
+            ("me", self.client, "get", reverse(f"{api}me"), None, 1),
+            ("me update", self.client, "put", reverse(f"{api}me"),
+             {"username": self.user.username, "email": self.user.email,
+              "password": "password"}, 5),
+            ("me partial update", self.client, "patch", reverse(f"{api}me"),
+             {"bio": "Measured"}, 2),
+            ("me delete", self.new_user_client, "delete",
+             reverse(f"{api}me"), None, 6),
+            ("user-followers", self.client, "get",
+             reverse(f"{api}user-followers"), None, 2),
+            ("user-followings", self.client, "get",
+             reverse(f"{api}user-followings"), None, 2),
+            ("relationships", self.client, "post",
+             reverse(f"{api}relationships"),
+             {"ids": list(range(1, 200))}, 2),
+            ("follow-suggestions", self.client, "get",
+             reverse(f"{api}follow-suggestions"), None, 2),
+            ("notifications", self.client, "get",
+             reverse(f"{api}notifications"), None, 2),
+            ("read-notifications", self.client, "post",
+             reverse(f"{api}read-notifications"), None, 2),
+            ("personal-data-export", self.client, "get",
+             reverse(f"{api}personal-data-export"), None, 6),
+            ("personal-data-export-status", self.client, "get",
+             reverse(f"{api}personal-data-export-status",
+                     args=[uuid.uuid4()]), None, 1),
+            ("follow-unfollow-user (x2)", self.client, "post",
+             reverse(f"{api}follow-unfollow-user", args=[other]), None, 17),
+            ("like-unlike-post (x2)", self.client, "post",
+             reverse(f"{api}like-unlike-post", args=[post]), None, 16),
+            ("liked-posts", self.client, "get", reverse(f"{api}liked-posts"),
+             None, 3),
+            ("comment-post list", self.client, "get",
+             reverse(f"{api}comment-post", args=[post]), None, 3),
+            ("comment-post create", self.client, "post",
+             reverse(f"{api}comment-post", args=[post]),
+             {"content": "Nice"}, 7),
+            ("deletion-job-detail", self.anonymous, "get",
+             reverse(f"{api}deletion-job-detail",
+                     args=[self.deletion_job.pk]), None, 1),
+            ("user-list", self.client, "get", reverse(f"{api}user-list"),
+             None, 2),
+            ("user-detail", self.client, "get",
+             reverse(f"{api}user-detail", args=[other]), None, 6),
+            ("post-list", self.client, "get", reverse(f"{api}post-list"),
+             None, 3),
+            ("post-bulk", self.client, "post", reverse(f"{api}post-bulk"),
+             [{"title": f"Bulk {index}", "content": "#bulk content",
+               "hashtags": [f"tag{index}"]} for index in range(50)], 7),
+            ("post-explore", self.client, "get",
+             reverse(f"{api}post-explore"), None, 3),
+            ("post-detail", self.client, "get",
+             reverse(f"{api}post-detail", args=[post]), None, 9),
+            ("post update", self.client, "put",
+             reverse(f"{api}post-detail", args=[own_post]),
+             {"title": "Updated", "content": "Content",
+              "created_at": "2024-01-01T00:00"}, 8),
+            ("post partial update", self.client, "patch",
+             reverse(f"{api}post-detail", args=[own_post]),
+             {"content": "Updated"}, 8),
+            ("post delete", self.client, "delete",
+             url("post-detail", self.new_post), None, 8),
+            ("hashtag-list", self.client, "get",
+             reverse(f"{api}hashtag-list"), None, 2),
+            ("hashtag-create", self.client, "post",
+             reverse(f"{api}hashtag-list"),
+             lambda: {"name": f"new{time.monotonic_ns()}"}, 3),
+            ("hashtag-detail", self.client, "get",
+             reverse(f"{api}hashtag-detail", args=[hashtag]), None, 4),
+            ("hashtag-autocomplete", self.client, "get",
+             reverse(f"{api}hashtag-autocomplete"), {"q": "#tag"}, 1),
+            ("scheduledpost-list", self.client, "get",
+             reverse(f"{api}scheduledpost-list"), None, 3),
+            ("scheduledpost-create", self.client, "post",
+             reverse(f"{api}scheduledpost-list"),
+             {"title": "Later", "content": "Content",
+              "created_at": "2030-01-01T00:00"}, 3),
+            ("scheduledpost-bulk", self.client, "post",
+             reverse(f"{api}scheduledpost-bulk"),
+             [{"title": f"Later {index}", "content": "#later content",
+               "created_at": "2030-01-01T00:00"} for index in range(50)],
+             6),
+            ("scheduledpost-detail", self.client, "get",
+             reverse(f"{api}scheduledpost-detail", args=[scheduled]),
+             None, 8),
+            ("scheduledpost update", self.client, "put",
+             reverse(f"{api}scheduledpost-detail", args=[scheduled]),
+             {"title": "Updated", "content": "Content",
+              "created_at": "2030-01-01T00:00"}, 5),
+            ("scheduledpost partial update", self.client, "patch",
+             reverse(f"{api}scheduledpost-detail", args=[scheduled]),
+             {"content": "Updated"}, 5),
+            ("scheduledpost delete", self.client, "delete",
+             url("scheduledpost-detail", self.new_scheduled_post), None, 5),
+            ("uploadsession-create", self.client, "post",
+             reverse(f"{api}uploadsession-list"),
+             {"target": "user", "filename": "me.png", "size": 10}, 2),
+            ("uploadsession-detail", self.client, "get",
+             url("uploadsession-detail", self.new_upload), None, 2),
+            ("uploadsession delete", self.client, "delete",
+             url("uploadsession-detail", self.new_upload), None, 3),
+            ("uploadsession-chunk", self.client, "put",
+             url("uploadsession-chunk", self.new_upload),
+             RawBody(image, {
+                 "HTTP_UPLOAD_OFFSET": "0",
+                 "HTTP_UPLOAD_CHECKSUM": hashlib.sha256(image).hexdigest(),
+             }), 5),
+            ("uploadsession-commit", self.client, "post",
+             url("uploadsession-commit",
+                 lambda: self.new_upload(complete=True)), None, 7),
+            ("batch", self.client, "post", reverse(f"{api}batch"),
+             {"requests": [
+                 {"path": reverse(f"{api}me")},
+                 {"path": reverse(f"{api}post-list")},
+                 {"path": reverse(f"{api}post-detail", args=[post])},
+             ]}, 12),
+            ("event-stream", self.client, "get",
+             reverse(f"{api}event-stream"), None, 2),
+            ("async-post-list", self.client, "get",
+             reverse(f"{api}async-post-list"), None, 3),
+            ("async-post-detail", self.client, "get",
+             reverse(f"{api}async-post-detail", args=[post]), None, 9),
+            ("async-like-unlike-post (x2)", self.client, "post",
+             reverse(f"{api}async-like-unlike-post", args=[post]),
+             None, 16),
+            ("async-follow-unfollow-user (x2)", self.client, "post",
+             reverse(f"{api}async-follow-unfollow-user", args=[other]),
+             None, 17),
+            ("sync", self.client, "get", reverse(f"{api}sync"),
+             {"since": 0}, 7),
+        ]
+
+    @staticmethod
+    def build(value):
+        """Clients, urls and payloads that create tokens or rows are
+        built outside of the measured request"""
+        return value() if callable(value) else value
+
+    @staticmethod
+    def call(client, method, url, data):
+        if isinstance(data, RawBody):
+            response = getattr(client, method)(
+                url, data.content,
+                content_type="application/octet-stream", **data.headers
+            )
+        else:
+            response = getattr(client, method)(url, data, format="json")
+        # Streamed bodies (exports, events) are not read
+        assert response.status_code < 400, (url, response.status_code)
+        return response
+
+    def count_queries(self, name, client, method, url, data):
+        calls = 2 if name.endswith("(x2)") else 1
+        requests = [
+            (self.build(client), self.build(url), self.build(data))
+            for _ in range(calls)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            for client, url, data in requests:
+                self.call(client, method, url, data)
+        return len(queries)
+
+    def test_every_route_is_measured(self):
+        measured = {}
+        for _, _, method, url, _, _ in self.endpoints():
+            name = resolve(self.build(url)).url_name
+            measured.setdefault(name, set()).add(method.upper())
+
+        _, api = get_resolver().namespace_dict["social_media"]
+        for pattern in api.url_patterns:
+            with self.subTest(route=pattern.name):
+                self.assertIn(pattern.name, measured)
+                methods = route_methods(pattern.callback)
+                if methods is not None:
+                    self.assertLessEqual(methods, measured[pattern.name])
+
+    def test_query_counts_do_not_depend_on_data_size(self):
+        small = {
+            endpoint[0]: self.count_queries(*endpoint[:5])
+            for endpoint in self.endpoints()
+        }
+
+        seed_graph(self.rng, users=60 * SCALE, likes_per_post=15)
+
+        for name, client, method, url, data, budget in self.endpoints():
+            with self.subTest(endpoint=name):
+                large = self.count_queries(name, client, method, url, data)
+                self.assertEqual(
+                    small[name], large,
+                    f"{name}: {small[name]} queries on the small graph, "
+                    f"{large} on the large one"
+                )
+                self.assertLessEqual(large, budget)
+
+    def measure(self, client, method, url, data) -> dict:
+        """p50, p95 and p99 in ms of ITERATIONS requests"""
+        timings = []
+        for iteration in range(WARMUP + ITERATIONS):
+            request = (
+                self.build(client), method, self.build(url),
+                self.build(data)
+            )
+            # Collection pauses of the test process are not request time
+            gc.disable()
+            try:
+                started = time.perf_counter()
+                self.call(*request)
+                elapsed = time.perf_counter() - started
+            finally:
+                gc.enable()
+            if iteration >= WARMUP:
+                timings.append(elapsed * 1000)
+        percentiles = statistics.quantiles(timings, n=100)
+        return {
+            "p50": round(statistics.median(timings), 2),
+            "p95": round(percentiles[94], 2),
+            "p99": round(percentiles[98], 2),
+        }
+
+    def test_latency_within_baseline(self):
+        reads = {
+            name: (client, method, url, data)
+            for name, client, method, url, data, _ in self.endpoints()
+            if method == "get"
+        }
+        calibration = calibrate()
+        results = {
+            name: self.measure(*request) for name, request in reads.items()
+        }
+        calibration = round((calibration + calibrate()) / 2, 3)
+        if VERBOSE:
+            for name, result in results.items():
+                print(
+                    f"{name:<32} p50 {result['p50']:>8.2f} ms  "
+                    f"p95 {result['p95']:>8.2f} ms  "
+                    f"p99 {result['p99']:>8.2f} ms"
+                )
+
+        if UPDATE_BASELINES:
+            BASELINE_FILE.write_text(json.dumps(
+                {
+                    "database": connection.vendor,
+                    "calibration": calibration,
+                    "endpoints": results,
+                },
+                indent=2
+            ) + "\n")
+            return
+
+        if not BASELINE_FILE.exists():
+            self.skipTest(f"No baselines in {BASELINE_FILE}")
+        baselines = json.loads(BASELINE_FILE.read_text())
+        # Latencies of another database are not comparable
+        if baselines["database"] != connection.vendor:
+            self.skipTest(
+                f"Baselines were measured on {baselines['database']}"
+            )
+        slowdown = max(1, calibration / baselines["calibration"])
+
+        for name, result in results.items():
+            baseline = baselines["endpoints"].get(name)
+            if baseline is None:
+                continue
+            limits = {
+                percentile: slowdown * max(
+                    baseline[percentile] * (1 + threshold),
+                    baseline[percentile] + MIN_SLOWDOWN_MS
+                )
+                for percentile, threshold in THRESHOLDS.items()
+            }
+            if any(result[key] > limit for key, limit in limits.items()):
+                # A slow round is measured again before it fails, a
+                # pause of the machine is not a regression
+                retry = self.measure(*reads[name])
+                result = {key: min(result[key], retry[key]) for key in result}
+            for percentile, limit in limits.items():
+                with self.subTest(endpoint=name, percentile=percentile):
+                    self.assertLessEqual(
+                        result[percentile], limit,
+                        f"{name} {percentile} {result[percentile]} ms, "
+                        f"baseline {baseline[percentile]} ms, machine "
+                        f"{slowdown:.2f}x slower"
+                    )
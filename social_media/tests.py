@@ -1,3 +1,2490 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import hashlib
+import importlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+import zipfile
+from pathlib import Path
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import (
+    AsyncClient,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ListSerializer
+from rest_framework.test import APIClient, APIRequestFactory
+from django.utils import timezone
+from PIL import Image
+from prometheus_client import REGISTRY
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .admin import PostAdmin
+from .autocomplete import HashtagIndex
+from .bulk_posts import create_posts, upsert_hashtags
+from .db_router import ReplicaRouter
+from .deletion import (
+    delete_chunk,
+    run,
+    soft_delete_post,
+    soft_delete_user,
+    stale_jobs,
+)
+from .events import MemoryBroker, RedisBroker, event_stream
+from .explore import compute_ranking, store_ranking
+from .media import private_storage
+from .metrics import (
+    get_registry,
+    start_worker_metrics_server,
+    task_finished,
+    task_started,
+)
+from .middleware import pin_key
+from .models import (
+    User,
+    Post,
+    Like,
+    Comment,
+    Hashtag,
+    ScheduledPost,
+    Notification,
+    OutboxEvent,
+    DeletionJob,
+    Change,
+    UploadSession,
+)
+from .outbox import follow, like, relay, unfollow, unlike
+from .partitions import maintain, month_start, save_archive
+from .personal_data import expire_exports
+from .queries import (
+    post_list_queryset,
+    with_hashtag_counts,
+    with_is_liked,
+    with_relationships,
+    with_user_counts,
+)
+from . import db_router, schema
+from .renderers import ORJSONRenderer
+from .serializers import (
+    HashtagListSerializer,
+    PostListSerializer,
+    UserListSerializer,
+)
+from .suggestions import FollowGraph, rebuild_suggestions
+from .sync import prune
+from .tasks import build_personal_export
+from .throttling import LocalGCRALimiter, UserGCRAThrottle
+
+ROUTER = "social_media.db_router"
+
+
+class ReplicaRouterSpy(ReplicaRouter):
+    """Records the alias ReplicaRouter picks, but serves every query
+    from the test database"""
+
+    chosen = []
+
+    def db_for_read(self, model, **hints):
+        self.chosen.append(super().db_for_read(model, **hints))
+        return self.primary
+
+
+@override_settings(
+    DATABASE_ROUTERS=[f"{__name__}.ReplicaRouterSpy"],
+    DATABASE_REPLICAS=["replica"],
+    REPLICA_PIN_SECONDS=5,
+)
+class ReplicaRoutingTests(TestCase):
+    """Routing between the "default" primary and a "replica" alias"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            "reader@test.com", "password", username="reader"
+        )
+        self.post = Post.objects.create(
+            title="Post", content="Content", author=self.user
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+
+    def get_posts(self):
+        ReplicaRouterSpy.chosen.clear()
+        response = self.client.get(reverse("social_media:post-list"))
+        self.assertEqual(response.status_code, 200)
+        return set(ReplicaRouterSpy.chosen)
+
+    @mock.patch(f"{ROUTER}.is_healthy", return_value=True)
+    def test_safe_request_reads_from_replica(self, _):
+        self.assertEqual(self.get_posts(), {"replica"})
+
+    @mock.patch(f"{ROUTER}.is_healthy", return_value=True)
+    def test_user_is_pinned_to_primary_after_write(self, _):
+        response = self.client.post(
+            reverse("social_media:like-unlike-post", args=[self.post.id])
+        )
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.get_posts(), {"default"})
+
+    @mock.patch(f"{ROUTER}.is_healthy", return_value=True)
+    def test_pin_is_per_user(self, _):
+        cache.set("db-primary-pin:0", 1)
+
+        self.assertEqual(self.get_posts(), {"replica"})
+
+    @mock.patch(f"{ROUTER}.is_healthy", return_value=False)
+    def test_unhealthy_replica_falls_back_to_primary(self, _):
+        self.assertEqual(self.get_posts(), {"default"})
+
+    def test_unknown_replica_is_unhealthy(self):
+        with override_settings(DATABASE_REPLICAS=["missing"]):
+            self.assertEqual(self.get_posts(), {"default"})
+
+    @mock.patch(f"{ROUTER}.is_healthy", return_value=True)
+    def test_reads_outside_requests_use_primary(self, _):
+        self.assertEqual(ReplicaRouter().db_for_read(Post), "default")
+
+    def test_malformed_authorization_header_is_left_to_drf(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer")
+
+        response = self.client.get(reverse("social_media:post-list"))
+
+        self.assertEqual(response.status_code, 401)
+
+
+REPLICA = "replica"
+
+
+def fail_first_query(queries):
+    """execute_wrapper of a replica that drops the first query"""
+    def wrapper(execute, sql, params, many, context):
+        queries.append(sql)
+        if len(queries) == 1:
+            raise OperationalError("server closed the connection")
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_PIN_SECONDS=5)
+class ReplicaConnectionTests(TransactionTestCase):
+    """Routing with a second connection to the test database as the
+    replica, committed rows are visible on both. The alias is added once
+    the test databases exist and removed before they are torn down."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings[REPLICA] = {
+            **connections["default"].settings_dict,
+            "TEST": {
+                **connections["default"].settings_dict["TEST"],
+                "MIRROR": "default",
+            },
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        db_router._replica_health.clear()
+        self.user = User.objects.create_user(
+            "replica@test.com", "password", username="replica"
+        )
+        self.post = Post.objects.create(
+            title="Post", content="Content", author=self.user
+        )
+        self.client = APIClient(raise_request_exception=False)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+
+    def queries(self, send):
+        """(response, queries on the primary, queries on the replica)"""
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections[REPLICA]) as replica:
+                response = send()
+        return response, len(primary), len(replica)
+
+    def batch(self, *items):
+        return self.client.post(
+            reverse("social_media:batch"),
+            {"requests": list(items)},
+            format="json"
+        )
+
+    def test_safe_request_reads_from_replica(self):
+        response, primary, replica = self.queries(
+            lambda: self.client.get(reverse("social_media:post-list"))
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["title"], "Post")
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_replica_failing_mid_query_falls_back_to_primary(self):
+        self.assertTrue(db_router.is_healthy(REPLICA))
+        failed = []
+        with connections[REPLICA].execute_wrapper(fail_first_query(failed)):
+            with self.assertLogs("django.request", "ERROR"):
+                with self.assertLogs(db_router.logger, "WARNING"):
+                    response, primary, _ = self.queries(
+                        lambda: self.client.get(
+                            reverse("social_media:post-list")
+                        )
+                    )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["title"], "Post")
+        self.assertGreater(primary, 0)
+        self.assertNotIn(REPLICA, db_router._replica_health)
+
+    def test_read_only_batch_reads_from_replica_and_does_not_pin(self):
+        response, primary, replica = self.queries(lambda: self.batch(
+            {"path": reverse("social_media:post-list")},
+            {"path": reverse("social_media:me")},
+        ))
+
+        self.assertEqual(
+            [result["status"] for result in response.data], [200, 200]
+        )
+        self.assertGreater(replica, 0)
+        self.assertIsNone(cache.get(pin_key(self.user.id)))
+
+    def test_batch_reads_after_a_write_use_primary_and_pin(self):
+        like = reverse("social_media:like-unlike-post", args=[self.post.id])
+        post_url = reverse("social_media:post-detail", args=[self.post.id])
+
+        response, _, replica = self.queries(lambda: self.batch(
+            {"method": "POST", "path": like},
+            {"path": post_url},
+        ))
+
+        self.assertEqual(
+            [result["status"] for result in response.data], [201, 200]
+        )
+        self.assertEqual(response.data[1]["body"]["likes"], 1)
+        self.assertEqual(replica, 0)
+        self.assertTrue(cache.get(pin_key(self.user.id)))
+
+
+class TenPerMinuteThrottle(UserGCRAThrottle):
+    THROTTLE_RATES = {"user": "10/min"}
+
+
+@override_settings(
+    THROTTLE_REDIS_URL=None,
+    THROTTLE_COSTS={"social_media:like-unlike-post": 5},
+)
+class GCRAThrottleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "throttled@test.com", "password", username="throttled"
+        )
+        self.limiter = LocalGCRALimiter()
+        patcher = mock.patch(
+            "social_media.throttling.local_limiter", self.limiter
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def check(self, path):
+        request = APIRequestFactory().post(path)
+        request.user = self.user
+        request.resolver_match = resolve(path)
+        throttle = TenPerMinuteThrottle()
+        return throttle.allow_request(request, view=None), throttle.wait()
+
+    def test_allows_burst_up_to_rate(self):
+        results = [self.check("/api/posts/")[0] for _ in range(11)]
+
+        self.assertEqual(results, [True] * 10 + [False])
+
+    def test_weighted_requests_use_more_of_the_limit(self):
+        like = reverse("social_media:like-unlike-post", args=[1])
+
+        self.assertTrue(self.check(like)[0])
+        self.assertTrue(self.check(like)[0])
+        allowed, wait = self.check(like)
+
+        self.assertFalse(allowed)
+        self.assertEqual(wait, 30)
+
+
+@override_settings(THROTTLE_REDIS_URL=None)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "async@test.com", "password", username="async"
+        )
+        self.author = User.objects.create_user(
+            "author@test.com", "password", username="author"
+        )
+        self.post = Post.objects.create(
+            title="Post", content="Content", author=self.author
+        )
+        self.client = AsyncClient()
+        self.headers = {
+            "Authorization": f"Bearer {AccessToken.for_user(self.user)}"
+        }
+        self.like_url = reverse(
+            "social_media:async-like-unlike-post", args=[self.post.pk]
+        )
+        self.follow_url = reverse(
+            "social_media:async-follow-unfollow-user", args=[self.author.pk]
+        )
+        patcher = mock.patch(
+            "social_media.throttling.local_limiter", LocalGCRALimiter()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, url):
+        return self.client.post(url, headers=self.headers)
+
+    async def test_like_unlike(self):
+        liked = await self.send(self.like_url)
+        self.assertEqual(liked.status_code, 201)
+        self.assertTrue(await Like.objects.filter(
+            liker=self.user, post=self.post
+        ).aexists())
+        self.assertTrue(await OutboxEvent.objects.filter(
+            kind=OutboxEvent.LIKE, actor=self.user
+        ).aexists())
+
+        unliked = await self.send(self.like_url)
+        self.assertEqual(unliked.status_code, 204)
+        self.assertFalse(await Like.objects.filter(
+            liker=self.user, post=self.post
+        ).aexists())
+
+        missing = await self.send(
+            reverse("social_media:async-like-unlike-post", args=[0])
+        )
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_follow_unfollow(self):
+        followed = await self.send(self.follow_url)
+        self.assertEqual(
+            followed.json(), {"message": "You are following author"}
+        )
+        self.assertTrue(await self.author.followers.filter(
+            pk=self.user.pk
+        ).aexists())
+
+        unfollowed = await self.send(self.follow_url)
+        self.assertEqual(
+            unfollowed.json(),
+            {"message": "You are not following author anymore"}
+        )
+        self.assertFalse(await self.author.followers.filter(
+            pk=self.user.pk
+        ).aexists())
+
+    async def test_authentication_and_method(self):
+        anonymous = await AsyncClient().post(self.like_url)
+        wrong_method = await self.client.get(
+            self.like_url, headers=self.headers
+        )
+
+        self.assertEqual(anonymous.status_code, 401)
+        self.assertEqual(wrong_method.status_code, 405)
+
+    @mock.patch.object(UserGCRAThrottle, "THROTTLE_RATES", {"user": "10/min"})
+    async def test_throttled_with_the_drf_views(self):
+        # Five requests each, the sync and async views share the limit
+        sync_client = APIClient()
+        sync_client.force_authenticate(self.user)
+        await sync_to_async(sync_client.post)(reverse(
+            "social_media:like-unlike-post", args=[self.post.pk]
+        ))
+
+        allowed = await self.send(self.follow_url)
+        throttled = await self.send(self.like_url)
+
+        self.assertEqual(allowed.status_code, 200)
+        self.assertEqual(throttled.status_code, 429)
+        self.assertEqual(throttled["Retry-After"], "30")
+        # The throttled request did not remove the like
+        self.assertTrue(await Like.objects.filter(
+            liker=self.user, post=self.post
+        ).aexists())
+
+
+@override_settings(
+    EXPLORE_WINDOW_HOURS=72,
+    EXPLORE_HALF_LIFE_HOURS=12,
+    EXPLORE_COMMENT_WEIGHT=2,
+)
+class ExploreFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            "explorer@test.com", "password", username="explorer"
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.now = timezone.now()
+
+    def create_post(self, hours_ago, likes=0, comments=0):
+        post = Post.objects.create(
+            title="Post", content="Content", author=self.user,
+            created_at=self.now - timedelta(hours=hours_ago),
+        )
+        for index in range(likes):
+            liker = User.objects.create_user(
+                f"liker{post.pk}-{index}@test.com", "password",
+                username=f"liker{post.pk}-{index}"
+            )
+            Like.objects.create(liker=liker, post=post)
+        for _ in range(comments):
+            Comment.objects.create(
+                post=post, author=self.user, content="Comment"
+            )
+        return post
+
+    def test_engagement_decays_with_age(self):
+        fresh = self.create_post(hours_ago=1, likes=2)
+        old_popular = self.create_post(hours_ago=48, likes=8)
+        commented = self.create_post(hours_ago=1, comments=2)
+        self.create_post(hours_ago=100, likes=20)
+        self.create_post(hours_ago=1)
+
+        self.assertEqual(
+            compute_ranking(self.now),
+            [commented.pk, fresh.pk, old_popular.pk]
+        )
+
+    def test_future_dated_post_does_not_outrank_popular_one(self):
+        popular = self.create_post(hours_ago=1, likes=50)
+        self.create_post(hours_ago=-7 * 24, likes=1)
+
+        self.assertEqual(compute_ranking(self.now), [popular.pk])
+
+    def test_explore_serves_pages_of_stored_ranking(self):
+        first = self.create_post(hours_ago=1)
+        second = self.create_post(hours_ago=2)
+        Like.objects.create(liker=self.user, post=second)
+        deleted = self.create_post(hours_ago=3)
+        store_ranking([second.pk, deleted.pk, first.pk])
+        deleted.delete()
+
+        url = reverse("social_media:post-explore")
+        response = self.client.get(url, {"limit": 2})
+        next_page = self.client.get(url, {"offset": 2, "limit": 2})
+
+        self.assertEqual([post["id"] for post in response.data], [second.pk])
+        self.assertTrue(response.data[0]["is_liked"])
+        self.assertEqual([post["id"] for post in next_page.data], [first.pk])
+
+
+class FollowSuggestionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = {
+            name: User.objects.create_user(
+                f"{name}@test.com", "password", username=name
+            )
+            for name in ("me", "ann", "bob", "cat", "dan", "eve")
+        }
+
+    def follow(self, follower, followed):
+        follower, followed = self.users[follower], self.users[followed]
+        follower.followings.add(followed)
+        followed.followers.add(follower)
+
+    def test_ranked_by_followed_users_who_follow_them(self):
+        self.follow("me", "ann")
+        self.follow("me", "bob")
+        self.follow("ann", "cat")
+        self.follow("bob", "cat")
+        self.follow("ann", "dan")
+        self.follow("ann", "me")
+        self.follow("bob", "ann")
+        self.follow("dan", "eve")
+        self.users["dan"].is_active = False
+        self.users["dan"].save()
+
+        graph = FollowGraph.load()
+        me = graph.user_ids.index(self.users["me"].id)
+
+        self.assertEqual(graph.edges, 8)
+        self.assertEqual(graph.suggest(me, 10), [(self.users["cat"].id, 2)])
+
+    def test_edges_of_soft_deleted_users_are_skipped(self):
+        self.follow("me", "ann")
+        self.follow("ann", "bob")
+        self.follow("ann", "eve")
+        self.follow("ann", "cat")
+        self.follow("bob", "cat")
+        self.follow("eve", "cat")
+        # The highest id and one in the middle
+        User.all_objects.filter(
+            pk__in=[self.users["bob"].pk, self.users["eve"].pk]
+        ).update(deleted_at=timezone.now())
+
+        graph = FollowGraph.load()
+        me = graph.user_ids.index(self.users["me"].id)
+
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph.edges, 2)
+        self.assertEqual(graph.suggest(me, 10), [(self.users["cat"].id, 1)])
+
+    def test_endpoint_reads_stored_suggestions(self):
+        self.follow("me", "ann")
+        self.follow("ann", "cat")
+        self.follow("ann", "bob")
+        rebuild_suggestions()
+        # Followed after the job ran
+        self.follow("me", "bob")
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=(
+            f"Bearer {AccessToken.for_user(self.users['me'])}"
+        ))
+        response = client.get(reverse("social_media:follow-suggestions"))
+
+        self.assertEqual(
+            [(user["username"], user["mutual_followings"])
+             for user in response.data],
+            [("cat", 1)]
+        )
+
+
+class RelationshipTests(TestCase):
+    def setUp(self):
+        self.me, self.friend, self.fan, self.idol = (
+            User.objects.create_user(
+                f"{name}@test.com", "password", username=name
+            )
+            for name in ("me", "friend", "fan", "idol")
+        )
+        for follower, followed in (
+            (self.me, self.friend), (self.friend, self.me),
+            (self.fan, self.me), (self.me, self.idol),
+        ):
+            follower.followings.add(followed)
+            followed.followers.add(follower)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.me)}"
+        )
+
+    def test_user_list_is_annotated(self):
+        response = self.client.get(reverse("social_media:user-list"))
+
+        self.assertEqual(
+            {user["username"]: (user["is_following"], user["follows_you"])
+             for user in response.data},
+            {
+                "me": (False, False),
+                "friend": (True, True),
+                "fan": (False, True),
+                "idol": (True, False),
+            }
+        )
+
+    def test_bulk_lookup(self):
+        url = reverse("social_media:relationships")
+        response = self.client.post(
+            url, {"ids": [self.fan.id, self.idol.id, 999]}, format="json"
+        )
+
+        self.assertEqual(response.data, [
+            {"id": self.fan.id, "is_following": False, "follows_you": True},
+            {"id": self.idol.id, "is_following": True, "follows_you": False},
+        ])
+        too_many = self.client.post(
+            url, {"ids": list(range(1, 502))}, format="json"
+        )
+        self.assertEqual(too_many.status_code, 400)
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "batcher@test.com", "password", username="batcher"
+        )
+        self.post = Post.objects.create(
+            title="Post", content="Content", author=self.user
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.url = reverse("social_media:batch")
+
+    def test_sub_requests_share_authentication(self):
+        post_url = reverse("social_media:post-detail", args=[self.post.pk])
+        response = self.client.post(self.url, {"requests": [
+            {"path": reverse("social_media:me")},
+            {"path": post_url},
+            {"method": "POST",
+             "path": reverse("social_media:comment-post",
+                             args=[self.post.pk]),
+             "body": {"content": "Batched"}},
+            {"method": "DELETE", "path": post_url},
+            {"path": post_url},
+            {"path": "/api/missing/"},
+        ]}, format="json")
+
+        self.assertEqual(
+            [result["status"] for result in response.data],
+            [200, 200, 201, 202, 404, 404]
+        )
+        self.assertEqual(response.data[0]["body"]["username"], "batcher")
+        self.assertEqual(response.data[2]["body"]["content"], "Batched")
+
+    def test_batch_cannot_nest_or_exceed_the_cap(self):
+        nested = self.client.post(
+            self.url, {"requests": [{"path": self.url}]}, format="json"
+        )
+        with self.settings(BATCH_MAX_REQUESTS=2):
+            too_many = self.client.post(
+                self.url,
+                {"requests": [{"path": reverse("social_media:me")}] * 3},
+                format="json"
+            )
+
+        self.assertEqual(nested.data[0]["status"], 400)
+        self.assertEqual(too_many.status_code, 400)
+
+
+class BulkPostTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "bulk@test.com", "password", username="bulk"
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        Hashtag.objects.create(name="Python")
+
+    def test_hashtags_are_normalized_and_reused(self):
+        response = self.client.post(
+            reverse("social_media:post-bulk"),
+            [
+                {"title": "One", "content": "About #PYTHON",
+                 "hashtags": ["django", "#Django "]},
+                {"title": "Two", "content": "No tags"},
+                {"title": "Three", "content": "#new and #python"},
+            ],
+            format="json"
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 3)
+        self.assertEqual(
+            sorted(Hashtag.objects.values_list("name", flat=True)),
+            ["#django", "#new", "#python"]
+        )
+        posts = Post.objects.filter(pk__in=response.data["ids"])
+        self.assertEqual(
+            {post.title: sorted(tag.name for tag in post.hashtags.all())
+             for post in posts},
+            {
+                "One": ["#django", "#python"],
+                "Two": [],
+                "Three": ["#new", "#python"],
+            }
+        )
+
+    def test_scheduled_posts_need_a_date(self):
+        url = reverse("social_media:scheduledpost-bulk")
+        missing = self.client.post(
+            url, [{"title": "Later", "content": "#soon"}], format="json"
+        )
+        created = self.client.post(
+            url,
+            [{"title": "Later", "content": "#soon",
+              "created_at": "2030-01-01T10:00:00Z"}],
+            format="json"
+        )
+
+        self.assertEqual(missing.status_code, 400)
+        self.assertEqual(created.status_code, 201)
+        scheduled = ScheduledPost.objects.get(author=self.user)
+        self.assertEqual(
+            list(scheduled.hashtags.values_list("name", flat=True)),
+            ["#soon"]
+        )
+
+    def test_duplicate_hashtag_is_rejected(self):
+        response = self.client.post(
+            reverse("social_media:hashtag-list"), {"name": "#PYTHON"}
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_hashtag_length_is_checked_after_normalizing(self):
+        url = reverse("social_media:hashtag-list")
+        too_long = self.client.post(url, {"name": "a" * 63})
+        longest = self.client.post(url, {"name": "b" * 62})
+
+        self.assertEqual(too_long.status_code, 400)
+        self.assertEqual(longest.status_code, 201)
+        self.assertEqual(longest.data["name"], "#" + "b" * 62)
+
+
+class HashtagMigrationTests(TransactionTestCase):
+    before = [("social_media", "0002_upload_session")]
+    after = [("social_media", "0003_unique_hashtag_name")]
+
+    def tearDown(self):
+        call_command("migrate", "social_media", verbosity=0)
+
+    def test_duplicates_are_merged_before_the_unique_index(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        user = apps.get_model("social_media", "User")._base_manager.create(
+            email="tagger@test.com", username="tagger"
+        )
+        Hashtag = apps.get_model("social_media", "Hashtag")
+        Post = apps.get_model("social_media", "Post")
+        python = Hashtag.objects.create(name="#python")
+        Post.objects.create(
+            title="Post", content="C", author=user
+        ).hashtags.add(python, Hashtag.objects.create(name="Python"))
+        Post.objects.create(
+            title="Other", content="C", author=user
+        ).hashtags.add(Hashtag.objects.create(name="PYTHON"))
+        Hashtag.objects.create(name="x" * 63)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        apps = executor.loader.project_state(self.after).apps
+        Hashtag = apps.get_model("social_media", "Hashtag")
+
+        self.assertEqual(
+            sorted(Hashtag.objects.values_list("name", flat=True)),
+            ["#python", "#" + "x" * 62]
+        )
+        self.assertEqual(
+            Hashtag.objects.get(name="#python").posts.count(), 2
+        )
+
+
+@override_settings(
+    AUTOCOMPLETE_REFRESH_SECONDS=60,
+    AUTOCOMPLETE_REBUILD_SECONDS=600,
+)
+class HashtagAutocompleteTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch("social_media.autocomplete.index", HashtagIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(
+            "typer@test.com", "password", username="typer"
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.url = reverse("social_media:hashtag-autocomplete")
+        for name, posts in (("python", 1), ("pytest", 3), ("pypy", 0),
+                            ("django", 5)):
+            hashtag = Hashtag.objects.create(name=name)
+            for _ in range(posts):
+                Post.objects.create(
+                    title="Post", content="Content", author=self.user
+                ).hashtags.add(hashtag)
+
+    def names(self, **params):
+        response = self.client.get(self.url, params)
+        return [hashtag["name"] for hashtag in response.data]
+
+    def test_most_used_completions_first(self):
+        self.assertEqual(
+            self.names(q="Py"), ["#pytest", "#python", "#pypy"]
+        )
+        self.assertEqual(self.names(q="#pyt", limit=1), ["#pytest"])
+        self.assertEqual(self.names(q="rust"), [])
+
+    def test_new_hashtags_are_added(self):
+        self.names(q="py")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("social_media:hashtag-list"), {"name": "pyramid"}
+            )
+        upsert_hashtags({"#pyside"})
+
+        self.assertEqual(
+            self.names(q="pyr"), ["#pyramid"]
+        )
+        with self.settings(AUTOCOMPLETE_REFRESH_SECONDS=0):
+            self.assertEqual(self.names(q="pys"), ["#pyside"])
+
+    def test_hashtags_committed_out_of_order_are_picked_up(self):
+        self.names(q="py")
+        # Created in another process, its on_commit add never runs here
+        pyqt = Hashtag.objects.create(name="pyqt")
+        # Created here afterwards, with a higher id
+        with self.captureOnCommitCallbacks(execute=True):
+            Hashtag.objects.create(name="pyramid")
+        # Committed only after the next refresh has read a higher id
+        late = Hashtag.objects.create(name="pysnmp")
+        Hashtag.objects.create(name="pyside")
+        late.delete()
+
+        with self.settings(AUTOCOMPLETE_REFRESH_SECONDS=0):
+            self.assertEqual(self.names(q="pyq"), [pyqt.name])
+            Hashtag.objects.bulk_create([Hashtag(id=late.id, name=late.name)])
+            self.assertEqual(
+                self.names(q="pys"), ["#pyside", "#pysnmp"]
+            )
+
+    @mock.patch("social_media.autocomplete.connection")
+    @mock.patch("social_media.autocomplete.threading.Thread")
+    def test_counts_are_rebuilt_in_the_background(self, thread, _):
+        self.names(q="py")
+        pypy = Hashtag.objects.get(name="#pypy")
+        for _ in range(5):
+            Post.objects.create(
+                title="Post", content="Content", author=self.user
+            ).hashtags.add(pypy)
+
+        with self.settings(AUTOCOMPLETE_REBUILD_SECONDS=0):
+            stale = self.names(q="py")
+            self.names(q="py")
+
+        # The stale index is served, one rebuild is started
+        self.assertEqual(stale, ["#pytest", "#python", "#pypy"])
+        thread.assert_called_once()
+        thread.call_args.kwargs["target"]()
+        self.assertEqual(self.names(q="py"), ["#pypy", "#pytest", "#python"])
+
+
+@override_settings(OUTBOX_BATCH_SIZE=7)
+class OutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            "author@test.com", "password", username="author"
+        )
+        self.post = Post.objects.create(
+            title="Post", content="Content", author=self.author
+        )
+        self.fans = [
+            User.objects.create_user(
+                f"fan{index}@test.com", "password", username=f"fan{index}"
+            )
+            for index in range(20)
+        ]
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}"
+        )
+        return client
+
+    def test_events_are_written_with_the_write(self):
+        fan = self.client_for(self.fans[0])
+        fan.post(reverse("social_media:like-unlike-post", args=[self.post.id]))
+        fan.post(
+            reverse("social_media:follow-unfollow-user", args=[self.author.id])
+        )
+        fan.post(
+            reverse("social_media:comment-post", args=[self.post.id]),
+            {"content": "Nice"}
+        )
+        like(self.author, self.post)
+
+        self.assertEqual(
+            list(OutboxEvent.objects.values_list(
+                "kind", "actor", "recipient", "post"
+            )),
+            [
+                ("like", self.fans[0].id, self.author.id, self.post.id),
+                ("follow", self.fans[0].id, self.author.id, None),
+                ("comment", self.fans[0].id, self.author.id, self.post.id),
+            ]
+        )
+
+    def test_failed_event_rolls_back_the_write(self):
+        with mock.patch(
+            "social_media.outbox.record", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            like(self.fans[0], self.post)
+
+        self.assertFalse(Like.objects.exists())
+
+    def test_relay_coalesces_events_into_notifications(self):
+        for fan in self.fans:
+            like(fan, self.post)
+
+        self.assertEqual(relay(), 20)
+        self.assertFalse(OutboxEvent.objects.exists())
+        notification = Notification.objects.get()
+        self.assertEqual(
+            (notification.recipient, notification.kind, notification.count,
+             notification.actor),
+            (self.author, "like", 20, self.fans[-1])
+        )
+
+        Like.objects.all().delete()
+        like(self.fans[0], self.post)
+        relay()
+        notification.refresh_from_db()
+        self.assertEqual(
+            (notification.count, notification.actor), (21, self.fans[0])
+        )
+
+    def test_read_notifications_are_not_extended(self):
+        client = self.client_for(self.author)
+        like(self.fans[0], self.post)
+        relay()
+        client.post(reverse("social_media:read-notifications"))
+        like(self.fans[1], self.post)
+        relay()
+
+        response = client.get(reverse("social_media:notifications"))
+
+        self.assertEqual(
+            [(item["actor"], item["count"], item["is_read"])
+             for item in response.data],
+            [("fan1", 1, False), ("fan0", 1, True)]
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "SKIP LOCKED needs Postgres")
+class ConcurrentRelayTests(TransactionTestCase):
+    def test_relay_skips_events_claimed_by_another_relay(self):
+        author = User.objects.create_user(
+            "author@test.com", "password", username="author"
+        )
+        post = Post.objects.create(
+            title="Post", content="Content", author=author
+        )
+        for index in range(3):
+            like(
+                User.objects.create_user(
+                    f"fan{index}@test.com", "password", username=f"fan{index}"
+                ),
+                post
+            )
+        claimed, release = threading.Event(), threading.Event()
+
+        def claim_two():
+            try:
+                with transaction.atomic():
+                    list(
+                        OutboxEvent.objects.select_for_update().order_by(
+                            "id"
+                        )[:2]
+                    )
+                    claimed.set()
+                    release.wait(10)
+            finally:
+                connections.close_all()
+
+        other = threading.Thread(target=claim_two)
+        other.start()
+        self.assertTrue(claimed.wait(10))
+        try:
+            relayed = relay()
+        finally:
+            release.set()
+            other.join()
+
+        self.assertEqual(relayed, 1)
+        self.assertEqual(OutboxEvent.objects.count(), 2)
+        self.assertEqual(relay(), 2)
+        self.assertEqual(Notification.objects.get().count, 3)
+
+
+@override_settings(DELETION_CHUNK_SIZE=2, DELETION_PAUSE_SECONDS=0)
+class DeletionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            "author@test.com", "password", username="author"
+        )
+        self.fan = User.objects.create_user(
+            "fan@test.com", "password", username="fan"
+        )
+        self.fan.followings.add(self.author)
+        self.author.followers.add(self.fan)
+        self.posts = [
+            Post.objects.create(
+                title=f"Post {index}", content="Content", author=self.author
+            )
+            for index in range(3)
+        ]
+        self.fan_post = Post.objects.create(
+            title="Fan post", content="Content", author=self.fan
+        )
+        for post in self.posts:
+            like(self.fan, post)
+            Comment.objects.create(post=post, author=self.fan, content="Hi")
+        like(self.author, self.fan_post)
+        Comment.objects.create(
+            post=self.fan_post, author=self.author, content="Thanks"
+        )
+        relay()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}"
+        )
+        return client
+
+    def assert_nothing_left_of_author(self):
+        self.assertFalse(User.all_objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(
+            Post.all_objects.filter(author_id=self.author.pk).exists()
+        )
+        self.assertEqual(
+            list(Like.objects.values_list("liker", "post")), []
+        )
+        self.assertEqual(
+            list(Comment.all_objects.values_list("author", flat=True)), []
+        )
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(User.followers.through.objects.exists())
+        self.assertFalse(User.followings.through.objects.exists())
+        self.assertTrue(Post.objects.filter(pk=self.fan_post.pk).exists())
+
+    def test_account_is_hidden_at_once_and_removed_in_chunks(self):
+        client = self.client_for(self.author)
+        response = client.delete(reverse("social_media:me"))
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["status"], "pending")
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertEqual(list(self.fan.followings.all()), [])
+        self.assertEqual(
+            list(Post.objects.all()), [self.fan_post]
+        )
+        self.assertEqual(list(self.fan_post.comments.all()), [])
+        self.assertEqual(
+            client.get(reverse("social_media:me")).status_code, 401
+        )
+        self.assertTrue(
+            User.all_objects.filter(pk=self.author.pk).exists()
+        )
+
+        job = run(response.data["id"])
+
+        self.assertEqual(job.status, "done")
+        self.assertIsNotNone(job.finished_at)
+        self.assertGreater(job.deleted, 15)
+        self.assert_nothing_left_of_author()
+        status_response = APIClient().get(response.data["status_url"])
+        self.assertEqual(status_response.data["status"], "done")
+
+    def test_job_resumes_after_a_crash(self):
+        self.client_for(self.author).delete(reverse("social_media:me"))
+        job = DeletionJob.objects.get()
+        calls = []
+
+        def crash_on_fourth_chunk(rows, cleanup=None):
+            calls.append(rows)
+            if len(calls) == 4:
+                raise RuntimeError("worker lost")
+            return delete_chunk(rows, cleanup)
+
+        with mock.patch(
+            "social_media.deletion.delete_chunk", crash_on_fourth_chunk
+        ), self.assertRaises(RuntimeError):
+            run(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.step), ("running", "comments"))
+
+        DeletionJob.objects.filter(pk=job.pk).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(list(stale_jobs()), [job])
+        run(job.id)
+
+        self.assert_nothing_left_of_author()
+
+    def test_post_is_hidden_at_once_and_removed_in_chunks(self):
+        client = self.client_for(self.author)
+        url = reverse("social_media:post-detail", args=[self.posts[0].pk])
+
+        response = client.delete(url)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(client.get(url).status_code, 404)
+        run(response.data["id"])
+        self.assertFalse(
+            Post.all_objects.filter(pk=self.posts[0].pk).exists()
+        )
+        self.assertEqual(
+            Like.objects.filter(post__author=self.author).count(), 2
+        )
+        self.assertFalse(
+            Notification.objects.filter(post_id=self.posts[0].pk).exists()
+        )
+
+
+class ValuesSerializerTests(TestCase):
+    def setUp(self):
+        self.me, self.friend = (
+            User.objects.create_user(
+                f"{name}@test.com", "password", username=name
+            )
+            for name in ("me", "friend")
+        )
+        self.me.followings.add(self.friend)
+        self.friend.followers.add(self.me)
+        tags = [Hashtag.objects.create(name=name) for name in ("b", "a")]
+        for index, title in enumerate(("Café", "Line\u2028break")):
+            post = Post.objects.create(
+                title=title,
+                content="Content",
+                author=self.friend,
+                image=f"uploads/posts/{index}.jpg" if index else "",
+            )
+            post.hashtags.set(tags[index:])
+            like(self.me, post)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.me)}"
+        )
+
+    def assert_same_output(self, serializer_class, queryset, queries):
+        context = {"request": APIRequestFactory().get("/")}
+        with self.assertNumQueries(queries):
+            output = ORJSONRenderer().render(
+                serializer_class(queryset, many=True, context=context).data
+            )
+        expected = JSONRenderer().render(ListSerializer(
+            list(queryset.all()), child=serializer_class(), context=context
+        ).data)
+        self.assertEqual(output, expected)
+
+    def test_lists_are_the_same_as_the_instance_path(self):
+        self.assert_same_output(
+            PostListSerializer,
+            with_is_liked(post_list_queryset(), self.me).order_by("id"),
+            2
+        )
+        self.assert_same_output(
+            UserListSerializer,
+            with_relationships(
+                with_user_counts(User.objects.order_by("id")), self.me
+            ),
+            1
+        )
+        self.assert_same_output(
+            HashtagListSerializer,
+            with_hashtag_counts(Hashtag.objects.order_by("id")),
+            1
+        )
+
+    def test_querysets_without_annotations_use_the_instance_path(self):
+        data = PostListSerializer(
+            post_list_queryset().order_by("id"), many=True
+        ).data
+        # The values path would need the is_liked annotation
+        self.assertNotIn("is_liked", data[0])
+
+    def test_list_endpoint(self):
+        response = self.client.get(reverse("social_media:post-list"))
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn("\\u2028".encode(), response.content)
+        self.assertEqual(
+            [post["hashtags"] for post in response.json()],
+            [["#a", "#b"], ["#a"]]
+        )
+
+    def test_renderer_output_is_the_same_as_json_renderer(self):
+        data = {
+            "text": "Ünïcode \u2029 </script>",
+            1: [timezone.now(), timezone.now().date(), 1.5, None, True],
+            "id": DeletionJob().id,
+        }
+        self.assertEqual(
+            ORJSONRenderer().render(data), JSONRenderer().render(data)
+        )
+        self.assertEqual(
+            ORJSONRenderer().render(data, "application/json; indent=4"),
+            JSONRenderer().render(data, "application/json; indent=4")
+        )
+
+
+class SchemaTests(TestCase):
+    def setUp(self):
+        schema.RENDERED.clear()
+        self.addCleanup(schema.RENDERED.clear)
+
+    @override_settings(SCHEMA_DIR=Path(tempfile.mkdtemp()))
+    def test_schema_is_generated_once_and_revalidated(self):
+        with mock.patch.object(
+            schema, "generate", wraps=schema.generate
+        ) as generate:
+            response = self.client.get(reverse("schema"))
+            json_response = self.client.get(
+                reverse("schema"), HTTP_ACCEPT="application/json"
+            )
+            not_modified = self.client.get(
+                reverse("schema"), HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(generate.call_count, 1)
+        self.assertTrue(
+            schema.schema_path(schema.code_version()).exists()
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["Content-Type"],
+            "application/vnd.oai.openapi; charset=utf-8"
+        )
+        self.assertIn(b"/api/posts/", response.content)
+        self.assertEqual(json_response.status_code, 200)
+        self.assertIn("/api/posts/", json_response.json()["paths"])
+        self.assertNotEqual(json_response["ETag"], response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+
+    @override_settings(SCHEMA_DIR=Path(tempfile.mkdtemp()))
+    def test_new_code_version_gets_a_new_schema(self):
+        with mock.patch.object(schema, "generate", return_value={"v": 1}):
+            schema.warm()
+        with mock.patch.object(
+            schema, "code_version", return_value="next"
+        ), mock.patch.object(schema, "generate", return_value={}) as generate:
+            response = self.client.get(
+                reverse("schema"), HTTP_ACCEPT="application/json"
+            )
+        generate.assert_called_once()
+        self.assertEqual(response.json(), {})
+        self.assertTrue(response["ETag"].startswith('"next-'))
+
+
+class SettingsProfileTests(TestCase):
+    def test_prod_profile_is_lean(self):
+        prod = importlib.import_module("social_media_api.settings.prod")
+        self.assertFalse(prod.DEBUG)
+        self.assertNotIn("debug_toolbar", prod.INSTALLED_APPS)
+        self.assertFalse(
+            [name for name in prod.MIDDLEWARE if "debug_toolbar" in name]
+        )
+        for database in prod.DATABASES.values():
+            self.assertGreater(database["CONN_MAX_AGE"], 0)
+            self.assertTrue(database["CONN_HEALTH_CHECKS"])
+
+    def test_dev_profile_adds_the_debug_toolbar(self):
+        dev = importlib.import_module("social_media_api.settings.dev")
+        base = importlib.import_module("social_media_api.settings.base")
+        self.assertTrue(dev.DEBUG)
+        self.assertIn("debug_toolbar", dev.INSTALLED_APPS)
+        self.assertEqual(
+            dev.MIDDLEWARE[2],
+            "debug_toolbar.middleware.DebugToolbarMiddleware"
+        )
+        self.assertNotIn("debug_toolbar", base.INSTALLED_APPS)
+
+
+class PartitionTests(TestCase):
+    def test_month_start(self):
+        value = datetime(2025, 12, 31, 23, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(
+            month_start(value),
+            datetime(2025, 12, 1, tzinfo=dt_timezone.utc)
+        )
+        self.assertEqual(
+            month_start(value, 1),
+            datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        )
+        self.assertEqual(
+            month_start(value, -24),
+            datetime(2023, 12, 1, tzinfo=dt_timezone.utc)
+        )
+
+    @skipUnless(
+        connection.vendor == "postgresql", "Partitions need Postgres"
+    )
+    @override_settings(PRIVATE_ROOT=tempfile.mkdtemp())
+    def test_partitions_are_created_ahead_and_archived(self):
+        user = User.objects.create_user(
+            "liker@test.com", "password", username="liker"
+        )
+        post = Post.objects.create(
+            title="Post", content="Content", author=user
+        )
+        now = timezone.now()
+        old = Like.objects.create(liker=user, post=post)
+        later = month_start(now, 30)
+        # Beyond the created partitions, lands in the default one
+        early = Like.objects.create(
+            liker=user, post=post, created_at=later + timedelta(days=1)
+        )
+        # Detached by a run that crashed before archiving it
+        crashed = f"social_media_like_p{month_start(now, 1):%Y%m}"
+        with connection.cursor() as cursor:
+            # Tables with pending foreign key checks cannot be dropped
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute(
+                f"ALTER TABLE social_media_like DETACH PARTITION {crashed}"
+            )
+
+        with self.assertLogs("social_media.partitions", "WARNING") as logs:
+            report = maintain(later)
+
+        self.assertIn(
+            f"Moving rows of social_media_like_p{later:%Y%m}", logs.output[0]
+        )
+        likes = report["social_media_like"]
+        self.assertEqual(
+            likes["created"],
+            [f"{month_start(later, offset):%Y-%m}" for offset in range(4)]
+        )
+        self.assertIn(f"archive/{crashed}.csv.gz", likes["archived"])
+        self.assertIn(
+            "archive/social_media_like_legacy.csv.gz", likes["archived"]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tableoid::regclass::text FROM social_media_like "
+                "WHERE id = %s",
+                [early.pk],
+            )
+            self.assertEqual(
+                cursor.fetchone()[0], f"social_media_like_p{later:%Y%m}"
+            )
+        self.assertFalse(Like.objects.filter(pk=old.pk).exists())
+        with private_storage().open(
+            "archive/social_media_like_legacy.csv.gz"
+        ) as file:
+            rows = gzip.decompress(file.read()).decode().splitlines()
+        self.assertEqual(rows[0], "id,liker_id,post_id,created_at")
+        self.assertIn(str(old.pk), [row.split(",")[0] for row in rows])
+
+    @override_settings(
+        MEDIA_ROOT=tempfile.mkdtemp(), PRIVATE_ROOT=tempfile.mkdtemp()
+    )
+    def test_archives_are_not_in_the_public_media(self):
+        with tempfile.TemporaryFile() as file:
+            file.write(gzip.compress(b"id,liker_id,post_id,created_at\n"))
+            file.seek(0)
+            path = save_archive("social_media_like_p202001", file)
+
+        self.assertEqual(path, "archive/social_media_like_p202001.csv.gz")
+        self.assertTrue(Path(settings.PRIVATE_ROOT, path).is_file())
+        self.assertFalse(Path(settings.MEDIA_ROOT, "archive").exists())
+        response = self.client.get(f"/media/{path}")
+        self.assertEqual(response.status_code, 404)
+
+
+class RealTimeEventTests(TestCase):
+    def setUp(self):
+        self.broker = MemoryBroker()
+        patcher = mock.patch("social_media.events._broker", self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.author = User.objects.create_user(
+            "author@test.com", "password", username="author"
+        )
+        self.reader = User.objects.create_user(
+            "reader@test.com", "password", username="reader"
+        )
+        self.reader.followings.add(self.author)
+        self.post = Post.objects.create(
+            title="Post", content="Content", author=self.author
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.reader)}"
+        )
+
+    def events(self, channel):
+        return [
+            (event["type"], event["data"])
+            for event in self.broker.history[channel]
+        ]
+
+    def test_writes_are_published_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("social_media:like-unlike-post", args=[self.post.id])
+            )
+            self.client.post(
+                reverse("social_media:comment-post", args=[self.post.id]),
+                {"content": "Nice"}
+            )
+            self.assertEqual(self.events(f"user:{self.author.id}"), [])
+
+        comment = Comment.objects.get()
+        comment_data = {
+            "id": comment.id,
+            "post": self.post.id,
+            "author": self.reader.id,
+            "content": "Nice",
+        }
+        self.assertEqual(self.events(f"user:{self.author.id}"), [
+            ("like", {"post": self.post.id, "liker": self.reader.id}),
+            ("comment", comment_data),
+        ])
+        self.assertEqual(
+            self.events(f"post:{self.post.id}"), [("comment", comment_data)]
+        )
+
+    def test_own_likes_are_not_published(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(liker=self.author, post=self.post)
+
+        self.assertEqual(self.events(f"user:{self.author.id}"), [])
+
+    def test_closed_loop_does_not_fail_the_write(self):
+        channel = f"user:{self.author.id}"
+        loop = asyncio.new_event_loop()
+        gone = loop.run_until_complete(self.broker.subscribe([channel]))
+        loop.close()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("social_media:like-unlike-post", args=[self.post.id])
+            )
+
+        self.assertLess(response.status_code, 300)
+        self.assertNotIn(gone, self.broker.subscriptions[channel])
+        self.assertEqual(len(self.events(channel)), 1)
+
+        with mock.patch.object(
+            self.broker, "publish_many", side_effect=ValueError
+        ), self.assertLogs("social_media.events", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                Comment.objects.create(
+                    post=self.post, author=self.reader, content="Hi"
+                )
+
+    async def test_stream_resumes_after_last_event_id(self):
+        channel = f"posts:{self.author.id}"
+        self.broker.publish_many([
+            (channel, "post", {"id": pk}) for pk in (1, 2, 3)
+        ])
+        with self.settings(EVENTS_HEARTBEAT_SECONDS=0.01):
+            stream = event_stream([channel], last_event_id=1)
+            frames = [await anext(stream) for _ in range(3)]
+            self.broker.publish_many([(channel, "post", {"id": 4})])
+            frames += [await anext(stream)]
+            frames += [await anext(stream)]
+            await stream.aclose()
+
+        self.assertEqual(frames, [
+            "retry: 3000\n\n",
+            'id: 2\nevent: post\ndata: {"id": 2}\n\n',
+            'id: 3\nevent: post\ndata: {"id": 3}\n\n',
+            'id: 4\nevent: post\ndata: {"id": 4}\n\n',
+            ": ping\n\n",
+        ])
+        self.assertEqual(self.broker.subscriptions[channel], set())
+
+    @override_settings(EVENTS_QUEUE_SIZE=2)
+    async def test_slow_client_is_disconnected(self):
+        channel = f"user:{self.reader.id}"
+        stream = event_stream([channel])
+        await anext(stream)
+        self.broker.publish_many([
+            (channel, "like", {"post": pk}) for pk in range(5)
+        ])
+
+        frames = [frame async for frame in stream]
+
+        self.assertEqual(len(frames), 1)
+
+    @override_settings(EVENTS_MAX_CONNECTION_SECONDS=0)
+    async def test_event_stream_endpoint(self):
+        url = reverse("social_media:event-stream")
+        client = AsyncClient()
+        self.assertEqual((await client.get(url)).status_code, 401)
+
+        response = await client.get(
+            url, {"access_token": str(AccessToken.for_user(self.reader))}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        self.assertEqual(
+            [frame async for frame in response.streaming_content],
+            [b"retry: 3000\n\n"]
+        )
+
+    async def test_live_events_out_of_id_order_are_delivered(self):
+        channel = f"posts:{self.author.id}"
+        self.broker.publish_many([
+            (channel, "post", {"id": pk}) for pk in (1, 2, 3)
+        ])
+        stream = event_stream([channel], last_event_id=1)
+        frames = [await anext(stream) for _ in range(3)]
+        (subscription,) = self.broker.subscriptions[channel]
+        # Published by two writers, the one with the higher id first
+        for pk in (3, 5, 4):
+            subscription.put({
+                "id": pk, "channel": channel, "type": "post",
+                "data": {"id": pk},
+            })
+        frames += [await anext(stream) for _ in range(2)]
+        await stream.aclose()
+
+        self.assertEqual(
+            [frame.split("\n")[0] for frame in frames[1:]],
+            ["id: 2", "id: 3", "id: 5", "id: 4"]
+        )
+
+
+class FakePubSub:
+    """Just enough of redis.asyncio.client.PubSub for RedisBroker"""
+
+    def __init__(self):
+        self.channels = set()
+        self.messages = asyncio.Queue()
+
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+
+    async def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+
+    async def listen(self):
+        while True:
+            message = await self.messages.get()
+            if isinstance(message, Exception):
+                raise message
+            yield message
+
+    async def close(self):
+        pass
+
+
+class FakeRedis:
+    def __init__(self):
+        self.pubsub_client = FakePubSub()
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return self.pubsub_client
+
+    async def close(self):
+        pass
+
+
+class RedisBrokerTests(TestCase):
+    def setUp(self):
+        self.broker = RedisBroker("redis://localhost:6379/0")
+        self.clients = []
+        patchers = [
+            mock.patch("social_media.events._broker", self.broker),
+            mock.patch.object(
+                redis.asyncio.Redis, "from_url", side_effect=self.connect
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def connect(self, url):
+        self.clients.append(FakeRedis())
+        return self.clients[-1]
+
+    def send(self, pubsub, channel, pk):
+        pubsub.messages.put_nowait({"data": json.dumps({
+            "id": pk, "channel": channel, "type": "post", "data": {"id": pk},
+        })})
+
+    async def test_one_connection_is_shared_by_the_streams(self):
+        first = event_stream(["a", "b"])
+        second = event_stream(["b"])
+        await anext(first)
+        await anext(second)
+
+        self.assertEqual(len(self.clients), 1)
+        pubsub = self.clients[0].pubsub_client
+        self.assertEqual(pubsub.channels, {"events:a", "events:b"})
+        self.send(pubsub, "b", 1)
+        self.send(pubsub, "a", 2)
+        self.assertTrue((await anext(first)).startswith("id: 1\n"))
+        self.assertTrue((await anext(first)).startswith("id: 2\n"))
+        self.assertTrue((await anext(second)).startswith("id: 1\n"))
+
+        await first.aclose()
+        self.assertEqual(pubsub.channels, {"events:b"})
+        await second.aclose()
+        self.assertEqual(self.broker.listeners, {})
+
+    async def test_streams_end_when_the_connection_is_lost(self):
+        first = event_stream(["a"])
+        second = event_stream(["b"])
+        await anext(first)
+        await anext(second)
+
+        self.clients[0].pubsub_client.messages.put_nowait(
+            redis.ConnectionError("Connection reset")
+        )
+        with self.assertLogs("social_media.events", "WARNING"):
+            self.assertEqual([frame async for frame in first], [])
+        self.assertEqual([frame async for frame in second], [])
+        self.assertEqual(self.broker.listeners, {})
+
+        # The reconnecting client gets a new connection
+        third = event_stream(["a"])
+        await anext(third)
+        await third.aclose()
+        self.assertEqual(len(self.clients), 2)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            "admin@test.com", "password", username="admin"
+        )
+        self.client.force_login(self.admin)
+        self.authors = []
+        self.add_rows(3)
+
+    def add_rows(self, count):
+        for index in range(count):
+            author = User.objects.create_user(
+                f"author{len(self.authors)}@test.com",
+                "password",
+                username=f"author{len(self.authors)}",
+            )
+            self.authors.append(author)
+            post = Post.objects.create(
+                title=f"Post {index}", content="Content", author=author
+            )
+            ScheduledPost.objects.create(
+                title="Later", content="Content", author=author
+            )
+            Like.objects.create(liker=self.admin, post=post)
+            Comment.objects.create(
+                post=post, author=self.admin, content="Comment"
+            )
+
+    def changelist_queries(self):
+        queries = {}
+        for model in (Post, ScheduledPost, Like, Comment):
+            url = reverse(f"admin:social_media_{model._meta.model_name}_"
+                          "changelist")
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            queries[model] = len(captured)
+        return queries
+
+    def test_query_counts_do_not_depend_on_rows(self):
+        small = self.changelist_queries()
+        self.add_rows(10)
+        self.assertEqual(self.changelist_queries(), small)
+        # Session, user, page, row estimate and count
+        self.assertLessEqual(max(small.values()), 5)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=0)
+    def test_keyset_pages(self):
+        url = reverse("admin:social_media_post_changelist")
+        with mock.patch.object(PostAdmin, "list_per_page", 2):
+            first = self.client.get(url)
+            self.assertEqual(
+                [post.title for post in first.context["cl"].result_list],
+                ["Post 2", "Post 1"]
+            )
+            older = first.context["cl"].older_query_string
+            second = self.client.get(url + older)
+        cl = second.context["cl"]
+        self.assertEqual(
+            [post.title for post in cl.result_list], ["Post 0"]
+        )
+        self.assertIsNone(cl.older_query_string)
+        self.assertContains(second, ">Newest</a>")
+        self.assertEqual(
+            cl.paginator.estimated, connection.vendor == "postgresql"
+        )
+
+        ordered = self.client.get(url, {"o": "1", "before": "1"})
+        self.assertFalse(ordered.context["cl"].keyset)
+        self.assertEqual(len(ordered.context["cl"].result_list), 3)
+
+    def test_autocomplete_filter_renders_only_the_selected_object(self):
+        author = self.authors[1]
+        response = self.client.get(
+            reverse("admin:social_media_post_changelist"),
+            {"author__id__exact": author.pk},
+        )
+        self.assertEqual(
+            [post.author_id for post in response.context["cl"].result_list],
+            [author.pk]
+        )
+        self.assertContains(
+            response,
+            f'<option value="{author.pk}" selected>{author}</option>',
+            html=True,
+        )
+        self.assertNotContains(response, str(self.authors[0]))
+        self.assertContains(response, "autocomplete_filter.js")
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0, SYNC_PAGE_SIZE=2)
+class SyncTests(TestCase):
+    def setUp(self):
+        self.me, self.friend, self.stranger = (
+            User.objects.create_user(
+                f"{name}@test.com", "password", username=name
+            )
+            for name in ("me", "friend", "stranger")
+        )
+        follow(self.me, self.friend)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.me)}"
+        )
+        self.url = reverse("social_media:sync")
+        self.token = self.client.get(self.url).data["token"]
+
+    def sync(self):
+        """All pages after self.token"""
+        changes = []
+        while True:
+            response = self.client.get(self.url, {"since": self.token})
+            self.assertEqual(response.status_code, 200)
+            changes.extend(response.data["changes"])
+            self.token = response.data["token"]
+            if not response.data["more"]:
+                return changes
+
+    @override_settings(SYNC_PAGE_SIZE=100)
+    def test_latest_change_of_each_object(self):
+        kept, removed = create_posts(Post, self.friend, [
+            {"title": "Kept", "content": "Content"},
+            {"title": "Removed", "content": "Content"},
+        ])
+        create_posts(Post, self.stranger, [
+            {"title": "Unseen", "content": "Content"}
+        ])
+        like(self.me, kept)
+        like(self.stranger, removed)
+        unlike(self.stranger, removed)
+        self.client.post(
+            reverse("social_media:comment-post", args=[kept.pk]),
+            {"content": "Nice"},
+        )
+        soft_delete_post(removed)
+
+        changes = self.sync()
+        self.assertEqual(
+            [(change["kind"], change["deleted"]) for change in changes],
+            [("post", False), ("like", False), ("like", True),
+             ("comment", False), ("post", True)]
+        )
+        self.assertEqual(changes[0]["data"]["title"], "Kept")
+        self.assertTrue(changes[0]["data"]["is_liked"])
+        self.assertEqual(
+            (changes[1]["post"], changes[1]["liker"]), (kept.pk, self.me.pk)
+        )
+        self.assertEqual(changes[3]["data"]["post"], kept.pk)
+        self.assertEqual(changes[4]["id"], removed.pk)
+        self.assertNotIn("data", changes[4])
+        self.assertEqual(self.sync(), [])
+
+    def test_pages(self):
+        create_posts(Post, self.friend, [
+            {"title": f"Post {index}", "content": "C"} for index in range(5)
+        ])
+        response = self.client.get(self.url, {"since": self.token})
+        self.assertEqual(len(response.data["changes"]), 2)
+        self.assertTrue(response.data["more"])
+        self.assertEqual(
+            response.data["token"], response.data["changes"][-1]["token"]
+        )
+        self.assertEqual(
+            [change["data"]["title"] for change in self.sync()],
+            [f"Post {index}" for index in range(5)]
+        )
+
+    def test_follow_edges_and_deleted_accounts(self):
+        unfollow(self.me, self.friend)
+        follow(self.me, self.stranger)
+        soft_delete_user(self.friend)
+        self.assertEqual(
+            [
+                {key: change[key] for key in change if key != "token"}
+                for change in self.sync()
+            ],
+            [
+                {"kind": "follow", "follower": self.me.pk,
+                 "following": self.friend.pk, "deleted": True},
+                {"kind": "follow", "follower": self.me.pk,
+                 "following": self.stranger.pk, "deleted": False},
+                {"kind": "user", "id": self.friend.pk, "deleted": True},
+            ]
+        )
+
+    @override_settings(SYNC_SETTLE_SECONDS=60)
+    def test_recent_changes_are_held_back(self):
+        create_posts(Post, self.friend, [{"title": "New", "content": "C"}])
+        response = self.client.get(self.url, {"since": self.token})
+        self.assertEqual(response.data["changes"], [])
+        self.assertEqual(response.data["token"], self.token)
+
+    @override_settings(SYNC_RETENTION_DAYS=1)
+    def test_pruned_token_expires(self):
+        create_posts(Post, self.friend, [
+            {"title": f"Post {index}", "content": "C"} for index in range(3)
+        ])
+        self.assertEqual(prune(timezone.now() + timedelta(days=2)), 3)
+        self.assertEqual(Change.objects.count(), 1)
+
+        response = self.client.get(self.url, {"since": self.token})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(
+            response.data["token"], Change.objects.get().pk
+        )
+        self.client.get(self.url, {"since": response.data["token"]})
+        self.assertEqual(
+            self.client.get(self.url, {"since": "x"}).status_code, 400
+        )
+
+
+def png_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    PRIVATE_ROOT=tempfile.mkdtemp(),
+    UPLOAD_CHUNK_SIZE=32,
+)
+class UploadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "uploader@test.com", "password", username="uploader"
+        )
+        self.post = Post.objects.create(
+            title="Post", content="Content", author=self.user
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.image = png_bytes()
+
+    def start(self):
+        response = self.client.post(
+            reverse("social_media:uploadsession-list"),
+            {"target": "post", "post": self.post.pk,
+             "filename": "photo.png", "size": len(self.image)},
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def send(self, session_id, offset, data=None, checksum=None):
+        data = self.image[offset:offset + 32] if data is None else data
+        return self.client.put(
+            reverse("social_media:uploadsession-chunk", args=[session_id]),
+            data,
+            content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+            HTTP_UPLOAD_CHECKSUM=checksum or hashlib.sha256(data).hexdigest(),
+        )
+
+    def test_create(self):
+        session = self.start()
+        self.assertEqual(session["offset"], 0)
+        self.assertEqual(session["chunk_size"], 32)
+
+        other = Post.objects.create(
+            title="Other", content="Content", author=User.objects.create_user(
+                "other@test.com", "password", username="other"
+            )
+        )
+        response = self.client.post(
+            reverse("social_media:uploadsession-list"),
+            {"target": "post", "post": other.pk,
+             "filename": "photo.png", "size": 10},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_chunks_are_kept_out_of_the_media(self):
+        session = self.start()
+        response = self.send(session["id"], 0)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["offset"], 32)
+        partial = Path(UploadSession.objects.get().file_path)
+        self.assertTrue(partial.is_relative_to(settings.PRIVATE_ROOT))
+        self.assertEqual(partial.read_bytes(), self.image[:32])
+        self.assertEqual(
+            self.client.get(
+                f"/media/uploads/partial/{session['id']}.part"
+            ).status_code,
+            404
+        )
+
+    def test_offset_mismatch(self):
+        session = self.start()
+        self.send(session["id"], 0)
+
+        response = self.send(session["id"], 64)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data["offset"], 32)
+
+    def test_checksum_mismatch_is_dropped(self):
+        session = self.start()
+
+        response = self.send(session["id"], 0, checksum="0" * 64)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get().offset, 0)
+        self.assertEqual(
+            Path(UploadSession.objects.get().file_path).read_bytes(), b""
+        )
+
+    def test_resume_after_interrupted_chunk(self):
+        session = self.start()
+        self.send(session["id"], 0)
+        # The connection dropped in the middle of the second chunk
+        with open(UploadSession.objects.get().file_path, "ab") as file:
+            file.write(self.image[32:40])
+
+        offset = self.client.get(
+            reverse("social_media:uploadsession-detail", args=[session["id"]])
+        ).data["offset"]
+        self.assertEqual(offset, 32)
+        while offset < len(self.image):
+            response = self.send(session["id"], offset)
+            self.assertEqual(response.status_code, 200)
+            offset = response.data["offset"]
+
+        self.assertEqual(
+            Path(UploadSession.objects.get().file_path).read_bytes(),
+            self.image
+        )
+
+    def test_commit(self):
+        session = self.start()
+        url = reverse(
+            "social_media:uploadsession-commit", args=[session["id"]]
+        )
+        self.send(session["id"], 0)
+        incomplete = self.client.post(url)
+        offset = 32
+        while offset < len(self.image):
+            offset = self.send(session["id"], offset).data["offset"]
+        partial = Path(UploadSession.objects.get().file_path)
+
+        response = self.client.post(url)
+
+        self.assertEqual(incomplete.status_code, 400)
+        self.assertEqual(response.status_code, 201)
+        self.post.refresh_from_db()
+        self.assertTrue(self.post.image.name.startswith("uploads/posts/"))
+        self.assertEqual(
+            Path(settings.MEDIA_ROOT, self.post.image.name).read_bytes(),
+            self.image
+        )
+        self.assertFalse(partial.exists())
+        self.assertFalse(UploadSession.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), MEDIA_SENDFILE_BACKEND=None)
+class ServeMediaTests(TestCase):
+    def setUp(self):
+        self.path = "uploads/posts/photo-1.png"
+        self.file = Path(settings.MEDIA_ROOT, self.path)
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        self.file.write_bytes(b"0123456789")
+
+    def get(self, path=None, **headers):
+        return self.client.get(f"/media/{path or self.path}", **headers)
+
+    def test_full_file(self):
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertTrue(response["ETag"])
+
+    def test_single_range(self):
+        response = self.get(HTTP_RANGE="bytes=2-5")
+        suffix = self.get(HTTP_RANGE="bytes=-3")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(response["Content-Length"], "4")
+        self.assertEqual(suffix.status_code, 206)
+        self.assertEqual(b"".join(suffix.streaming_content), b"789")
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE="bytes=20-")
+        malformed = self.get(HTTP_RANGE="bytes=0-1,4-5")
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+        # Multipart ranges get the whole file
+        self.assertEqual(malformed.status_code, 200)
+
+    def test_if_none_match(self):
+        etag = self.get()["ETag"]
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        stale = self.get(HTTP_IF_NONE_MATCH='"other"')
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(stale.status_code, 200)
+
+    def test_x_accel_redirect(self):
+        with override_settings(MEDIA_SENDFILE_BACKEND="nginx"):
+            response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Accel-Redirect"], f"/protected/media/{self.path}"
+        )
+        self.assertEqual(response.content, b"")
+
+    def test_x_sendfile(self):
+        with override_settings(MEDIA_SENDFILE_BACKEND="apache"):
+            response = self.get()
+
+        self.assertEqual(response["X-Sendfile"], str(self.file))
+        self.assertEqual(response.content, b"")
+
+    def test_only_public_prefixes_are_served(self):
+        private = Path(settings.MEDIA_ROOT, "exports", "data.zip")
+        private.parent.mkdir(parents=True, exist_ok=True)
+        private.write_bytes(b"secret")
+
+        self.assertEqual(self.get("exports/data.zip").status_code, 404)
+        self.assertEqual(
+            self.get("uploads/posts/../../exports/data.zip").status_code, 404
+        )
+        self.assertEqual(
+            self.get("uploads/posts/missing.png").status_code, 404
+        )
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    PRIVATE_ROOT=tempfile.mkdtemp(),
+    PERSONAL_EXPORT_SYNC_LIMIT=0,
+)
+class PersonalExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            "exporter@test.com", "password", username="exporter"
+        )
+        Post.objects.create(title="Post", content="Content", author=self.user)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.url = reverse("social_media:personal-data-export")
+
+    def status(self, result):
+        with mock.patch("social_media.views.AsyncResult") as async_result:
+            async_result.return_value = result
+            return self.client.get(reverse(
+                "social_media:personal-data-export-status",
+                args=[uuid.uuid4()]
+            ))
+
+    def built(self, **kwargs):
+        return mock.Mock(
+            ready=mock.Mock(return_value=True),
+            failed=mock.Mock(return_value=False),
+            **kwargs
+        )
+
+    @mock.patch("social_media.views.build_personal_export.apply_async")
+    def test_pending_task_is_reused(self, apply_async):
+        with mock.patch("social_media.views.AsyncResult") as async_result:
+            async_result.return_value.failed.return_value = False
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(first.data, second.data)
+        apply_async.assert_called_once_with(
+            (self.user.id,), task_id=first.data["task_id"]
+        )
+        with mock.patch("social_media.views.AsyncResult") as async_result:
+            async_result.return_value.failed.return_value = True
+            retry = self.client.get(self.url)
+        self.assertNotEqual(retry.data["task_id"], first.data["task_id"])
+        self.assertEqual(apply_async.call_count, 2)
+
+    @override_settings(PERSONAL_EXPORT_SYNC_LIMIT=100)
+    def test_small_accounts_are_streamed(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+    def test_task_writes_to_private_storage(self):
+        export = build_personal_export(self.user.id)
+
+        path = Path(settings.PRIVATE_ROOT, export["path"])
+        self.assertEqual(export["user_id"], self.user.id)
+        self.assertTrue(export["path"].startswith(f"exports/{self.user.id}/"))
+        with zipfile.ZipFile(path) as archive:
+            self.assertIn("posts.ndjson", archive.namelist())
+        self.assertFalse(Path(settings.MEDIA_ROOT, "exports").exists())
+
+    def test_status(self):
+        export = build_personal_export(self.user.id)
+        other = User.objects.create_user(
+            "other@test.com", "password", username="other"
+        )
+
+        pending = self.status(mock.Mock(
+            ready=mock.Mock(return_value=False), status="STARTED"
+        ))
+        failed = self.status(mock.Mock(
+            ready=mock.Mock(return_value=True),
+            failed=mock.Mock(return_value=True),
+            status="FAILURE",
+        ))
+        foreign = self.status(self.built(
+            result={"user_id": other.id, "path": export["path"]}
+        ))
+        download = self.status(self.built(result=export))
+
+        self.assertEqual(pending.status_code, 202)
+        self.assertEqual(pending.data, {"status": "STARTED"})
+        self.assertEqual(failed.status_code, 500)
+        self.assertEqual(foreign.status_code, 404)
+        self.assertEqual(download.status_code, 200)
+        self.assertIn(
+            'filename="exporter-export.zip"', download["Content-Disposition"]
+        )
+        content = b"".join(download.streaming_content)
+        self.assertEqual(content[:2], b"PK")
+
+    @override_settings(PERSONAL_EXPORT_EXPIRY_SECONDS=60)
+    def test_archives_expire(self):
+        old = build_personal_export(self.user.id)
+        recent = build_personal_export(self.user.id)
+        hour_ago = (timezone.now() - timedelta(hours=1)).timestamp()
+        os.utime(
+            Path(settings.PRIVATE_ROOT, old["path"]), (hour_ago, hour_ago)
+        )
+
+        expired = self.status(self.built(result=old))
+        removed = expire_exports()
+
+        self.assertEqual(expired.status_code, 410)
+        self.assertEqual(removed, 1)
+        self.assertFalse(Path(settings.PRIVATE_ROOT, old["path"]).exists())
+        self.assertTrue(Path(settings.PRIVATE_ROOT, recent["path"]).exists())
+        self.assertEqual(
+            self.status(self.built(result=old)).status_code, 410
+        )
+
+
+class SeedSocialGraphTests(TestCase):
+    def seed(self, *args):
+        call_command(
+            "seed_social_graph", "--users", "30", "--hashtags", "5",
+            "--posts-per-user", "2", "--seed", "7", *args,
+            stdout=io.StringIO(),
+        )
+
+    def test_seeds_graph_with_both_follow_tables(self):
+        self.seed("--prefix", "run")
+
+        self.assertEqual(
+            User.objects.filter(username__startswith="run-user").count(), 30
+        )
+        self.assertEqual(
+            Hashtag.objects.filter(name__startswith="#run-tag").count(), 5
+        )
+        self.assertEqual(Post.objects.count(), 60)
+        followings = set(User.followings.through.objects.values_list(
+            "from_user_id", "to_user_id"
+        ))
+        followers = set(User.followers.through.objects.values_list(
+            "to_user_id", "from_user_id"
+        ))
+        self.assertTrue(followings)
+        self.assertEqual(followings, followers)
+
+    def test_taken_prefix_is_refused_before_writing(self):
+        Hashtag.objects.create(name="run-tag1")
+
+        with self.assertRaisesMessage(CommandError, "run- are taken"):
+            self.seed("--prefix", "run")
+        self.assertFalse(User.objects.exists())
+
+
+class DataTransferTests(TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user(
+            "me@test.com", "password", username="me"
+        )
+        self.ann = User.objects.create_user(
+            "ann@test.com", "password", username="ann"
+        )
+        self.gone = User.objects.create_user(
+            "gone@test.com", "password", username="gone"
+        )
+        tag = Hashtag.objects.create(name="x")
+        self.post = Post.objects.create(
+            title="Kept", content="C", author=self.ann
+        )
+        gone_post = Post.objects.create(
+            title="Gone", content="C", author=self.gone
+        )
+        self.post.hashtags.add(tag)
+        gone_post.hashtags.add(tag)
+        Like.objects.create(liker=self.gone, post=self.post)
+        Like.objects.create(liker=self.me, post=gone_post)
+        Like.objects.create(liker=self.me, post=self.post)
+        Comment.objects.create(post=self.post, author=self.gone, content="C")
+        Comment.objects.create(post=gone_post, author=self.me, content="C")
+        for follower, followed in (
+            (self.gone, self.ann), (self.ann, self.gone), (self.me, self.ann)
+        ):
+            follower.followings.add(followed)
+            followed.followers.add(follower)
+        soft_delete_user(self.gone)
+        self.directory = Path(tempfile.mkdtemp())
+
+    def test_export_leaves_out_rows_of_soft_deleted_users(self):
+        call_command("export_data", self.directory, stdout=io.StringIO())
+        User.all_objects.all().delete()
+        Hashtag.objects.all().delete()
+
+        call_command("import_data", self.directory, stdout=io.StringIO())
+
+        self.assertEqual(
+            sorted(User.objects.values_list("username", flat=True)),
+            ["ann", "me"]
+        )
+        post = Post.objects.get()
+        self.assertEqual(post.title, "Kept")
+        self.assertEqual(
+            list(post.hashtags.values_list("name", flat=True)), ["#x"]
+        )
+        self.assertEqual(
+            list(Like.objects.values_list("liker__username", flat=True)),
+            ["me"]
+        )
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(
+            list(User.followings.through.objects.values_list(
+                "from_user__username", "to_user__username"
+            )),
+            [("me", "ann")]
+        )
+
+    def test_import_twice_adds_nothing(self):
+        call_command("export_data", self.directory, stdout=io.StringIO())
+        tables = (Post.all_objects, Like.objects, Comment.all_objects,
+                  Post.hashtags.through.objects,
+                  User.followings.through.objects)
+        counts = [manager.count() for manager in tables]
+
+        call_command("import_data", self.directory, stdout=io.StringIO())
+        # Interrupted after the likes of the first run
+        Like.objects.filter(liker=self.me, post=self.post).delete()
+        call_command("import_data", self.directory, stdout=io.StringIO())
+
+        self.assertEqual([manager.count() for manager in tables], counts)
+        self.assertTrue(
+            Like.objects.filter(liker=self.me, post=self.post).exists()
+        )
+
+    def test_existing_accounts_keep_credentials_and_permissions(self):
+        call_command("export_data", self.directory, stdout=io.StringIO())
+        self.ann.set_password("new password")
+        self.ann.is_staff = True
+        self.ann.save()
+
+        call_command("import_data", self.directory, stdout=io.StringIO())
+        self.ann.refresh_from_db()
+        self.assertTrue(self.ann.check_password("new password"))
+        self.assertTrue(self.ann.is_staff)
+
+        call_command(
+            "import_data", self.directory, "--overwrite",
+            stdout=io.StringIO()
+        )
+        self.ann.refresh_from_db()
+        self.assertTrue(self.ann.check_password("password"))
+        self.assertFalse(self.ann.is_staff)
+
+    def test_taken_username_is_numbered(self):
+        call_command("export_data", self.directory, stdout=io.StringIO())
+        Post.all_objects.all().delete()
+        User.all_objects.exclude(pk=self.me.pk).delete()
+        # Another account has taken the names of ann and of its rename
+        User.objects.create_user("other@test.com", "password", username="ann")
+        User.objects.create_user(
+            "third@test.com", "password", username="ann-2"
+        )
+        stdout = io.StringIO()
+
+        call_command("import_data", self.directory, stdout=stdout)
+
+        self.assertEqual(
+            User.objects.get(email="ann@test.com").username, "ann-3"
+        )
+        self.assertIn("ann@test.com imported as ann-3", stdout.getvalue())
+        self.assertEqual(Post.objects.get().author.email, "ann@test.com")
+
+
+# Finishes a task in a separate process, as a Celery pool child would
+CHILD_TASK = (
+    "from unittest import mock\n"
+    "from social_media import metrics\n"
+    "task = mock.Mock()\n"
+    "task.name = 'child-task'\n"
+    "metrics.task_started(task_id='1')\n"
+    "metrics.task_finished(task_id='1', task=task, state='SUCCESS')\n"
+)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            "metrics@test.com", "password", username="metrics"
+        )
+
+    def sample(self, name, registry=REGISTRY, **labels):
+        return registry.get_sample_value(name, labels) or 0
+
+    def test_requests_are_recorded_per_route(self):
+        route = {"route": "social_media:post-list", "method": "GET"}
+        requests = self.sample(
+            "http_request_duration_seconds_count", status="200", **route
+        )
+        queries = self.sample("http_request_db_queries_sum", **route)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        client.get(reverse("social_media:post-list"))
+
+        self.assertEqual(
+            self.sample(
+                "http_request_duration_seconds_count", status="200", **route
+            ),
+            requests + 1
+        )
+        self.assertGreater(
+            self.sample("http_request_db_queries_sum", **route), queries
+        )
+
+    def test_metrics_are_served_to_allowed_networks(self):
+        response = self.client.get(reverse("metrics"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"http_request_duration_seconds", response.content)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_other_addresses_need_the_token(self):
+        def get(**headers):
+            return self.client.get(
+                reverse("metrics"), REMOTE_ADDR="203.0.113.7", **headers
+            ).status_code
+
+        self.assertEqual(get(), 403)
+        self.assertEqual(get(HTTP_AUTHORIZATION="Bearer wrong"), 403)
+        self.assertEqual(get(HTTP_AUTHORIZATION="Bearer secret"), 200)
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(get(HTTP_AUTHORIZATION="Bearer "), 403)
+
+    def test_task_duration_and_state_are_recorded(self):
+        task = mock.Mock()
+        task.name = "tests.metrics-task"
+        labels = {"task": task.name, "state": "FAILURE"}
+
+        task_started(task_id="metrics-task")
+        task_finished(task_id="metrics-task", task=task, state="FAILURE")
+
+        self.assertEqual(
+            self.sample("celery_task_results_total", **labels), 1
+        )
+        self.assertEqual(
+            self.sample("celery_task_duration_seconds_count", **labels), 1
+        )
+
+    def test_worker_metrics_server_requires_multiprocess_dir(self):
+        with mock.patch.dict(
+            os.environ, {"CELERY_METRICS_PORT": "9100"}
+        ), mock.patch(
+            "social_media.metrics.start_http_server"
+        ) as start_http_server:
+            os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+            with self.assertRaises(ImproperlyConfigured):
+                start_worker_metrics_server()
+            start_http_server.assert_not_called()
+
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp()
+            start_worker_metrics_server()
+
+        port, = start_http_server.call_args.args
+        self.assertEqual(port, 9100)
+        self.assertIsNot(start_http_server.call_args.kwargs["registry"],
+                         REGISTRY)
+
+    def test_samples_of_child_processes_are_aggregated(self):
+        labels = {"task": "child-task", "state": "SUCCESS"}
+        with tempfile.TemporaryDirectory() as directory:
+            for _ in range(2):
+                subprocess.run(
+                    [sys.executable, "-c", CHILD_TASK],
+                    cwd=settings.BASE_DIR,
+                    env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": directory},
+                    check=True,
+                )
+            with mock.patch.dict(
+                os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}
+            ):
+                registry = get_registry()
+
+            self.assertEqual(
+                self.sample("celery_task_results_total", registry, **labels),
+                2
+            )
+            self.assertEqual(
+                self.sample(
+                    "celery_task_duration_seconds_count", registry, **labels
+                ),
+                2
+            )
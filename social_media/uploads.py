@@ -0,0 +1,82 @@
+import hashlib
+import os
+
+from django.core.files import File
+from PIL import Image
+
+from . import sync
+from .models import UploadSession
+
+READ_SIZE = 64 * 1024
+
+
+class ChunkError(Exception):
+    pass
+
+
+def write_chunk(session: UploadSession, stream, length: int, checksum: str):
+    """Append one chunk to the partial file at the session offset.
+    The body is copied in small pieces, so memory does not depend
+    on the chunk or file size."""
+    expected = min(session.chunk_size, session.size - session.offset)
+    if length != expected:
+        raise ChunkError(f"Chunk must be exactly {expected} bytes")
+
+    path = session.file_path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    digest = hashlib.sha256()
+
+    with open(path, "ab+") as file:
+        # Drop the tail of a chunk that was interrupted mid-write
+        file.truncate(session.offset)
+        remaining = length
+        while remaining > 0:
+            data = stream.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            digest.update(data)
+            file.write(data)
+            remaining -= len(data)
+
+        if remaining or digest.hexdigest() != checksum.lower():
+            file.truncate(session.offset)
+            raise ChunkError("Chunk checksum does not match")
+
+    session.offset += length
+    session.save(update_fields=["offset"])
+
+
+def attach_upload(session: UploadSession):
+    """Verify the assembled image and save it to Post.image or User.image"""
+    if not session.is_complete:
+        raise ChunkError(
+            f"Upload is incomplete ({session.offset}/{session.size} bytes)"
+        )
+
+    try:
+        with Image.open(session.file_path) as image:
+            image.verify()
+    except Exception:
+        raise ChunkError("Uploaded file is not a valid image")
+
+    instance = (
+        session.post if session.target == UploadSession.TARGET_POST
+        else session.owner
+    )
+    with open(session.file_path, "rb") as file:
+        # Storage copies File objects chunk by chunk
+        instance.image.save(session.filename, File(file), save=False)
+    instance.save(update_fields=["image"])
+    if session.target == UploadSession.TARGET_POST:
+        sync.track_post(instance)
+
+    discard_upload(session)
+    return instance
+
+
+def discard_upload(session: UploadSession):
+    try:
+        os.remove(session.file_path)
+    except FileNotFoundError:
+        pass
+    session.delete()
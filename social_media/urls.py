@@ -6,20 +6,31 @@ from rest_framework_simplejwt.views import (
     TokenVerifyView
 )
 
+from . import async_views
 from .views import (
     UserViewSet,
     ManageUserView,
     CreateUserView,
     APILogoutView,
+    BatchView,
     PostViewSet,
     ScheduledPostViewSet,
     CommentViewSet,
     HashtagViewSet,
+    UploadSessionViewSet,
     like_unlike,
     follow_unfollow,
     followers,
     followings,
-    liked_posts
+    liked_posts,
+    follow_suggestions,
+    deletion_job_detail,
+    notifications,
+    read_notifications,
+    delta_sync,
+    relationships,
+    personal_data_export,
+    personal_data_export_status
 )
 
 router = routers.DefaultRouter()
@@ -27,6 +38,7 @@ router.register("users", UserViewSet)
 router.register("posts", PostViewSet)
 router.register("hashtags", HashtagViewSet)
 router.register("scheduled_posts", ScheduledPostViewSet)
+router.register("uploads", UploadSessionViewSet)
 
 comment_list = CommentViewSet.as_view(
     actions={"get": "list", "post": "create"}
@@ -53,6 +65,32 @@ urlpatterns = [
     path("users/me/", ManageUserView.as_view(), name="me"),
     path("users/me/followers/", followers, name="user-followers"),
     path("users/me/followings/", followings, name="user-followings"),
+    path("users/relationships/", relationships, name="relationships"),
+    path(
+        "users/me/suggestions/",
+        follow_suggestions,
+        name="follow-suggestions"
+    ),
+    path(
+        "users/me/notifications/",
+        notifications,
+        name="notifications"
+    ),
+    path(
+        "users/me/notifications/read/",
+        read_notifications,
+        name="read-notifications"
+    ),
+    path(
+        "users/me/export/",
+        personal_data_export,
+        name="personal-data-export"
+    ),
+    path(
+        "users/me/export/<uuid:task_id>/",
+        personal_data_export_status,
+        name="personal-data-export-status"
+    ),
     path(
         "users/<int:pk>/follow/",
         follow_unfollow,
@@ -65,6 +103,30 @@ urlpatterns = [
             comment_list,
             name="comment-post",
         ),
+    path(
+        "deletions/<uuid:pk>/",
+        deletion_job_detail,
+        name="deletion-job-detail"
+    ),
+    path("batch/", BatchView.as_view(), name="batch"),
+    path("sync/", delta_sync, name="sync"),
+    path("events/", async_views.event_stream, name="event-stream"),
+    path("async/posts/", async_views.post_list, name="async-post-list"),
+    path(
+        "async/posts/<int:pk>/",
+        async_views.post_detail,
+        name="async-post-detail"
+    ),
+    path(
+        "async/posts/<int:pk>/like/",
+        async_views.like_unlike,
+        name="async-like-unlike-post"
+    ),
+    path(
+        "async/users/<int:pk>/follow/",
+        async_views.follow_unfollow,
+        name="async-follow-unfollow-user"
+    ),
 ] + router.urls
 
 app_name = "social_media"
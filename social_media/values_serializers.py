@@ -0,0 +1,215 @@
+"""Read-only list serialization from .values() rows.
+
+ListSerializer builds a model instance per row and runs the attribute
+lookup and to_representation of every field through DRF. For a list
+serializer whose fields are plain columns, annotations, foreign key
+slugs and many-to-many slugs, ValuesListSerializer fetches dicts with
+.values() instead and converts them with converters compiled once per
+serializer class. The output is the same as the instance path, which is
+still used for anything else: lists of objects, related managers,
+fields that cannot be compiled, or querysets that lack an annotation.
+"""
+from functools import partial
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import QuerySet
+from django.db.models.query import ModelIterable
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+# Fields whose to_representation returns database values unchanged
+PASSTHROUGH = (
+    serializers.BooleanField.to_representation,
+    serializers.CharField.to_representation,
+    serializers.IntegerField.to_representation,
+)
+
+
+class Column:
+    """One output field read from the `expression` of a values() row.
+    `converter(context)` returns the function applied to values that are
+    not None, no converter means the value is output as is."""
+
+    def __init__(self, name, expression, converter=None, annotation=False):
+        self.name = name
+        self.expression = expression
+        self.converter = converter
+        self.annotation = annotation
+
+
+class ManySlugs:
+    """A many-to-many slug list, fetched for all rows in one query on
+    the through table ordered by slug"""
+
+    def __init__(self, name, field, slug_field):
+        self.name = name
+        self.through = field.remote_field.through
+        self.source = field.m2m_field_name()
+        self.slug = f"{field.m2m_reverse_field_name()}__{slug_field}"
+
+    def fetch(self, pks) -> dict:
+        slugs = {pk: [] for pk in pks}
+        rows = self.through.objects.filter(
+            **{f"{self.source}__in": pks}
+        ).order_by(self.slug).values_list(f"{self.source}_id", self.slug)
+        for pk, slug in rows:
+            slugs[pk].append(slug)
+        return slugs
+
+
+def file_converter(model_field, context):
+    """FileField.to_representation for a stored file name"""
+    request = context.get("request")
+    storage = model_field.storage
+
+    def convert(name):
+        if not name:
+            return None
+        url = storage.url(name)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    return convert
+
+
+def compile_field(model, name, field):
+    """Column or ManySlugs for a serializer field, None when it has to
+    go through the instance path"""
+    annotation = getattr(field, "annotation", None)
+    if annotation is not None:
+        # CountField and RelationshipField read queries.py annotations
+        return Column(name, annotation, annotation=True)
+    if field.source == "*":
+        return None
+
+    if isinstance(field, serializers.ManyRelatedField):
+        child = field.child_relation
+        model_field = model._meta.get_field(field.source)
+        if (
+            not isinstance(child, serializers.SlugRelatedField)
+            or not isinstance(model_field, models.ManyToManyField)
+            or type(model_field.related_model._default_manager)
+            is not models.Manager
+        ):
+            return None
+        return ManySlugs(name, model_field, child.slug_field)
+
+    expression = "__".join(field.source_attrs)
+    if isinstance(field, serializers.SlugRelatedField):
+        return Column(name, f"{expression}__{field.slug_field}")
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        if field.pk_field is not None:
+            return None
+        return Column(name, expression)
+    if isinstance(field, serializers.RelatedField) or isinstance(
+        field, serializers.BaseSerializer
+    ):
+        return None
+
+    try:
+        model_field = model._meta.get_field(expression)
+    except FieldDoesNotExist:
+        # Anything else is read from an annotation of the same name
+        model_field = None
+    if isinstance(field, serializers.FileField):
+        use_url = getattr(
+            field, "use_url", api_settings.UPLOADED_FILES_USE_URL
+        )
+        if model_field is None or not use_url:
+            return None
+        return Column(
+            name, expression, partial(file_converter, model_field)
+        )
+    if type(field).get_attribute is not serializers.Field.get_attribute:
+        return None
+    if type(field).to_representation in PASSTHROUGH:
+        converter = None
+    else:
+        def converter(context):
+            return field.to_representation
+    return Column(
+        name, expression, converter, annotation=model_field is None
+    )
+
+
+class Plan:
+    """The compiled fields of a serializer class"""
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self.columns = [
+            field for field in fields if isinstance(field, Column)
+        ]
+        self.annotations = {
+            column.expression
+            for column in self.columns
+            if column.annotation
+        }
+
+    def applies_to(self, queryset) -> bool:
+        return (
+            queryset.model is self.model
+            and queryset._iterable_class is ModelIterable
+            and self.annotations.issubset(queryset.query.annotations)
+        )
+
+    def serialize(self, queryset, context) -> list:
+        pk_name = self.model._meta.pk.attname
+        rows = list(queryset.prefetch_related(None).values(
+            *{pk_name, *(column.expression for column in self.columns)}
+        ))
+        pks = [row[pk_name] for row in rows]
+        steps = []
+        for field in self.fields:
+            if isinstance(field, ManySlugs):
+                steps.append((field.name, None, None, field.fetch(pks)))
+            else:
+                convert = field.converter and field.converter(context)
+                steps.append((field.name, field.expression, convert, None))
+
+        result = []
+        for row in rows:
+            item = {}
+            for name, expression, convert, slugs in steps:
+                if slugs is not None:
+                    item[name] = slugs[row[pk_name]]
+                    continue
+                value = row[expression]
+                if convert is not None and value is not None:
+                    value = convert(value)
+                item[name] = value
+            result.append(item)
+        return result
+
+
+PLANS = {}
+
+
+def plan_for(serializer) -> Plan:
+    """Compiled fields of the serializer's class, None when a field
+    cannot be compiled"""
+    cls = type(serializer)
+    if cls not in PLANS:
+        model = serializer.Meta.model
+        fields = [
+            compile_field(model, name, field)
+            for name, field in serializer.fields.items()
+            if not field.write_only
+        ]
+        PLANS[cls] = None if None in fields else Plan(model, fields)
+    return PLANS[cls]
+
+
+class ValuesListSerializer(serializers.ListSerializer):
+    """ListSerializer that serializes unevaluated querysets from
+    .values() rows when the child serializer allows it"""
+
+    def to_representation(self, data):
+        if isinstance(data, QuerySet) and data._result_cache is None:
+            plan = plan_for(self.child)
+            if plan is not None and plan.applies_to(data):
+                return plan.serialize(data, self.context)
+        return super().to_representation(data)
@@ -1,11 +1,19 @@
+import uuid
+
+from celery.result import AsyncResult
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Exists, OuterRef, Q
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.http import FileResponse, StreamingHttpResponse
+from django.urls import reverse
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import generics, mixins, viewsets, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.token_blacklist.models import (
@@ -15,8 +23,29 @@ from rest_framework_simplejwt.token_blacklist.models import (
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from . import autocomplete, deletion, outbox, personal_data, sync
+from .bulk_posts import create_posts
+from .batch import batch_cost, batch_wrote, run_batch
 from .permissions import IsAuthorOrReadOnly
-from .models import Post, Hashtag, Like, Comment, ScheduledPost
+from .explore import ranked_ids
+from .queries import (
+    hashtag_names,
+    post_list_queryset,
+    with_is_liked,
+    with_hashtag_counts,
+    with_post_counts,
+    with_relationships,
+    with_user_counts
+)
+from .models import (
+    Post,
+    Hashtag,
+    Comment,
+    DeletionJob,
+    ScheduledPost,
+    UploadSession,
+    normalize_hashtag
+)
 from .serializers import (
     CreateUserSerializer,
     UserSerializer,
@@ -31,8 +60,23 @@ from .serializers import (
     CommentSerializer,
     HashtagSerializer,
     HashtagListSerializer,
-    HashtagDetailSerializer
+    HashtagDetailSerializer,
+    SuggestedUserSerializer,
+    BatchSerializer,
+    BulkPostItemSerializer,
+    BulkScheduledPostItemSerializer,
+    BulkCreateResultSerializer,
+    BatchResultSerializer,
+    RelationshipLookupSerializer,
+    RelationshipSerializer,
+    NotificationSerializer,
+    DeletionJobSerializer,
+    UploadSessionSerializer,
+    SyncPageSerializer
 )
+from .suggestions import suggestions_for
+from .tasks import build_personal_export, delete_in_chunks
+from .uploads import ChunkError, write_chunk, attach_upload, discard_upload
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -55,7 +99,20 @@ class UserViewSet(
         if username:
             self.queryset = self.queryset.filter(username__icontains=username)
 
-        return self.queryset.distinct()
+        queryset = self.queryset.distinct()
+        user = self.request.user
+        if self.action == "list":
+            return with_relationships(with_user_counts(queryset), user)
+        if self.action == "retrieve":
+            related_users = with_relationships(
+                with_user_counts(get_user_model().objects.all()), user
+            )
+            return queryset.prefetch_related(
+                Prefetch("followers", queryset=related_users),
+                Prefetch("followings", queryset=related_users),
+                Prefetch("posts", queryset=post_list_queryset()),
+            )
+        return queryset
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -89,13 +146,38 @@ class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     def get_object(self):
         return self.request.user
 
+    @extend_schema(responses={202: DeletionJobSerializer})
+    def destroy(self, request, *args, **kwargs):
+        """The account is hidden at once and removed in the background"""
+        job = deletion.soft_delete_user(self.get_object())
+        return deletion_job_response(request, job)
+
+
+def deletion_job_response(request, job):
+    transaction.on_commit(lambda: delete_in_chunks.delay(str(job.id)))
+    serializer = DeletionJobSerializer(job, context={"request": request})
+    return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+@extend_schema(responses=DeletionJobSerializer)
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def deletion_job_detail(request, pk):
+    """Progress of an account or post deletion. The account is gone by
+    then, so the unguessable job id is the only credential."""
+    job = get_object_or_404(DeletionJob, pk=pk)
+    serializer = DeletionJobSerializer(job, context={"request": request})
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def followers(request):
     """The user can see all the users that follow him"""
     user = request.user
-    user_followers = user.followers.all()
+    user_followers = with_relationships(
+        with_user_counts(user.followers.all()), user
+    )
     serializer = UserListSerializer(user_followers, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -105,11 +187,229 @@ def followers(request):
 def followings(request):
     """The user can see the list of people he is following"""
     user = request.user
-    user_followings = user.followings.all()
+    user_followings = with_relationships(
+        with_user_counts(user.followings.all()), user
+    )
     serializer = UserListSerializer(user_followings, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+@extend_schema(
+    request=RelationshipLookupSerializer,
+    responses=RelationshipSerializer(many=True)
+)
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def relationships(request):
+    """Whether the user follows and is followed by each of the given
+    users, for up to RELATIONSHIPS_MAX_IDS ids in one query"""
+    lookup = RelationshipLookupSerializer(data=request.data)
+    lookup.is_valid(raise_exception=True)
+    rows = with_relationships(
+        get_user_model().objects.filter(pk__in=lookup.validated_data["ids"]),
+        request.user
+    ).order_by("id").values("id", "is_following", "follows_you")
+    serializer = RelationshipSerializer(rows, many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@extend_schema(responses=SuggestedUserSerializer(many=True))
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def follow_suggestions(request):
+    """Users followed by the most of the people the user follows,
+    refreshed daily"""
+    mutual = dict(suggestions_for(request.user.id))
+    users = with_relationships(
+        with_user_counts(
+            get_user_model().objects.filter(pk__in=mutual, is_active=True)
+        ),
+        request.user
+    ).exclude(followers=request.user).in_bulk()
+    suggested = []
+    for user_id, count in mutual.items():
+        if user_id in users:
+            users[user_id].mutual_followings = count
+            suggested.append(users[user_id])
+    serializer = SuggestedUserSerializer(suggested, many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@extend_schema(responses=NotificationSerializer(many=True))
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def notifications(request):
+    """Latest notifications, several likes or comments on one post and
+    follows are grouped while unread"""
+    latest = request.user.notifications.select_related("actor")[
+        :settings.NOTIFICATIONS_PAGE_SIZE
+    ]
+    serializer = NotificationSerializer(latest, many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            name="since",
+            type=OpenApiTypes.INT,
+            description="Token of the previous page, without it only the "
+                        "current token is returned"
+        )
+    ],
+    responses={200: SyncPageSerializer, 410: None}
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def delta_sync(request):
+    """Posts, comments, likes and follow edges created, updated or
+    deleted after the token, oldest first. Take the token before the
+    first download, then ask again with the returned token while `more`
+    is true. 410 means that the token has expired and everything has to
+    be downloaded again."""
+    if "since" not in request.query_params:
+        return Response(
+            {"token": sync.current_token(), "more": False, "changes": []}
+        )
+    try:
+        since = int(request.query_params["since"])
+    except ValueError:
+        return Response(
+            {"detail": "since must be an integer"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        changes, token, more = sync.changes_since(request.user, since)
+    except sync.TokenExpired:
+        return Response(
+            {"detail": "The token has expired, download everything again",
+             "token": sync.current_token()},
+            status=status.HTTP_410_GONE
+        )
+    return Response({
+        "token": token,
+        "more": more,
+        "changes": sync.serialize(changes, request),
+    })
+
+
+@extend_schema(request=None, responses={204: None})
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def read_notifications(request):
+    """Mark all notifications as read, new events start new groups"""
+    request.user.notifications.filter(is_read=False).update(is_read=True)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def start_personal_export(user) -> str:
+    """Id of the archive task of the user. Requests reuse the task until
+    it fails or its archive could have expired, then start a new one."""
+    key = f"personal-export:{user.id}"
+    task_id = str(uuid.uuid4())
+    timeout = settings.PERSONAL_EXPORT_EXPIRY_SECONDS
+    if not cache.add(key, task_id, timeout):
+        pending = cache.get(key)
+        if pending is not None and not AsyncResult(pending).failed():
+            return pending
+        cache.set(key, task_id, timeout)
+    build_personal_export.apply_async((user.id,), task_id=task_id)
+    return task_id
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            name="output",
+            type=OpenApiTypes.STR,
+            enum=["ndjson", "zip"],
+            description="ndjson (default) or a zip with a file per section"
+        )
+    ],
+    responses={200: OpenApiTypes.BINARY, 202: OpenApiTypes.OBJECT}
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def personal_data_export(request):
+    """The user can download everything he has on the platform.
+    Large accounts get a zip built in the background instead,
+    to be downloaded from the returned status url"""
+    user = request.user
+    output = request.query_params.get("output", "ndjson")
+    if output not in ("ndjson", "zip"):
+        return Response(
+            {"detail": "output must be ndjson or zip"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if personal_data.record_count(user) > settings.PERSONAL_EXPORT_SYNC_LIMIT:
+        task_id = start_personal_export(user)
+        return Response(
+            {
+                "task_id": task_id,
+                "status_url": reverse(
+                    "social_media:personal-data-export-status",
+                    args=[task_id]
+                ),
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+
+    filename = f"{user.username}-export.{output}"
+    if output == "zip":
+        response = StreamingHttpResponse(
+            personal_data.zip_stream(user), content_type="application/zip"
+        )
+    else:
+        response = StreamingHttpResponse(
+            personal_data.ndjson_stream(user),
+            content_type="application/x-ndjson"
+        )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+@extend_schema(
+    responses={
+        200: OpenApiTypes.BINARY,
+        202: OpenApiTypes.OBJECT,
+        410: OpenApiTypes.OBJECT,
+    }
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def personal_data_export_status(request, task_id):
+    """The archive once it is built, its build status until then.
+    Only the owner can download it, 410 once it has expired."""
+    result = AsyncResult(str(task_id))
+    if not result.ready():
+        return Response(
+            {"status": result.status}, status=status.HTTP_202_ACCEPTED
+        )
+    if result.failed():
+        return Response(
+            {"status": result.status},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    export = result.result
+    if not isinstance(export, dict) or export.get(
+        "user_id"
+    ) != request.user.id:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    file = personal_data.open_export(export["path"])
+    if file is None:
+        return Response(
+            {"detail": "The export has expired, request a new one"},
+            status=status.HTTP_410_GONE
+        )
+    return FileResponse(
+        file,
+        as_attachment=True,
+        filename=f"{request.user.username}-export.zip",
+    )
+
+
 class APILogoutView(APIView):
     """The user can log out from his account"""
     permission_classes = (IsAuthenticated,)
@@ -128,6 +428,40 @@ class APILogoutView(APIView):
         return Response({"status": "Logout successful"})
 
 
+class BatchView(APIView):
+    """Users can send up to BATCH_MAX_REQUESTS API calls in one request.
+    Each sub-request gets its own status and body in the same order."""
+    permission_classes = (IsAuthenticated,)
+
+    @property
+    def throttle_cost(self):
+        data = self.request.data
+        requests = data.get("requests") if isinstance(data, dict) else None
+        if not isinstance(requests, list):
+            return 1
+        return batch_cost(
+            item for item in requests[:settings.BATCH_MAX_REQUESTS]
+            if isinstance(item, dict) and isinstance(item.get("path"), str)
+        )
+
+    @extend_schema(
+        request=BatchSerializer,
+        responses=BatchResultSerializer(many=True)
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data["requests"]
+        results = run_batch(
+            request, items, parallel=serializer.validated_data["parallel"]
+        )
+        # Read by replica_routing_middleware instead of the batch's method
+        request._request.batch_wrote = batch_wrote(items, results)
+        return Response(
+            [{"status": code, "body": body} for code, body in results]
+        )
+
+
 class HashtagViewSet(
     generics.ListCreateAPIView,
     generics.RetrieveAPIView,
@@ -139,6 +473,15 @@ class HashtagViewSet(
     serializer_class = HashtagSerializer
     permission_classes = (IsAuthenticated,)
 
+    def get_queryset(self):
+        if self.action == "list":
+            return with_hashtag_counts(self.queryset)
+        if self.action == "retrieve":
+            return self.queryset.prefetch_related(
+                Prefetch("posts", queryset=post_list_queryset())
+            )
+        return self.queryset
+
     def get_serializer_class(self):
         if self.action == "list":
             return HashtagListSerializer
@@ -146,6 +489,58 @@ class HashtagViewSet(
             return HashtagDetailSerializer
         return self.serializer_class
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="q",
+                type=OpenApiTypes.STR,
+                required=True,
+                description="Beginning of the hashtag, with or without #"
+            ),
+            OpenApiParameter(
+                name="limit",
+                type=OpenApiTypes.INT,
+                description="Number of completions, 10 by default"
+            ),
+        ],
+        responses=HashtagListSerializer(many=True)
+    )
+    @action(detail=False, methods=["GET"])
+    def autocomplete(self, request):
+        """Most used hashtags starting with the typed text"""
+        prefix = normalize_hashtag(request.query_params.get("q", ""))
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            return Response(
+                {"detail": "limit must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        completions = autocomplete.complete(
+            prefix, min(max(limit, 1), settings.AUTOCOMPLETE_MAX_RESULTS)
+        )
+        return Response([
+            {"id": pk, "name": name, "posts": posts}
+            for pk, name, posts in completions
+        ])
+
+
+def bulk_create_response(request, model, item_serializer):
+    """Validate a list of posts and create them with their hashtags
+    in a constant number of statements"""
+    if len(request.data) > settings.BULK_POSTS_MAX:
+        return Response(
+            {"detail": f"At most {settings.BULK_POSTS_MAX} posts at once"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    serializer = item_serializer(data=request.data, many=True)
+    serializer.is_valid(raise_exception=True)
+    posts = create_posts(model, request.user, serializer.validated_data)
+    return Response(
+        {"created": len(posts), "ids": [post.pk for post in posts]},
+        status=status.HTTP_201_CREATED
+    )
+
 
 class PostViewSet(
     mixins.ListModelMixin,
@@ -160,13 +555,17 @@ class PostViewSet(
     the post, how many people liked it, and comments."""
     queryset = Post.objects.select_related(
         "author"
-    ).prefetch_related("hashtags")
+    ).prefetch_related(hashtag_names())
     serializer_class = PostSerializer
     permission_classes = (IsAuthenticated, IsAuthorOrReadOnly)
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            sync.track_post(serializer.save())
+
     def get_queryset(self):
         user = self.request.user
         user_followings = user.followings.all()
@@ -183,16 +582,18 @@ class PostViewSet(
         if title:
             queryset = queryset.filter(title__icontains=title)
 
-        return queryset.annotate(
-            is_liked=Exists(
-                Like.objects.filter(
-                    liker=self.request.user, post_id=OuterRef("pk")
+        if self.action == "retrieve":
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "comments",
+                    queryset=Comment.objects.select_related("author")
                 )
             )
-        )
+
+        return with_is_liked(with_post_counts(queryset), user)
 
     def get_serializer_class(self):
-        if self.action == "list":
+        if self.action in ("list", "explore"):
             return PostListSerializer
         if self.action == "retrieve":
             return PostDetailSerializer
@@ -218,6 +619,66 @@ class PostViewSet(
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    @extend_schema(responses={202: DeletionJobSerializer})
+    def destroy(self, request, *args, **kwargs):
+        """The post is hidden at once, its likes and comments are
+        removed in the background"""
+        job = deletion.soft_delete_post(self.get_object())
+        return deletion_job_response(request, job)
+
+    @extend_schema(
+        request=BulkPostItemSerializer(many=True),
+        responses={201: BulkCreateResultSerializer}
+    )
+    @action(detail=False, methods=["POST"])
+    def bulk(self, request):
+        """Create many posts at once, hashtags are taken from `hashtags`
+        and from #words in the content"""
+        return bulk_create_response(request, Post, BulkPostItemSerializer)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="offset",
+                type=OpenApiTypes.INT,
+                description="Position of the first post in the ranking"
+            ),
+            OpenApiParameter(
+                name="limit",
+                type=OpenApiTypes.INT,
+                description="Number of posts, "
+                            f"{settings.EXPLORE_PAGE_SIZE} by default"
+            ),
+        ],
+        responses=PostListSerializer(many=True)
+    )
+    @action(detail=False, methods=["GET"])
+    def explore(self, request):
+        """Most engaging recent posts of all users, ranked
+        periodically by engagement that decays with the post age"""
+        try:
+            offset = max(int(request.query_params.get("offset", 0)), 0)
+            limit = min(
+                max(int(request.query_params.get(
+                    "limit", settings.EXPLORE_PAGE_SIZE
+                )), 1),
+                settings.EXPLORE_SIZE
+            )
+        except ValueError:
+            return Response(
+                {"detail": "offset and limit must be integers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        post_ids = ranked_ids(offset, limit)
+        posts = with_is_liked(
+            post_list_queryset().filter(pk__in=post_ids), request.user
+        ).in_bulk()
+        # Posts deleted since the ranking ran are skipped
+        page = [posts[post_id] for post_id in post_ids if post_id in posts]
+        serializer = self.get_serializer(page, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
 
 class ScheduledPostViewSet(
     viewsets.ModelViewSet
@@ -244,13 +705,24 @@ class ScheduledPostViewSet(
             return ScheduledPostDetailSerializer
         return self.serializer_class
 
+    @extend_schema(
+        request=BulkScheduledPostItemSerializer(many=True),
+        responses={201: BulkCreateResultSerializer}
+    )
+    @action(detail=False, methods=["POST"])
+    def bulk(self, request):
+        """Schedule many posts at once"""
+        return bulk_create_response(
+            request, ScheduledPost, BulkScheduledPostItemSerializer
+        )
+
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def liked_posts(request):
     """Users can see the lists of posts they have liked"""
     user = request.user
-    posts = Post.objects.filter(likes__liker=user)
+    posts = post_list_queryset().filter(likes__liker=user)
     serializer = PostListSerializer(posts, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -264,15 +736,13 @@ def follow_unfollow(request, pk):
     user_followers = user_to_follow.followers.all()
 
     if current_user in user_followers:
-        user_to_follow.followers.remove(current_user.id)
-        current_user.followings.remove(user_to_follow)
+        outbox.unfollow(current_user, user_to_follow)
         return Response(
             {"message": f"You are not following "
                         f"{user_to_follow.username} anymore"}
         )
 
-    user_to_follow.followers.add(current_user.id)
-    current_user.followings.add(user_to_follow.id)
+    outbox.follow(current_user, user_to_follow)
     return Response(data={"message": f"You are following "
                                      f"{user_to_follow.username}"})
 
@@ -283,16 +753,14 @@ def like_unlike(request, pk):
     """Users can like & unlike posts"""
     user = request.user
     post = get_object_or_404(Post, pk=pk)
-    like = Like.objects.filter(liker=user, post=post)
 
-    if like:
-        like.delete()
+    if outbox.unlike(user, post):
         return Response(
             {"message": "You remove like from this post"},
             status=status.HTTP_204_NO_CONTENT,
         )
 
-    Like.objects.create(liker=user, post=post)
+    outbox.like(user, post)
     return Response(
         {"message": "You liked this post"},
         status=status.HTTP_201_CREATED
@@ -311,4 +779,116 @@ class CommentViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         post = get_object_or_404(Post, pk=self.kwargs["pk"])
-        serializer.save(author=self.request.user, post=post)
+        outbox.comment(serializer, self.request.user, post)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            comment = serializer.save()
+            sync.track_comment(comment, comment.post)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            sync.track_comment(instance, instance.post, deleted=True)
+            instance.delete()
+
+
+class UploadSessionViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet
+):
+    """Users can upload post and profile images in fixed-size chunks.
+    After a dropped connection the upload resumes from the offset
+    returned by the session, and a commit attaches the assembled image."""
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return self.queryset.filter(owner=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(
+            owner=self.request.user, chunk_size=settings.UPLOAD_CHUNK_SIZE
+        )
+
+    def perform_destroy(self, instance):
+        discard_upload(instance)
+
+    @extend_schema(
+        request=OpenApiTypes.BINARY,
+        parameters=[
+            OpenApiParameter(
+                name="Upload-Offset",
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.HEADER,
+                required=True,
+                description="Offset of the chunk, must equal session offset"
+            ),
+            OpenApiParameter(
+                name="Upload-Checksum",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER,
+                required=True,
+                description="SHA-256 hex digest of the chunk"
+            )
+        ]
+    )
+    @action(detail=True, methods=["PUT"])
+    def chunk(self, request, pk=None):
+        """Send the next chunk of the file as the raw request body"""
+        with transaction.atomic():
+            session = get_object_or_404(
+                self.get_queryset().select_for_update(), pk=pk
+            )
+            try:
+                offset = int(request.headers.get("Upload-Offset", ""))
+                length = int(request.headers.get("Content-Length", ""))
+            except ValueError:
+                return Response(
+                    {"detail": "Upload-Offset and Content-Length "
+                               "headers are required"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            if offset != session.offset:
+                return Response(
+                    UploadSessionSerializer(session).data,
+                    status=status.HTTP_409_CONFLICT
+                )
+
+            try:
+                write_chunk(
+                    session,
+                    request.stream,
+                    length,
+                    request.headers.get("Upload-Checksum", "")
+                )
+            except ChunkError as error:
+                return Response(
+                    {"detail": str(error)},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        return Response(UploadSessionSerializer(session).data)
+
+    @action(detail=True, methods=["POST"])
+    def commit(self, request, pk=None):
+        """Attach the fully uploaded image to the post or the user"""
+        with transaction.atomic():
+            session = get_object_or_404(
+                self.get_queryset().select_for_update(), pk=pk
+            )
+            try:
+                instance = attach_upload(session)
+            except ChunkError as error:
+                return Response(
+                    {"detail": str(error)},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        return Response(
+            {"image": request.build_absolute_uri(instance.image.url)},
+            status=status.HTTP_201_CREATED
+        )
@@ -11,6 +11,11 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "social_media_api.settings")
+# Persistent connections are not closed by the thread that opened them
+# under ASGI and pile up, connections are opened per request instead
+os.environ.setdefault("CONN_MAX_AGE", "0")
+os.environ.setdefault(
+    "DJANGO_SETTINGS_MODULE", "social_media_api.settings.prod"
+)
 
 application = get_asgi_application()
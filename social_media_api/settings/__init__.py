@@ -0,0 +1,3 @@
+"""Settings profiles: social_media_api.settings.dev for manage.py and
+runserver, social_media_api.settings.prod for gunicorn, uvicorn and
+Celery. Both extend social_media_api.settings.base."""
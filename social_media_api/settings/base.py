@@ -0,0 +1,376 @@
+"""
+Django settings for social_media_api project, shared by the dev and
+prod profiles next to this module.
+
+Generated by 'django-admin startproject' using Django 4.2.1.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/4.2/ref/settings/
+"""
+import os
+from datetime import timedelta
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = os.getenv("SECRET_KEY")
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = False
+
+ALLOWED_HOSTS = []
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    "django.contrib.admin",
+    "django.contrib.auth",
+    "django.contrib.contenttypes",
+    "django.contrib.sessions",
+    "django.contrib.messages",
+    "django.contrib.staticfiles",
+    "django_celery_beat",
+    "drf_spectacular",
+    "rest_framework",
+    "rest_framework_simplejwt",
+    "rest_framework_simplejwt.token_blacklist",
+    "social_media",
+]
+
+MIDDLEWARE = [
+    "social_media.metrics.metrics_middleware",
+    "django.middleware.security.SecurityMiddleware",
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.middleware.common.CommonMiddleware",
+    "django.middleware.csrf.CsrfViewMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "social_media.middleware.replica_routing_middleware",
+    "django.contrib.messages.middleware.MessageMiddleware",
+    "django.middleware.clickjacking.XFrameOptionsMiddleware",
+]
+
+ROOT_URLCONF = "social_media_api.urls"
+
+TEMPLATES = [
+    {
+        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "DIRS": [],
+        "APP_DIRS": True,
+        "OPTIONS": {
+            "context_processors": [
+                "django.template.context_processors.debug",
+                "django.template.context_processors.request",
+                "django.contrib.auth.context_processors.auth",
+                "django.contrib.messages.context_processors.messages",
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = "social_media_api.wsgi.application"
+
+
+# Database
+# https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.getenv("POSTGRES_DB"),
+        "USER": os.getenv("POSTGRES_USER"),
+        "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
+        "HOST": os.getenv("POSTGRES_HOST"),
+        "PORT": os.getenv("POSTGRES_PORT"),
+    }
+}
+
+# Read replicas, e.g. POSTGRES_REPLICA_HOSTS=replica1,replica2.
+# Safe requests read from them through social_media.db_router.ReplicaRouter
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(","))
+):
+    alias = f"replica_{index}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["social_media.db_router.ReplicaRouter"]
+
+# Users read from the primary for this long after a write
+REPLICA_PIN_SECONDS = 5
+# Replicas lagging more than this many seconds are skipped
+REPLICA_MAX_LAG = 2
+REPLICA_CHECK_INTERVAL = 5
+
+
+# Password validation
+# https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
+    },
+    {
+        "NAME": "django.contrib.auth.password_validation.MinimumLengthValidator",
+    },
+    {
+        "NAME": "django.contrib.auth.password_validation.CommonPasswordValidator",
+    },
+    {
+        "NAME": "django.contrib.auth.password_validation.NumericPasswordValidator",
+    },
+]
+
+AUTH_USER_MODEL = "social_media.User"
+
+# Internationalization
+# https://docs.djangoproject.com/en/4.2/topics/i18n/
+
+LANGUAGE_CODE = "en-us"
+
+TIME_ZONE = "Europe/Kiev"
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/4.2/howto/static-files/
+
+STATIC_URL = "static/"
+
+MEDIA_URL = "/media/"
+MEDIA_ROOT = "/vol/web/media"
+
+# Media is served by social_media.media.serve_media. Set the backend to
+# "nginx" (X-Accel-Redirect) or "apache" (X-Sendfile) to let the front
+# server send the bytes instead of a Python worker.
+MEDIA_SENDFILE_BACKEND = os.getenv("MEDIA_SENDFILE_BACKEND")
+MEDIA_ACCEL_REDIRECT_PREFIX = "/protected/media/"
+# Only the final post and profile images are served, with a year of
+# caching since their names carry a uuid
+MEDIA_PUBLIC_PREFIXES = ("uploads/posts/", "uploads/users/")
+MEDIA_IMMUTABLE_PREFIXES = ("uploads/posts/", "uploads/users/")
+
+# Files that must not be public (social_media.media.private_storage),
+# kept outside MEDIA_ROOT where serve_media cannot reach them
+PRIVATE_ROOT = "/vol/web/private"
+
+# Resumable uploads (social_media.views.UploadSessionViewSet)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+
+# Personal data export (social_media.personal_data). Accounts with more
+# records than the limit get their archive built by a Celery task, it
+# can be downloaded by its owner until it expires.
+PERSONAL_EXPORT_STREAM_CHUNK = 64 * 1024
+PERSONAL_EXPORT_SYNC_LIMIT = 50_000
+PERSONAL_EXPORT_EXPIRY_SECONDS = 24 * 60 * 60
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": (
+        "rest_framework_simplejwt.authentication.JWTAuthentication",
+    ),
+    "DEFAULT_THROTTLE_CLASSES": [
+        "social_media.throttling.AnonGCRAThrottle",
+        "social_media.throttling.UserGCRAThrottle",
+    ],
+    "DEFAULT_THROTTLE_RATES": {"anon": "100/day", "user": "300/day"},
+    "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": (
+        "social_media.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+}
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+# Shared cache, so that per-user state (e.g. replica pins) is the same
+# in every worker. Falls back to per-process memory without Redis.
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+
+# GCRA throttle state lives in Redis (social_media.throttling)
+THROTTLE_REDIS_URL = REDIS_URL
+THROTTLE_REDIS_TIMEOUT = 0.05
+THROTTLE_LOCAL_MAX_KEYS = 100_000
+# Requests to these URL names count as several requests
+THROTTLE_COSTS = {
+    "social_media:like-unlike-post": 5,
+    "social_media:follow-unfollow-user": 5,
+    "social_media:async-like-unlike-post": 5,
+    "social_media:async-follow-unfollow-user": 5,
+}
+
+# /metrics (social_media.metrics) answers requests from these networks
+# and requests with "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_ALLOWED_NETWORKS = list(filter(None, os.getenv(
+    "METRICS_ALLOWED_NETWORKS", "127.0.0.1/32,::1/128"
+).split(",")))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# The OpenAPI schema is generated once per code version into SCHEMA_DIR
+# (social_media.schema). Set APP_VERSION, e.g. to the git commit, to
+# skip hashing the sources at startup.
+APP_VERSION = os.getenv("APP_VERSION")
+SCHEMA_DIR = Path(os.getenv("SCHEMA_DIR", BASE_DIR / "schema"))
+
+SPECTACULAR_SETTINGS = {
+    "TITLE": "ShareHub API",
+    "DESCRIPTION": "ShareHub API is designed to enable users to share their content, "
+    "engage with others, and discover interesting posts and users within the platform. "
+    "It provides a secure and user-friendly way to interact with the "
+    "ShareHub social media platform programmatically.",
+    "VERSION": "1.0.0",
+    "SERVE_INCLUDE_SCHEMA": False,
+    "SWAGGER_UI_SETTINGS": {
+        "deepLinking": True,
+        "defaultModelRendering": "model",
+        "defaultModelsExpandDepth": 2,
+        "defaultModelExpandDepth": 2,
+    },
+}
+
+SIMPLE_JWT = {
+    "ACCESS_TOKEN_LIFETIME": timedelta(hours=1),
+    "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "SIGNING_KEY": SECRET_KEY,
+    "ROTATE_REFRESH_TOKENS": True,
+    "BLACKLIST_AFTER_ROTATION": True,
+}
+
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND")
+CELERY_TIMEZONE = "Europe/Kyiv"
+CELERY_TASK_TRACK_STARTED = True
+CELERY_TASK_TIME_LIMIT = 30 * 60
+CELERY_BEAT_SCHEDULE = {
+    "rank-explore-feed": {
+        "task": "social_media.tasks.rank_explore_feed",
+        "schedule": 5 * 60,
+    },
+    "relay-outbox": {
+        "task": "social_media.tasks.relay_outbox",
+        "schedule": 2,
+    },
+    "resume-deletions": {
+        "task": "social_media.tasks.resume_deletions",
+        "schedule": 10 * 60,
+    },
+    "maintain-partitions": {
+        "task": "social_media.tasks.maintain_partitions",
+        "schedule": 24 * 60 * 60,
+    },
+    "rebuild-follow-suggestions": {
+        "task": "social_media.tasks.rebuild_follow_suggestions",
+        "schedule": 24 * 60 * 60,
+    },
+    "prune-changes": {
+        "task": "social_media.tasks.prune_changes",
+        "schedule": 24 * 60 * 60,
+    },
+    "expire-personal-exports": {
+        "task": "social_media.tasks.expire_personal_exports",
+        "schedule": 60 * 60,
+    },
+}
+
+# Outbox relay (social_media.outbox), events are coalesced per batch
+OUTBOX_BATCH_SIZE = 1_000
+NOTIFICATIONS_PAGE_SIZE = 50
+
+# Accounts and posts are soft-deleted, then their rows are removed in
+# chunks (social_media.deletion). Jobs without progress for
+# DELETION_STALE_SECONDS are resumed by Celery beat.
+DELETION_CHUNK_SIZE = 1_000
+DELETION_PAUSE_SECONDS = 0.1
+DELETION_STALE_SECONDS = 10 * 60
+
+# Like and comment tables are partitioned by month on Postgres
+# (social_media.partitions). Partitions are created this many months
+# ahead and archived to the private storage after the retention period.
+PARTITIONS_PRECREATE_MONTHS = 3
+PARTITIONS_RETENTION_MONTHS = 24
+# A warning is logged when the indexes of the current month outgrow this
+PARTITIONS_HOT_INDEX_BYTES = 256 * 1024 * 1024
+
+# Delta sync (social_media.sync), GET /api/sync/ returns at most
+# SYNC_PAGE_SIZE changes per page and holds back changes younger than
+# SYNC_SETTLE_SECONDS, whose transactions may still be running
+SYNC_PAGE_SIZE = 500
+SYNC_SETTLE_SECONDS = 5
+# Older changes are pruned, older tokens get 410 and a full download
+SYNC_RETENTION_DAYS = 30
+
+# Admin changelists of posts, comments and likes show the planner's
+# row estimate on Postgres instead of counting above this many rows
+ADMIN_EXACT_COUNT_LIMIT = 10_000
+
+# Explore feed (social_media.explore), posts of the window are ranked by
+# likes + weighted comments halving every EXPLORE_HALF_LIFE_HOURS
+EXPLORE_WINDOW_HOURS = 72
+EXPLORE_HALF_LIFE_HOURS = 12
+EXPLORE_COMMENT_WEIGHT = 2
+EXPLORE_SIZE = 1_000
+EXPLORE_PAGE_SIZE = 20
+
+# Friends of friends stored per user by social_media.suggestions
+SUGGESTIONS_SIZE = 20
+
+# Most user ids accepted by POST /api/users/relationships/
+RELATIONSHIPS_MAX_IDS = 500
+
+# POST /api/batch/, parallel batches run in up to BATCH_MAX_WORKERS
+# threads, each with its own database connection
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+# Most posts accepted by POST /api/posts/bulk/ and scheduled_posts/bulk/
+BULK_POSTS_MAX = 5_000
+
+# In-process hashtag autocomplete (social_media.autocomplete)
+AUTOCOMPLETE_REFRESH_SECONDS = 5
+AUTOCOMPLETE_REBUILD_SECONDS = 10 * 60
+AUTOCOMPLETE_MAX_RESULTS = 20
+
+# Server-sent events (social_media.events), over Redis pub/sub when
+# EVENTS_REDIS_URL is set, otherwise only within the process
+EVENTS_REDIS_URL = REDIS_URL
+# Events kept per channel for clients resuming with Last-Event-ID
+EVENTS_HISTORY_SIZE = 100
+EVENTS_HISTORY_SECONDS = 60 * 60
+# Events buffered per connection, a slower client is disconnected
+EVENTS_QUEUE_SIZE = 100
+EVENTS_HEARTBEAT_SECONDS = 15
+# Streams end after this long, clients reconnect after the retry delay
+EVENTS_MAX_CONNECTION_SECONDS = 5 * 60
+EVENTS_RETRY_MILLISECONDS = 3_000
+# Most posts whose comments one connection can follow
+EVENTS_MAX_POSTS = 20
@@ -0,0 +1,20 @@
+from importlib.util import find_spec
+
+from .base import *  # noqa: F401,F403
+from .base import INSTALLED_APPS, MIDDLEWARE
+
+DEBUG = True
+
+INTERNAL_IPS = [
+    "127.0.0.1",
+]
+
+# Debug-only apps are added when installed, prod never imports them
+if find_spec("debug_toolbar") is not None:
+    INSTALLED_APPS = [*INSTALLED_APPS, "debug_toolbar"]
+    index = MIDDLEWARE.index("django.middleware.security.SecurityMiddleware")
+    MIDDLEWARE = [
+        *MIDDLEWARE[:index + 1],
+        "debug_toolbar.middleware.DebugToolbarMiddleware",
+        *MIDDLEWARE[index + 1:],
+    ]
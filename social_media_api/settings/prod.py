@@ -0,0 +1,22 @@
+import os
+
+from .base import *  # noqa: F401,F403
+from .base import DATABASES
+
+DEBUG = False
+
+ALLOWED_HOSTS = list(
+    filter(None, os.getenv("ALLOWED_HOSTS", "").split(","))
+)
+
+# Connections are reused for CONN_MAX_AGE seconds instead of opened per
+# request, and checked before reuse so that a restarted database costs
+# a reconnect rather than a failed request
+DATABASES = {
+    alias: {
+        **database,
+        "CONN_MAX_AGE": int(os.getenv("CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
+    }
+    for alias, database in DATABASES.items()
+}